@@ -1,9 +1,20 @@
 from celery import Celery
 
+from app.config import (
+    CELERY_BROKER_URL,
+    CELERY_RESULT_BACKEND_URL,
+    CELERY_SERIALIZER,
+    PACKED_COMPRESS_MIN_BYTES,
+    PACKED_MIN_ITEMS,
+)
+from app.serializer import PACKED_SERIALIZER, PackedSerializer
+
+PackedSerializer(PACKED_MIN_ITEMS, PACKED_COMPRESS_MIN_BYTES).register()
+
 app = Celery(
     "arithmetic_system",
-    broker="pyamqp://guest@rabbitmq//",
-    backend="redis://redis:6379/0",
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_RESULT_BACKEND_URL,
     include=[
         "app.workers.add_service",
         "app.workers.sub_service",
@@ -13,16 +24,24 @@ app = Celery(
         "app.workers.xprod_service",
         "app.workers.sub_list_service",
         "app.workers.div_list_service",
+        "app.workers.eval_subtree_service",
+        "app.workers.eval_columns_service",
+        "app.workers.memo_service",
+        "app.workers.dag_node_service",
     ],
 )
 
 app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    task_serializer=CELERY_SERIALIZER,
+    # Both, so that workers and clients can switch one at a time
+    accept_content=[PACKED_SERIALIZER, "json"],
+    result_accept_content=[PACKED_SERIALIZER, "json"],
+    result_serializer=CELERY_SERIALIZER,
     timezone="UTC",
     enable_utc=True,
-    task_track_started=True,
+    # A STARTED write per task would undo most of what skipping
+    # intermediate results saves; nothing reads it
+    task_track_started=False,
     task_time_limit=30 * 60,
     task_soft_time_limit=25 * 60,
     worker_prefetch_multiplier=1,
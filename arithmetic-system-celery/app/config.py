@@ -0,0 +1,99 @@
+CELERY_BROKER_URL = "pyamqp://guest@rabbitmq//"
+CELERY_RESULT_BACKEND_URL = "redis://redis:6379/0"
+RESULT_TIMEOUT_SECONDS = 3.0
+# Task and result messages carry lists of at least PACKED_MIN_ITEMS numbers
+# as typed binary arrays and are compressed from PACKED_COMPRESS_MIN_BYTES
+# (random operands barely compress, so below that it costs more CPU than it
+# saves); see benchmarks/bench_serializer.py. "json" is Celery's default
+CELERY_SERIALIZER = "packed"
+PACKED_MIN_ITEMS = 16
+PACKED_COMPRESS_MIN_BYTES = 1048576
+# Chain links pass their value on in the next message; only chord members
+# and the last task of a workflow write their result to the backend. See
+# benchmarks/bench_result_writes.py
+SKIP_INTERMEDIATE_RESULTS = True
+
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_L1_MAX_SIZE = 10000
+RESULT_CACHE_TTL_SECONDS = 3600.0
+RESULT_CACHE_L2_ENABLED = True
+RESULT_CACHE_L2_MAX_ENTRIES = 100000
+RESULT_CACHE_KEY_PREFIX = "result-cache:"
+
+SUBTREE_MEMO_ENABLED = True
+SUBTREE_MEMO_MIN_OPERATIONS = 16
+SUBTREE_MEMO_MAX_SUBTREES = 8
+
+SINGLE_FLIGHT_ENABLED = True
+SINGLE_FLIGHT_REPLICA_LOCK_ENABLED = False
+SINGLE_FLIGHT_LOCK_TTL_SECONDS = 5.0
+SINGLE_FLIGHT_POLL_INTERVAL_SECONDS = 0.02
+
+COMMON_SUBTREE_ELIMINATION_ENABLED = True
+# Worker time one task message costs. Evaluating repeated subtrees first adds
+# a stage, so it only runs when the tasks it saves outweigh the round trips
+# it adds, at the fusion planner's hop latency
+COMMON_SUBTREE_TASK_COST_SECONDS = 0.001
+
+BATCH_MAX_EXPRESSIONS = 10000
+BATCH_RESULT_TIMEOUT_SECONDS = 30.0
+BATCH_SHARED_SUBTREE_MIN_OPERATIONS = 4
+
+STREAM_MAX_IN_FLIGHT = 256
+
+# Expressions (or batches) from this many characters are parsed and built
+# on a thread, so that compiling them does not hold up the event loop
+COMPILE_IN_THREAD_MIN_CHARS = 8192
+
+WORKFLOW_CACHE_MAX_SIZE = 4096
+WORKFLOW_CACHE_TTL_SECONDS = 300.0
+# Longest workflow description returned to clients; the rest is elided
+WORKFLOW_STRING_MAX_CHARS = 4096
+# Prebuilt workflows per expression shape (the tree with its constants
+# abstracted); later expressions of that shape only substitute constants
+WORKFLOW_TEMPLATE_CACHE_ENABLED = True
+WORKFLOW_TEMPLATE_CACHE_MAX_SIZE = 1024
+# Expressions prepared once and executed with different variable values
+PREPARED_EXPRESSIONS_MAX_SIZE = 4096
+# Columns of variable values are evaluated as whole arrays, in-process up to
+# the local limit and otherwise in chunks spread over the eval workers; see
+# benchmarks/bench_columns.py
+COLUMNS_LOCAL_MAX_ROWS = 100000
+COLUMNS_CHUNK_ROWS = 100000
+
+CONSTANT_FOLDING_ENABLED = True
+CONSTANT_FOLDING_MAX_NODES = 16
+CONSTANT_FOLDING_MAX_DEPTH = 4
+
+# Run expressions as a DAG registered in Redis instead of a Celery canvas:
+# one task per node, and a Lua script counts down each node's inputs, so the
+# worker finishing the last input publishes the node. No chord counters or
+# join polling; needs the Redis result backend and a dag_tasks worker
+DAG_EXECUTOR_ENABLED = False
+DAG_KEY_PREFIX = "dag:"
+# Lifetime of a run's hash, which the root deletes when it completes
+DAG_RUN_TTL_SECONDS = 300
+
+# Evaluate expressions of up to LOCAL_EXECUTION_MAX_OPERATIONS in the API
+# process instead of dispatching them; larger ones still go to the workers.
+# The pool is "thread" or "process"; see benchmarks/bench_local_executor.py
+LOCAL_EXECUTION_ENABLED = False
+LOCAL_EXECUTION_MAX_OPERATIONS = 4096
+LOCAL_EXECUTION_POOL = "thread"
+LOCAL_EXECUTION_MAX_WORKERS = 4
+
+# Re-associate ADD/SUB and MUL/DIV regions for the shallowest workflow. The two
+# settings are exclusive: the rebalancer regroups SUB/DIV chains itself, so
+# the chain rewrite only runs while TREE_REBALANCE_ENABLED is off
+TREE_REBALANCE_ENABLED = True
+# Regroup SUB/DIV chains into one inverse of an aggregated run; ignored while
+# TREE_REBALANCE_ENABLED is on
+CHAIN_REWRITE_ENABLED = True
+
+# Widest chord join or aggregator message for a flattened ADD/MUL chain;
+# see benchmarks/bench_fan_in.py
+FLAT_REDUCTION_MAX_FAN_IN = 1024
+
+FUSION_ENABLED = False
+FUSION_HOP_LATENCY_SECONDS = 0.005
+FUSION_WORKER_CONCURRENCY = 8
@@ -1,7 +1,200 @@
 from pydantic import BaseModel, Field
 
+from app.config import BATCH_MAX_EXPRESSIONS
+
 class CalculateExpressionResponse(BaseModel):
     result: float = Field(..., description="Calculation result")
     workflow: str = Field(
         ..., description="The Celery workflow structure used for the calculation."
     )
+    cached: bool = Field(
+        False, description="Whether the result was served from the result cache."
+    )
+
+
+class BatchCalculateRequest(BaseModel):
+    expressions: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=BATCH_MAX_EXPRESSIONS,
+        description="Arithmetic expressions to evaluate together.",
+    )
+
+
+class PrepareExpressionRequest(BaseModel):
+    expression: str = Field(
+        ..., description="Arithmetic expression that may name variables, e.g. 'x * 2'."
+    )
+
+
+class PreparedExpressionResponse(BaseModel):
+    id: str = Field(..., description="Handle to execute the expression with.")
+    expression: str = Field(..., description="The expression as submitted.")
+    variables: list[str] = Field(
+        ..., description="Variables to give a value on each execution."
+    )
+
+
+class ExecuteExpressionRequest(BaseModel):
+    values: dict[str, int | float] = Field(
+        default_factory=dict, description="Value of every variable, by name."
+    )
+
+
+class EvaluateColumnsRequest(BaseModel):
+    columns: dict[str, list[int | float]] = Field(
+        default_factory=dict,
+        description="Values of every variable, by name; row i uses the i-th values.",
+    )
+
+
+class ColumnError(BaseModel):
+    row: int = Field(..., description="Position of the failed row.")
+    error: str = Field(..., description="Why this row failed.")
+
+
+class EvaluateColumnsResponse(BaseModel):
+    results: list[float | None] = Field(
+        ..., description="One result per row, None where the row failed."
+    )
+    errors: list[ColumnError] = Field(..., description="Failed rows, in row order.")
+    workflow: str = Field(..., description="How the columns were evaluated.")
+
+
+class BatchItemResponse(BaseModel):
+    expression: str = Field(..., description="The expression as submitted.")
+    result: float | None = Field(None, description="Calculation result.")
+    workflow: str | None = Field(
+        None, description="The Celery workflow structure used for this item."
+    )
+    error: str | None = Field(None, description="Why this item failed.")
+
+
+class BatchCalculateResponse(BaseModel):
+    results: list[BatchItemResponse] = Field(
+        ..., description="One entry per submitted expression, in request order."
+    )
+    workflow: str = Field(..., description="How the batch was dispatched.")
+
+
+class StreamItemResponse(BatchItemResponse):
+    index: int = Field(
+        ..., description="Position of the expression among the submitted lines."
+    )
+
+
+class CacheStats(BaseModel):
+    hits: int = Field(..., description="Lookups served from the cache.")
+    misses: int = Field(..., description="Lookups that were not in the cache.")
+    evictions: int = Field(..., description="Entries dropped to respect max_size.")
+    expirations: int = Field(..., description="Entries dropped after their TTL.")
+    size: int = Field(..., description="Entries currently cached.")
+    max_size: int = Field(..., description="Maximum number of cached entries.")
+    ttl_seconds: float | None = Field(None, description="Entry time-to-live.")
+
+
+class TemplateCacheStats(CacheStats):
+    hit_ratio: float = Field(
+        ..., description="Share of built workflows served from a template."
+    )
+
+
+class ResultCacheStats(BaseModel):
+    l1: CacheStats = Field(..., description="In-process result cache.")
+    l2_hits: int = Field(..., description="L1 misses served from Redis.")
+    l2_misses: int = Field(..., description="Lookups that missed both tiers.")
+    l2_errors: int = Field(..., description="Failed Redis lookups and writes.")
+    hit_ratio: float = Field(
+        ..., description="Share of lookups served by either tier."
+    )
+    mean_miss_seconds: float = Field(
+        ..., description="Average time to compute a result on a miss."
+    )
+    saved_seconds: float = Field(
+        ..., description="Estimated worker round-trip time saved by hits."
+    )
+
+
+class SingleFlightStats(BaseModel):
+    executed: int = Field(..., description="Workflows actually dispatched.")
+    coalesced: int = Field(
+        ..., description="Requests that joined an identical in-flight workflow."
+    )
+    replica_coalesced: int = Field(
+        ..., description="Requests answered by another replica's workflow."
+    )
+    in_flight: int = Field(..., description="Distinct workflows currently running.")
+
+
+class FusionStats(BaseModel):
+    hop_latency_seconds: float = Field(
+        ..., description="Calibrated latency of one broker round trip."
+    )
+    op_cost_seconds: float = Field(
+        ..., description="Measured cost of one arithmetic operation in a worker."
+    )
+    worker_concurrency: int = Field(
+        ..., description="Number of workers the fused chunks are spread over."
+    )
+
+
+class SubtreeMemoStats(BaseModel):
+    lookups: int = Field(..., description="Subtrees looked up before dispatch.")
+    hits: int = Field(..., description="Subtrees replaced by a stored value.")
+    hit_ratio: float = Field(..., description="Hits over lookups.")
+
+
+class RebalancerStats(BaseModel):
+    trees: int = Field(..., description="Trees passed through the rebalancer.")
+    rebalanced: int = Field(..., description="Trees that came out shallower.")
+    depth_saved: int = Field(..., description="Sequential hops removed in total.")
+    estimated_seconds_saved: float = Field(
+        ..., description="Hops removed times the configured hop latency."
+    )
+
+
+class DagExecutorStats(BaseModel):
+    runs: int = Field(..., description="Expressions run as a DAG.")
+    tasks: int = Field(..., description="Nodes of those DAGs, one task each.")
+
+
+class LocalExecutorStats(BaseModel):
+    evaluations: int = Field(..., description="Expressions evaluated in-process.")
+    operations: int = Field(..., description="Operations of those expressions.")
+    errors: int = Field(..., description="Evaluations that failed or timed out.")
+    mean_seconds: float = Field(
+        ..., description="Average time to evaluate an expression in-process."
+    )
+
+
+class MetricsResponse(BaseModel):
+    workflow_cache: CacheStats = Field(
+        ..., description="Parsed expression and compiled workflow cache."
+    )
+    result_cache: ResultCacheStats | None = Field(
+        None, description="Final result cache, when enabled."
+    )
+    single_flight: SingleFlightStats | None = Field(
+        None, description="Request coalescing, when enabled."
+    )
+    subtree_memo: SubtreeMemoStats | None = Field(
+        None, description="Cross-request subtree memoization, when enabled."
+    )
+    fusion: FusionStats | None = Field(
+        None, description="Fused subtree planner calibration, when enabled."
+    )
+    rebalancer: RebalancerStats | None = Field(
+        None, description="Tree rebalancing, when enabled."
+    )
+    dag_executor: DagExecutorStats | None = Field(
+        None, description="Expressions run as a Redis DAG, when enabled."
+    )
+    local_executor: LocalExecutorStats | None = Field(
+        None, description="Expressions evaluated in the API process, when enabled."
+    )
+    workflow_templates: TemplateCacheStats | None = Field(
+        None, description="Workflow templates per expression shape, when enabled."
+    )
+    prepared_expressions: CacheStats = Field(
+        ..., description="Prepared expressions kept for execution."
+    )
@@ -0,0 +1,148 @@
+import struct
+import sys
+import zlib
+from array import array
+from itertools import compress
+
+from kombu.serialization import register
+from kombu.utils import json
+
+PACKED_SERIALIZER = "packed"
+PACKED_CONTENT_TYPE = "application/x-arithmetic-packed"
+
+# Stands in for a packed list in the JSON part: [tag, count, offset]
+_PACKED_KEY = "__packed__"
+# Tags: the narrowest array typecode holding all ints, floats, or floats with
+# one int flag byte per element
+_INTS = tuple(
+    (typecode, -(2 ** (bits - 1)), 2 ** (bits - 1) - 1)
+    for typecode, bits in (("b", 8), ("h", 16), ("i", 32), ("q", 64))
+)
+_FLOATS, _MIXED = "d", "m"
+# Largest integer a float64 holds exactly
+_FLOAT_INTS = 2**53
+_PLAIN, _COMPRESSED = b"P", b"Z"
+_HEADER = struct.Struct("<cI")
+
+
+class PackedSerializer:
+    # JSON for the message structure with every long list of plain ints and
+    # floats moved into a typed little-endian buffer behind it; bodies of
+    # compress_min_bytes or more are zlib-compressed when that makes them
+    # smaller. Anything JSON carries
+    # round-trips unchanged, ints stay ints and floats stay floats
+    def __init__(
+        self, min_items: int, compress_min_bytes: int, compress_level: int = 1
+    ):
+        self.min_items = min_items
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+
+    def register(self) -> None:
+        register(
+            PACKED_SERIALIZER,
+            self.dumps,
+            self.loads,
+            content_type=PACKED_CONTENT_TYPE,
+            content_encoding="binary",
+        )
+
+    def dumps(self, payload: object) -> bytes:
+        buffers: list[bytes] = []
+        structure = json.dumps(self._pack(payload, buffers)).encode()
+        body = b"".join((structure, *buffers))
+        if len(body) >= self.compress_min_bytes:
+            compressed = zlib.compress(body, self.compress_level)
+            if len(compressed) < len(body):
+                return _HEADER.pack(_COMPRESSED, len(structure)) + compressed
+        return _HEADER.pack(_PLAIN, len(structure)) + body
+
+    def loads(self, body: bytes | bytearray | memoryview) -> object:
+        kind, length = _HEADER.unpack_from(body)
+        data = memoryview(body)[_HEADER.size :]
+        if kind == _COMPRESSED:
+            data = memoryview(zlib.decompress(data))
+        buffers = data[length:]
+
+        def object_hook(value: dict) -> object:
+            if value.keys() == {_PACKED_KEY}:
+                return _unpack_list(buffers, *value[_PACKED_KEY])
+            return json.object_hook(value)
+
+        return json.loads(bytes(data[:length]), object_hook=object_hook)
+
+    def _pack(self, payload: object, buffers: list[bytes]) -> object:
+        # Copies dicts and sequences (tuples become lists, as in JSON) with
+        # the packable lists replaced by their placeholders
+        offset = 0
+        copied: list = [None]
+        stack: list[tuple] = [(payload, copied, 0)]
+        while stack:
+            source, target, key = stack.pop()
+            if isinstance(source, dict):
+                copy: dict = {}
+                target[key] = copy
+                # Reversed, so that keys are inserted in their original order
+                items = list(source.items())
+                stack.extend((value, copy, name) for name, value in reversed(items))
+            elif isinstance(source, (list, tuple)):
+                packed = (
+                    _pack_list(source) if len(source) >= self.min_items else None
+                )
+                if packed is None:
+                    target[key] = [None] * len(source)
+                    stack.extend(
+                        (value, target[key], index)
+                        for index, value in enumerate(source)
+                    )
+                    continue
+                tag, buffer = packed
+                target[key] = {_PACKED_KEY: [tag, len(source), offset]}
+                buffers.append(buffer)
+                offset += len(buffer)
+            else:
+                target[key] = source
+        return copied[0]
+
+
+def _pack_list(values: list | tuple) -> tuple[str, bytes] | None:
+    # None when the list holds anything but exact ints and floats, or ints a
+    # buffer cannot hold exactly
+    types = set(map(type, values))
+    if types == {int}:
+        low, high = min(values), max(values)
+        for typecode, smallest, largest in _INTS:
+            if smallest <= low and high <= largest:
+                return typecode, _to_bytes(array(typecode, values))
+        return None
+    if types == {float}:
+        return _FLOATS, _to_bytes(array(_FLOATS, values))
+    if types != {int, float}:
+        return None
+
+    flags = bytes(type(value) is int for value in values)
+    if any(abs(value) > _FLOAT_INTS for value in compress(values, flags)):
+        return None
+    return _MIXED, _to_bytes(array(_FLOATS, values)) + flags
+
+
+def _unpack_list(
+    buffers: memoryview, tag: str, count: int, offset: int
+) -> list[int | float]:
+    typecode = _FLOATS if tag == _MIXED else tag
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(buffers[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    values = values.tolist()
+    if tag == _MIXED:
+        for index in compress(range(count), buffers[end : end + count]):
+            values[index] = int(values[index])
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
@@ -0,0 +1,142 @@
+import logging
+from dataclasses import dataclass
+
+from .expression_parser import ExpressionNode
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SharedSubtree:
+    key: str
+    node: ExpressionNode
+
+
+class BatchPlanner:
+    def __init__(self, builder, min_operations: int):
+        self.builder = builder
+        self.min_operations = min_operations
+
+    def shared_subtrees(
+        self, trees: list[ExpressionNode | float | int]
+    ) -> list[SharedSubtree]:
+        # Subtrees that occur more than once across the batch and are large
+        # enough to be worth an extra stage; only the outermost are kept
+        roots = [tree for tree in trees if isinstance(tree, ExpressionNode)]
+        digests_per_tree = [self.builder.subtree_digests(tree) for tree in roots]
+
+        # Count references rather than nodes: the parser hands out DAGs in
+        # which a repeated subexpression is one node with several parents
+        occurrences: dict[str, int] = {}
+        for tree, digests in zip(roots, digests_per_tree):
+            seen: set[int] = set()
+            stack = [tree]
+            while stack:
+                current = stack.pop()
+                key = digests.get(id(current))
+                if key is not None:
+                    occurrences[key] = occurrences.get(key, 0) + 1
+                if id(current) in seen:
+                    continue
+                seen.add(id(current))
+                stack.extend(
+                    child
+                    for child in (current.left, current.right)
+                    if isinstance(child, ExpressionNode)
+                )
+
+        shared: dict[str, SharedSubtree] = {}
+        for tree, digests in zip(roots, digests_per_tree):
+            sizes = self.operation_counts(tree)
+            seen = set()
+            stack = [tree]
+            while stack:
+                current = stack.pop()
+                if id(current) in seen:
+                    continue
+                seen.add(id(current))
+                key = digests.get(id(current))
+                if (
+                    key is not None
+                    and occurrences[key] > 1
+                    and sizes[id(current)] >= self.min_operations
+                ):
+                    shared.setdefault(key, SharedSubtree(key, current))
+                    continue
+                stack.extend(
+                    child
+                    for child in (current.left, current.right)
+                    if isinstance(child, ExpressionNode)
+                )
+
+        if shared:
+            logger.info(f"Batch shares {len(shared)} subtrees")
+        return list(shared.values())
+
+    def substitute(
+        self,
+        tree: ExpressionNode | float | int,
+        values: dict[str, float | int | Exception],
+    ) -> tuple[ExpressionNode | float | int, list[str]]:
+        # Replaces shared subtrees with their stage-one values without
+        # mutating the (cached) input tree; a failed value fails the tree
+        if not isinstance(tree, ExpressionNode) or not values:
+            return tree, []
+
+        digests = self.builder.subtree_digests(tree)
+        used: list[str] = []
+        rebuilt: dict[int, ExpressionNode | float | int] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(tree, False)]
+
+        while stack:
+            current, children_done = stack.pop()
+            if id(current) in rebuilt:
+                continue
+            key = digests.get(id(current))
+            if key in values:
+                value = values[key]
+                if isinstance(value, Exception):
+                    raise value
+                used.append(key)
+                rebuilt[id(current)] = value
+                continue
+
+            children = [
+                child
+                for child in (current.left, current.right)
+                if isinstance(child, ExpressionNode)
+            ]
+            if not children_done and children:
+                stack.append((current, True))
+                stack.extend((child, False) for child in children)
+                continue
+
+            left = rebuilt.get(id(current.left), current.left)
+            right = rebuilt.get(id(current.right), current.right)
+            if left is current.left and right is current.right:
+                rebuilt[id(current)] = current
+            else:
+                rebuilt[id(current)] = ExpressionNode(
+                    operation=current.operation, left=left, right=right
+                )
+
+        return rebuilt[id(tree)], list(dict.fromkeys(used))
+
+    def operation_counts(self, tree: ExpressionNode) -> dict[int, int]:
+        counts: dict[int, int] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(tree, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if id(current) in counts:
+                continue
+            children = [
+                child
+                for child in (current.left, current.right)
+                if isinstance(child, ExpressionNode)
+            ]
+            if not children_done and children:
+                stack.append((current, True))
+                stack.extend((child, False) for child in children)
+                continue
+            counts[id(current)] = 1 + sum(counts[id(child)] for child in children)
+        return counts
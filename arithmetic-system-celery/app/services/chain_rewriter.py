@@ -0,0 +1,191 @@
+import logging
+import math
+import sys
+
+from .expression_parser import ExpressionNode, OperationEnum, Variable
+
+logger = logging.getLogger(__name__)
+
+# Constant terms of an ADD/SUB run are not moved when their sum is a smaller
+# fraction than this of their magnitudes, where regrouping could lose most of
+# the significant digits
+_MAX_CANCELLATION = 2**26
+
+# (operation, inverse) of each family whose left-deep chains can be regrouped:
+# a - b + c - d == (a + c) - (b + d) and a / b * c / d == (a * c) / (b * d)
+_FAMILIES = {
+    OperationEnum.ADD: (OperationEnum.ADD, OperationEnum.SUB),
+    OperationEnum.SUB: (OperationEnum.ADD, OperationEnum.SUB),
+    OperationEnum.MUL: (OperationEnum.MUL, OperationEnum.DIV),
+    OperationEnum.DIV: (OperationEnum.MUL, OperationEnum.DIV),
+}
+
+
+class ChainRewriter:
+    # Left-deep SUB/DIV chains are one hop per operand; regrouped, the
+    # subtrahends (divisors) become one commutative ADD (MUL) run that the
+    # builder turns into a single parallel aggregation
+    def __init__(self, min_inverse_operations: int = 2):
+        self.min_inverse_operations = min_inverse_operations
+
+    def rewrite(
+        self, node: ExpressionNode | int | float
+    ) -> ExpressionNode | int | float:
+        # Subtrees that need no rewriting are returned as the same objects
+        if not isinstance(node, ExpressionNode):
+            return node
+
+        rewritten: dict[int, ExpressionNode | int | float] = {}
+        chains = 0
+        stack: list[tuple[ExpressionNode, list | None]] = [(node, None)]
+
+        while stack:
+            current, terms = stack.pop()
+            if id(current) in rewritten:
+                continue
+            if terms is None:
+                terms = self._spine(current)
+                stack.append((current, terms))
+                stack.extend(
+                    (operand, None)
+                    for _, operand in terms
+                    if isinstance(operand, ExpressionNode)
+                    and id(operand) not in rewritten
+                )
+                continue
+
+            operands = [
+                (operation, rewritten.get(id(operand), operand))
+                for operation, operand in terms
+            ]
+            if len(operands) > 2 and self._regroupable(current.operation, operands):
+                rewritten[id(current)] = self._regroup(current.operation, operands)
+                chains += 1
+            elif all(new is old for (_, new), (_, old) in zip(operands, terms)):
+                rewritten[id(current)] = current
+            else:
+                rewritten[id(current)] = self._stepwise(operands)
+
+        if chains:
+            logger.info(f"Regrouped {chains} SUB/DIV chains")
+        return rewritten[id(node)]
+
+    def _spine(
+        self, node: ExpressionNode
+    ) -> list[tuple[OperationEnum | None, ExpressionNode | int | float]]:
+        # [(None, head), (op, operand), ...] for a regroupable left-deep chain,
+        # otherwise just the two children
+        children = [(None, node.left), (node.operation, node.right)]
+        forward, inverse = _FAMILIES[node.operation]
+
+        terms = []
+        current = node
+        while (
+            isinstance(current, ExpressionNode)
+            and current.operation in (forward, inverse)
+        ):
+            terms.append((current.operation, current.right))
+            current = current.left
+        terms.append((None, current))
+        terms.reverse()
+
+        inverses = sum(1 for operation, _ in terms if operation == inverse)
+        if inverses < self.min_inverse_operations:
+            return children
+        return terms
+
+    @staticmethod
+    def _regroupable(
+        operation: OperationEnum,
+        terms: list[tuple[OperationEnum | None, ExpressionNode | int | float]],
+    ) -> bool:
+        if _FAMILIES[operation][0] == OperationEnum.ADD:
+            return terms_regroupable(
+                [operand for op, operand in terms if op != OperationEnum.SUB],
+                [operand for op, operand in terms if op == OperationEnum.SUB],
+            )
+        return factors_regroupable(
+            terms[0][1],
+            [operand for op, operand in terms[1:] if op == OperationEnum.MUL],
+            [operand for op, operand in terms if op == OperationEnum.DIV],
+        )
+
+    def _regroup(
+        self,
+        operation: OperationEnum,
+        terms: list[tuple[OperationEnum | None, ExpressionNode | int | float]],
+    ) -> ExpressionNode:
+        forward, inverse = _FAMILIES[operation]
+        kept = [operand for op, operand in terms if op != inverse]
+        inverted = [operand for op, operand in terms if op == inverse]
+        return ExpressionNode(
+            operation=inverse,
+            left=self._left_deep(forward, kept),
+            right=self._left_deep(forward, inverted),
+        )
+
+    @staticmethod
+    def _stepwise(
+        terms: list[tuple[OperationEnum | None, ExpressionNode | int | float]],
+    ) -> ExpressionNode:
+        result = terms[0][1]
+        for operation, operand in terms[1:]:
+            result = ExpressionNode(operation=operation, left=result, right=operand)
+        return result
+
+    @staticmethod
+    def _left_deep(
+        operation: OperationEnum, operands: list[ExpressionNode | int | float]
+    ) -> ExpressionNode | int | float:
+        result = operands[0]
+        for operand in operands[1:]:
+            result = ExpressionNode(operation=operation, left=result, right=operand)
+        return result
+
+
+def terms_regroupable(
+    addends: list[ExpressionNode | int | float],
+    subtrahends: list[ExpressionNode | int | float],
+) -> bool:
+    # (a + c) - (b + d) rounds differently from a - b + c - d: a partial sum
+    # can overflow where the stepwise one does not, and terms that cancel
+    # leave only the rounding error. The constant terms of an ADD/SUB run are
+    # only moved when no sum of them overflows and, unless they are all ints,
+    # which add up exactly, they do not cancel
+    constants = [
+        operand
+        for operand in addends
+        if not isinstance(operand, (ExpressionNode, Variable))
+    ] + [
+        -operand
+        for operand in subtrahends
+        if not isinstance(operand, (ExpressionNode, Variable))
+    ]
+    magnitude = sum(abs(constant) for constant in constants)
+    if not _finite(magnitude):
+        return False
+    if all(isinstance(constant, int) for constant in constants):
+        return True
+    return magnitude <= _MAX_CANCELLATION * abs(math.fsum(constants))
+
+
+def factors_regroupable(
+    head: ExpressionNode | int | float,
+    multipliers: list[ExpressionNode | int | float],
+    divisors: list[ExpressionNode | int | float],
+) -> bool:
+    # a / (b * c) raises where b * c underflows to zero and changes value
+    # where it overflows, while a / b / c does neither; the factors of a
+    # MUL/DIV run are only moved when the multipliers and divisors are known
+    # and their products stay finite, and nonzero for the divisors
+    if any(isinstance(o, (ExpressionNode, Variable)) for o in multipliers + divisors):
+        return False
+    if not isinstance(head, (ExpressionNode, Variable)):
+        multipliers = [head, *multipliers]
+    divisor = math.prod(divisors)
+    return divisor != 0 and _finite(divisor) and _finite(math.prod(multipliers))
+
+
+def _finite(value: int | float) -> bool:
+    # Also false for ints too large to become a float operand
+    return abs(value) <= sys.float_info.max
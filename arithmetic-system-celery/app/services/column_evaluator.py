@@ -0,0 +1,96 @@
+import numpy as np
+
+from .evaluator import PROGRAM_INPUT_PREFIX, PROGRAM_OPERATORS, apply_operation
+from .expression_parser import ExpressionNode, Variable
+
+# A column program operand that is the result of an earlier step
+STEP_PREFIX = "%"
+
+_SYMBOLS = {operation: symbol for symbol, operation in PROGRAM_OPERATORS.items()}
+_UFUNCS = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+
+ColumnOperand = int | float | str
+
+
+def compile_columns(
+    node: ExpressionNode | Variable | int | float,
+) -> tuple[list[list[ColumnOperand]], ColumnOperand]:
+    # Steps [symbol, left, right] in the order evaluate() applies them, and the
+    # operand holding the result. Operands are constants, "$<i>" for the
+    # column of the i-th variable or "%<k>" for the result of step k; subtrees
+    # without variables are folded and a shared subtree is a single step
+    steps: list[list[ColumnOperand]] = []
+    operands: dict[int, ColumnOperand] = {}
+    stack: list[tuple[ExpressionNode | Variable | int | float, bool]] = [
+        (node, False)
+    ]
+
+    while stack:
+        current, children_done = stack.pop()
+        if id(current) in operands:
+            continue
+        if isinstance(current, Variable):
+            operands[id(current)] = f"{PROGRAM_INPUT_PREFIX}{int(current)}"
+            continue
+        if not isinstance(current, ExpressionNode):
+            operands[id(current)] = current
+            continue
+        if not children_done:
+            stack.append((current, True))
+            stack.extend(
+                (child, False)
+                for child in (current.right, current.left)
+                if id(child) not in operands
+            )
+            continue
+
+        left, right = operands[id(current.left)], operands[id(current.right)]
+        if isinstance(left, str) or isinstance(right, str):
+            steps.append([_SYMBOLS[current.operation], left, right])
+            operands[id(current)] = f"{STEP_PREFIX}{len(steps) - 1}"
+        else:
+            operands[id(current)] = apply_operation(current.operation, left, right)
+
+    return steps, operands[id(node)]
+
+
+def evaluate_columns(
+    steps: list[list[ColumnOperand]],
+    result: ColumnOperand,
+    columns: list[list[int | float]],
+    rows: int,
+) -> tuple[list[float | None], list[tuple[int, str]]]:
+    # One ufunc call over whole columns per step. A row whose divisor is zero
+    # gets divide_task's error for the first such division, in evaluation
+    # order, and a None result
+    inputs = [np.asarray(column, dtype=np.float64) for column in columns]
+    values: list[np.ndarray | int | float] = []
+    failed = np.zeros(rows, dtype=bool)
+    errors: dict[int, str] = {}
+
+    def operand(token: ColumnOperand) -> np.ndarray | int | float:
+        if not isinstance(token, str):
+            return token
+        if token.startswith(PROGRAM_INPUT_PREFIX):
+            return inputs[int(token[1:])]
+        return values[int(token[1:])]
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for symbol, left, right in steps:
+            left, right = operand(left), operand(right)
+            if symbol == "/":
+                zero = np.broadcast_to(np.equal(right, 0), rows) & ~failed
+                failing = np.flatnonzero(zero).tolist()
+                # A constant dividend is reported as written
+                dividends = (
+                    left[failing].tolist() if np.ndim(left) else [left] * len(failing)
+                )
+                for row, dividend in zip(failing, dividends):
+                    errors[row] = f"Cannot divide {dividend} by zero."
+                failed |= zero
+            values.append(_UFUNCS[symbol](left, right))
+
+    results = np.broadcast_to(operand(result), rows).astype(np.float64).tolist()
+    for row in errors:
+        results[row] = None
+    return results, sorted(errors.items())
@@ -0,0 +1,153 @@
+import logging
+from dataclasses import dataclass
+
+from .evaluator import apply_operation, evaluate
+from .expression_parser import ExpressionNode, Variable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FoldedSubtree:
+    expression: str
+    value: int | float
+
+    def __str__(self) -> str:
+        return f"{self.expression} = {self.value}"
+
+
+class ConstantFolder:
+    def __init__(self, max_nodes: int, max_depth: int):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+
+    def fold(
+        self, node: ExpressionNode | int | float
+    ) -> tuple[ExpressionNode | int | float, list[FoldedSubtree]]:
+        if not isinstance(node, ExpressionNode):
+            return node, []
+
+        folded: list[FoldedSubtree] = []
+        # id(rewritten node) -> folded value; a cheap subtree shared by several
+        # parents is evaluated and reported once
+        values: dict[int, int | float] = {}
+        # id(node) -> (node count, depth, rewritten node)
+        costs: dict[int, tuple[int, int, ExpressionNode | int | float]] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+
+        while stack:
+            current, children_done = stack.pop()
+            if not children_done:
+                stack.append((current, True))
+                for child in (current.right, current.left):
+                    if isinstance(child, ExpressionNode) and id(child) not in costs:
+                        stack.append((child, False))
+                continue
+
+            left_count, left_depth, left = self._cost(current.left, costs)
+            right_count, right_depth, right = self._cost(current.right, costs)
+            count = left_count + right_count + 1
+            depth = max(left_depth, right_depth) + 1
+
+            if self._is_cheap(count, depth):
+                # Fold later as part of the largest cheap subtree
+                costs[id(current)] = (count, depth, self._rebuild(current, left, right))
+                continue
+
+            # Too expensive: its cheap children are the maximal foldable subtrees
+            left = self._fold_if_cheap(left, left_count, left_depth, folded, values)
+            right = self._fold_if_cheap(
+                right, right_count, right_depth, folded, values
+            )
+            if (
+                self._is_constant(left)
+                and self._is_constant(right)
+                and count <= self.max_nodes
+            ):
+                # Only too deep, and both sides are values now: one more
+                # operation here beats dispatching it. The count still adds
+                # up, so folding stops where the subtree gets large
+                value = apply_operation(current.operation, left, right)
+                folded.append(
+                    FoldedSubtree(self._rebuild(current, left, right).to_infix(), value)
+                )
+                costs[id(current)] = (count, 0, value)
+                continue
+            costs[id(current)] = (count, depth, self._rebuild(current, left, right))
+
+        count, depth, result = costs[id(node)]
+        result = self._fold_if_cheap(result, count, depth, folded, values)
+
+        if folded:
+            logger.info(f"Folded {len(folded)} subtrees in-process")
+        return result, folded
+
+    def folds_whole(self, node: ExpressionNode | int | float) -> bool:
+        # Whether fold() evaluates the whole tree once its variables are bound
+        if not isinstance(node, ExpressionNode):
+            return True
+        # id(node) -> (node count, depth)
+        costs: dict[int, tuple[int, int]] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if not children_done:
+                stack.append((current, True))
+                for child in (current.right, current.left):
+                    if isinstance(child, ExpressionNode) and id(child) not in costs:
+                        stack.append((child, False))
+                continue
+            left_count, left_depth = costs.get(id(current.left), (0, 0))
+            right_count, right_depth = costs.get(id(current.right), (0, 0))
+            costs[id(current)] = (
+                left_count + right_count + 1,
+                max(left_depth, right_depth) + 1,
+            )
+        return self._is_cheap(*costs[id(node)])
+
+    @staticmethod
+    def _is_constant(operand: ExpressionNode | int | float) -> bool:
+        return not isinstance(operand, (ExpressionNode, Variable))
+
+    @staticmethod
+    def _rebuild(
+        node: ExpressionNode,
+        left: ExpressionNode | int | float,
+        right: ExpressionNode | int | float,
+    ) -> ExpressionNode:
+        if left is node.left and right is node.right:
+            return node
+        return ExpressionNode(operation=node.operation, left=left, right=right)
+
+    def _is_cheap(self, count: int, depth: int) -> bool:
+        return count <= self.max_nodes and depth <= self.max_depth
+
+    def _cost(
+        self,
+        child: ExpressionNode | int | float,
+        costs: dict[int, tuple[int, int, ExpressionNode | int | float]],
+    ) -> tuple[int, int, ExpressionNode | int | float]:
+        if isinstance(child, ExpressionNode):
+            return costs[id(child)]
+        if isinstance(child, Variable):
+            # Only known when executed, so nothing above it is folded
+            return self.max_nodes + 1, 0, child
+        return 0, 0, child
+
+    def _fold_if_cheap(
+        self,
+        node: ExpressionNode | int | float,
+        count: int,
+        depth: int,
+        folded: list[FoldedSubtree],
+        values: dict[int, int | float],
+    ) -> ExpressionNode | int | float:
+        if not isinstance(node, ExpressionNode) or not self._is_cheap(count, depth):
+            return node
+        if id(node) in values:
+            return values[id(node)]
+
+        value = evaluate(node)
+        folded.append(FoldedSubtree(node.to_infix(), value))
+        values[id(node)] = value
+        return value
@@ -0,0 +1,148 @@
+import json
+from dataclasses import dataclass
+
+from .evaluator import PROGRAM_OPERATORS
+from .expression_parser import ExpressionNode, OperationEnum
+
+# A DAG node operand that is the value of another node
+NODE_PREFIX = "%"
+
+_SYMBOLS = {operation: symbol for symbol, operation in PROGRAM_OPERATORS.items()}
+
+# Runs when a node completes. KEYS[1] is the run's hash; ARGV is the node's
+# index, its JSON value and the index of its parent once per use. Stores the
+# value and counts down each parent; a parent reaching zero is returned as
+# {index, spec, values of its node operands in order}. Once the run failed
+# nothing is stored or returned, so the run stops where it is
+DAG_COMPLETE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'failed') == 1 then
+    return {}
+end
+redis.call('HSET', KEYS[1], 'value:' .. ARGV[1], ARGV[2])
+local ready = {}
+for i = 3, #ARGV do
+    if redis.call('HINCRBY', KEYS[1], 'pending:' .. ARGV[i], -1) == 0 then
+        local node = {ARGV[i], redis.call('HGET', KEYS[1], 'node:' .. ARGV[i])}
+        local children = redis.call('HGET', KEYS[1], 'children:' .. ARGV[i])
+        for child in string.gmatch(children, '%d+') do
+            table.insert(node, redis.call('HGET', KEYS[1], 'value:' .. child))
+        end
+        table.insert(ready, node)
+    end
+end
+return ready
+"""
+
+
+@dataclass(frozen=True)
+class DagNode:
+    symbol: str
+    # Constants, or "%<k>" for the value of node k
+    operands: list[int | float | str]
+    # Index of the node consuming this one's value, once per use; empty for
+    # the root
+    parents: list[int]
+
+    @property
+    def children(self) -> list[int]:
+        return [
+            int(operand[1:]) for operand in self.operands if isinstance(operand, str)
+        ]
+
+
+def compile_dag(
+    node: ExpressionNode, max_fan_in: int | None = None
+) -> list[DagNode]:
+    # One node per task, children before their parents and the root last. A
+    # run of + or * is one node over all its operands (at most max_fan_in,
+    # beyond that a tree of them), and equal subtrees are one node with a
+    # parent entry per use
+    nodes: list[DagNode] = []
+    operands_of: dict[int, int | float | str] = {}
+    # (symbol, operands) -> operand of the node computing it
+    existing: dict[tuple, str] = {}
+
+    def add(symbol: str, operands: list[int | float | str]) -> str:
+        # repr keeps 1, 1.0 and -0.0 apart
+        key = (symbol, *(o if isinstance(o, str) else repr(o) for o in operands))
+        if key not in existing:
+            nodes.append(DagNode(symbol, operands, []))
+            existing[key] = f"{NODE_PREFIX}{len(nodes) - 1}"
+            for child in nodes[-1].children:
+                nodes[child].parents.append(len(nodes) - 1)
+        return existing[key]
+
+    stack: list[tuple[ExpressionNode, list | None]] = [(node, None)]
+    while stack:
+        current, children = stack.pop()
+        if id(current) in operands_of:
+            continue
+        if children is None:
+            if current.operation.is_commutative:
+                children = _flatten(current, current.operation)
+            else:
+                children = [current.left, current.right]
+            stack.append((current, children))
+            stack.extend(
+                (child, None)
+                for child in reversed(children)
+                if isinstance(child, ExpressionNode) and id(child) not in operands_of
+            )
+            continue
+
+        symbol = _SYMBOLS[current.operation]
+        operands = [
+            operands_of[id(child)] if isinstance(child, ExpressionNode) else child
+            for child in children
+        ]
+        if max_fan_in is not None and max_fan_in >= 2:
+            while len(operands) > max_fan_in:
+                operands = [
+                    add(symbol, chunk) if len(chunk) > 1 else chunk[0]
+                    for chunk in (
+                        operands[start : start + max_fan_in]
+                        for start in range(0, len(operands), max_fan_in)
+                    )
+                ]
+        operands_of[id(current)] = add(symbol, operands)
+
+    return nodes
+
+
+def dag_fields(nodes: list[DagNode]) -> dict[str, str | int]:
+    # The run's hash as registered: for every node waiting on others, its
+    # spec, its node operands and how many of their values are outstanding
+    fields: dict[str, str | int] = {}
+    for index, node in enumerate(nodes):
+        children = node.children
+        if children:
+            fields[f"node:{index}"] = _spec(node)
+            fields[f"children:{index}"] = " ".join(map(str, children))
+            fields[f"pending:{index}"] = len(children)
+    return fields
+
+
+def dag_to_string(nodes: list[DagNode]) -> str:
+    levels: list[int] = []
+    for node in nodes:
+        levels.append(1 + max((levels[child] for child in node.children), default=0))
+    return f"dag({len(nodes)} tasks, {levels[-1]} levels)"
+
+
+def _spec(node: DagNode) -> str:
+    return json.dumps([node.symbol, node.operands, node.parents])
+
+
+def _flatten(
+    node: ExpressionNode, operation: OperationEnum
+) -> list[ExpressionNode | int | float]:
+    # Operands of the run of one operation rooted at node, left to right
+    operands: list[ExpressionNode | int | float] = []
+    stack: list[ExpressionNode | int | float] = [node]
+    while stack:
+        current = stack.pop()
+        if not isinstance(current, ExpressionNode) or current.operation != operation:
+            operands.append(current)
+            continue
+        stack.extend((current.right, current.left))
+    return operands
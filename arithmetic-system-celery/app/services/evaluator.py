@@ -0,0 +1,108 @@
+from .expression_parser import CompactExpression, ExpressionNode, OperationEnum
+
+
+def apply_operation(
+    operation: OperationEnum, left: int | float, right: int | float
+) -> int | float:
+    if operation == OperationEnum.ADD:
+        return left + right
+    if operation == OperationEnum.SUB:
+        return left - right
+    if operation == OperationEnum.MUL:
+        return left * right
+    if operation == OperationEnum.DIV:
+        if right == 0:
+            raise ZeroDivisionError(f"Cannot divide {left} by zero.")
+        return left / right
+    raise ValueError(f"Unsupported operation: {operation}")
+
+
+def evaluate(node: ExpressionNode | int | float) -> int | float:
+    # Same arithmetic as the worker tasks, evaluated in-process without
+    # recursion so that subtrees of any depth can be folded
+    if not isinstance(node, ExpressionNode):
+        return node
+
+    values: dict[int, int | float] = {}
+    stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+
+    while stack:
+        current, children_done = stack.pop()
+        if not children_done:
+            stack.append((current, True))
+            for child in (current.right, current.left):
+                if isinstance(child, ExpressionNode) and id(child) not in values:
+                    stack.append((child, False))
+            continue
+
+        left, right = (
+            values[id(child)] if isinstance(child, ExpressionNode) else child
+            for child in (current.left, current.right)
+        )
+        values[id(current)] = apply_operation(current.operation, left, right)
+
+    return values[id(node)]
+
+
+def evaluate_compact(expression: CompactExpression) -> int | float:
+    # Children precede their parent, so one pass over the slots suffices
+    values: list[int | float] = []
+    for index in range(len(expression)):
+        operation = expression.operation(index)
+        if operation is None:
+            values.append(expression.constant(index))
+        else:
+            values.append(
+                apply_operation(
+                    operation,
+                    values[expression.left[index]],
+                    values[expression.right[index]],
+                )
+            )
+    return values[expression.root]
+
+
+PROGRAM_OPERATORS = {
+    "+": OperationEnum.ADD,
+    "-": OperationEnum.SUB,
+    "*": OperationEnum.MUL,
+    "/": OperationEnum.DIV,
+}
+PROGRAM_INPUT_PREFIX = "$"
+
+
+def evaluate_program(
+    program: list[int | float | str], inputs: list[int | float]
+) -> int | float:
+    # Postfix program: numbers are constants, "+-*/" pop two operands and
+    # "$<i>" pushes the i-th input (the result of an upstream workflow)
+    stack: list[int | float] = []
+    for token in program:
+        if not isinstance(token, str):
+            stack.append(token)
+        elif token.startswith(PROGRAM_INPUT_PREFIX):
+            stack.append(inputs[int(token[1:])])
+        else:
+            right = stack.pop()
+            left = stack.pop()
+            stack.append(apply_operation(PROGRAM_OPERATORS[token], left, right))
+
+    if len(stack) != 1:
+        raise ValueError(f"Malformed program leaves {len(stack)} values on the stack")
+    return stack[0]
+
+
+def program_to_infix(program: list[int | float | str]) -> str:
+    # (text, is_compound) pairs, rendered like ExpressionNode.to_infix
+    rendered: list[tuple[str, bool]] = []
+    for token in program:
+        if isinstance(token, str) and token in PROGRAM_OPERATORS:
+            right, right_compound = rendered.pop()
+            left, left_compound = rendered.pop()
+            left = f"({left})" if left_compound else left
+            right = f"({right})" if right_compound else right
+            rendered.append((f"{left} {token} {right}", True))
+        else:
+            rendered.append((str(token), False))
+
+    return rendered[-1][0]
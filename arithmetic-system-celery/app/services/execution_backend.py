@@ -0,0 +1,117 @@
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Protocol
+
+from celery.canvas import Signature
+
+from .batch_planner import SharedSubtree
+from .dag_executor import DagExecutor
+from .dag_planner import DagNode
+from .expression_parser import ExpressionNode
+from .fusion_planner import FusionPlanner
+from .local_executor import LocalExecutor
+from .result_waiter import ResultWaiter
+from .workflow_builder import WorkflowBuilder
+from .workflow_template import PreparedWorkflow
+
+
+class ExecutionBackend(Protocol):
+    # Runs a compiled expression; the result and the workflow string of what
+    # actually ran
+    async def run(
+        self, compiled: "CompiledWorkflow", timeout: float
+    ) -> tuple[int | float, str]: ...
+
+
+@dataclass(frozen=True)
+class CompiledWorkflow:
+    expression_tree: ExpressionNode | float | int
+    workflow: Signature | float | int
+    workflow_string: str
+    hops: int
+    canonical_key: str
+    memo_subtrees: dict[str, ExpressionNode]
+    # Subtrees occurring more than once, evaluated once before the rest
+    shared_subtrees: list[SharedSubtree]
+    shared_workflows: list[Signature]
+    # The rest, built once with the subtrees' values as its variables; None
+    # when the folder evaluates it whole once the values are in
+    shared_stage_two: PreparedWorkflow | None
+    # Chosen at compile time: the Celery canvas, the DAG executor or the API
+    # process
+    backend: ExecutionBackend
+
+
+class CeleryBackend:
+    # Dispatches the workflow, after a first stage for the repeated subtrees
+    # when there are any
+    def __init__(
+        self,
+        builder: WorkflowBuilder,
+        result_waiter: ResultWaiter,
+        planner: FusionPlanner | None,
+        eliminate_common_subtrees: Callable[
+            [CompiledWorkflow], Awaitable[tuple[Signature | float | int, str]]
+        ],
+    ):
+        self.builder = builder
+        self.result_waiter = result_waiter
+        self.planner = planner
+        self.eliminate_common_subtrees = eliminate_common_subtrees
+
+    async def run(
+        self, compiled: CompiledWorkflow, timeout: float
+    ) -> tuple[int | float, str]:
+        started = time.perf_counter()
+        workflow, workflow_string = compiled.workflow, compiled.workflow_string
+        if compiled.shared_subtrees:
+            workflow, workflow_string = await self.eliminate_common_subtrees(
+                compiled
+            )
+        elif isinstance(workflow, Signature):
+            # The cached template is shared between requests; dispatch a copy
+            workflow = workflow.clone()
+        result = await self.result_waiter.wait(
+            self.builder.dispatch(workflow), timeout
+        )
+        # Two stages do not match the hop count of the workflow
+        if self.planner is not None and not compiled.shared_subtrees:
+            self.planner.record_workflow_latency(
+                time.perf_counter() - started, compiled.hops
+            )
+        return result, workflow_string
+
+
+class DagBackend:
+    # The DAG compiled from the expression's tree, run by the DAG executor
+    def __init__(
+        self, executor: DagExecutor, result_waiter: ResultWaiter, nodes: list[DagNode]
+    ):
+        self.executor = executor
+        self.result_waiter = result_waiter
+        self.nodes = nodes
+
+    async def run(
+        self, compiled: CompiledWorkflow, timeout: float
+    ) -> tuple[int | float, str]:
+        result = await self.result_waiter.wait(
+            await self.executor.start(self.nodes), timeout
+        )
+        return result, compiled.workflow_string
+
+
+class LocalBackend:
+    # Evaluates the tree in the API process; operations is its size, for the
+    # executor's stats
+    def __init__(self, executor: LocalExecutor, operations: int):
+        self.executor = executor
+        self.operations = operations
+
+    async def run(
+        self, compiled: CompiledWorkflow, timeout: float
+    ) -> tuple[int | float, str]:
+        result = await self.executor.evaluate(
+            compiled.expression_tree, self.operations, timeout
+        )
+        return result, compiled.workflow_string
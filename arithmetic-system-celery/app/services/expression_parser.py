@@ -1,13 +1,15 @@
 from __future__ import annotations
+import math
 import re
-import ast
 import logging
+from array import array
+from collections.abc import Callable
 from dataclasses import dataclass
 from enum import Enum, auto
+from functools import partial
 from app.types.errors import (
     ExpressionSyntaxError,
     UnsupportedOperatorError,
-    UnsupportedNodeError,
     UnsupportedUnaryOperatorError,
 )
 
@@ -15,6 +17,8 @@ logger = logging.getLogger(__name__)
 
 REGEX_SPACES = re.compile(r"\s+")
 REGEX_VALID_CHARACTERS = re.compile(r"^[0-9+\-*/().%\s]+$")
+# Prepared expressions may also name variables
+REGEX_VALID_PREPARED_CHARACTERS = re.compile(r"^[0-9A-Za-z_+\-*/().%\s]+$")
 
 
 class OperationEnum(Enum):
@@ -28,7 +32,20 @@ class OperationEnum(Enum):
         return self in {OperationEnum.ADD, OperationEnum.MUL}
 
 
-@dataclass
+class Variable(int):
+    # A named operand of a prepared expression, bound on each execution. An
+    # int (its position among the expression's variables), so it passes
+    # through the tree like any leaf; the constant folder leaves it alone
+    def __new__(cls, index: int, name: str) -> Variable:
+        variable = super().__new__(cls, index)
+        variable.name = name
+        return variable
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+@dataclass(slots=True)
 class ExpressionNode:
     operation: OperationEnum
     left: ExpressionNode | float
@@ -36,23 +53,22 @@ class ExpressionNode:
 
     def log_tree(self, indent: int = 0, prefix: str = "") -> str:
         result = []
-        current_indent = "  " * indent
+        # Explicit stack so that arbitrarily deep trees can be rendered
+        stack: list[tuple[ExpressionNode | float | int, int, str]] = [
+            (self, indent, prefix)
+        ]
 
-        # Current node
-        op_symbol = self._get_operation_symbol()
-        result.append(f"{current_indent}{prefix}{op_symbol}")
+        while stack:
+            item, level, item_prefix = stack.pop()
+            current_indent = "  " * level
 
-        # Left child
-        if isinstance(self.left, ExpressionNode):
-            result.append(self.left.log_tree(indent + 1, "├── "))
-        else:
-            result.append(f"{current_indent}  ├── {self.left}")
+            if not isinstance(item, ExpressionNode):
+                result.append(f"{current_indent}{item_prefix}{item}")
+                continue
 
-        # Right child
-        if isinstance(self.right, ExpressionNode):
-            result.append(self.right.log_tree(indent + 1, "└── "))
-        else:
-            result.append(f"{current_indent}  └── {self.right}")
+            result.append(f"{current_indent}{item_prefix}{item._get_operation_symbol()}")
+            stack.append((item.right, level + 1, "└── "))
+            stack.append((item.left, level + 1, "├── "))
 
         return "\n".join(result)
 
@@ -65,66 +81,461 @@ class ExpressionNode:
         }
         return symbols.get(self.operation, "?")
 
+    def to_infix(self) -> str:
+        rendered: dict[int, str] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(self, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                for child in (node.right, node.left):
+                    if isinstance(child, ExpressionNode) and id(child) not in rendered:
+                        stack.append((child, False))
+                continue
+
+            operands = [
+                f"({rendered[id(child)]})"
+                if isinstance(child, ExpressionNode)
+                else str(child)
+                for child in (node.left, node.right)
+            ]
+            rendered[id(node)] = (
+                f"{operands[0]} {node._get_operation_symbol()} {operands[1]}"
+            )
+
+        return rendered[id(self)]
+
     def __str__(self) -> str:
         return self.log_tree()
 
 
-class ExpressionParser:
-    OPERATORS = {
-        ast.Add: OperationEnum.ADD,
-        ast.Sub: OperationEnum.SUB,
-        ast.Mult: OperationEnum.MUL,
-        ast.Div: OperationEnum.DIV,
-    }
+_CONSTANT_FLOAT = 0
+_CONSTANT_INT = -1
+# Integers beyond this are not exact in a float64
+_EXACT_INT_LIMIT = 2**53
+_OPERATIONS = {operation.value: operation for operation in OperationEnum}
+
+
+class _Slot:
+    # Parser handle for an operation already written to a CompactExpression
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+
+class CompactExpression:
+    # Struct-of-arrays form of an expression DAG. Slot i is either an
+    # operation (opcode is its OperationEnum value, left and right are slot
+    # indices) or a constant (opcode 0 or -1 for int, left indexes constants).
+    # Children always precede their parent, so one forward pass over the slots
+    # visits them in evaluation order. The orchestrator compiles from it and
+    # the workflow builder builds from it; the folder, rewriter, rebalancer
+    # and planners still take ExpressionNode trees, made with to_tree
+    __slots__ = (
+        "opcodes",
+        "left",
+        "right",
+        "constants",
+        "integers",
+        "root",
+        "_interned",
+        "_constant_slots",
+    )
+
+    def __init__(self):
+        self.opcodes = array("b")
+        self.left = array("q")
+        self.right = array("q")
+        self.constants = array("d")
+        # Integers a float64 cannot hold exactly, and int subclasses such as
+        # template parameters, by constant index
+        self.integers: dict[int, int] = {}
+        self.root = -1
+        # Build-time only: identical operations and constants share one slot
+        self._interned: dict[int, int] | None = {}
+        self._constant_slots: dict[tuple[type, str], int] | None = {}
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            buffer.itemsize * len(buffer)
+            for buffer in (self.opcodes, self.left, self.right, self.constants)
+        )
+
+    @classmethod
+    def from_tree(
+        cls,
+        node: ExpressionNode | int | float,
+        slots_by_node: dict[int, int] | None = None,
+    ) -> CompactExpression:
+        # slots_by_node, when given, receives the slot of every node by id()
+        compact = cls()
+        slots: dict[int, _Slot] = {}
+        stack: list[tuple[ExpressionNode, bool]] = []
+        if isinstance(node, ExpressionNode):
+            stack.append((node, False))
+        while stack:
+            current, children_done = stack.pop()
+            if id(current) in slots:
+                continue
+            if not children_done:
+                stack.append((current, True))
+                stack.extend(
+                    (child, False)
+                    for child in (current.right, current.left)
+                    if isinstance(child, ExpressionNode) and id(child) not in slots
+                )
+                continue
+            slots[id(current)] = compact.intern(
+                current.operation,
+                *(
+                    slots[id(child)] if isinstance(child, ExpressionNode) else child
+                    for child in (current.left, current.right)
+                ),
+            )
+        if slots_by_node is not None:
+            slots_by_node.update((key, slot.index) for key, slot in slots.items())
+        return compact.finish(slots[id(node)] if slots else node)
+
+    def intern(
+        self,
+        operation: OperationEnum,
+        left: _Slot | int | float,
+        right: _Slot | int | float,
+    ) -> _Slot:
+        left_index, right_index = self._operand(left), self._operand(right)
+        key = (left_index << 32 | right_index) << 3 | operation.value
+        index = self._interned.get(key)
+        if index is None:
+            index = self._append(operation.value, left_index, right_index)
+            self._interned[key] = index
+        return _Slot(index)
+
+    def finish(self, result: _Slot | int | float) -> CompactExpression:
+        self.root = self._operand(result)
+        self._interned = None
+        self._constant_slots = None
+        return self
+
+    def operation(self, index: int) -> OperationEnum | None:
+        return _OPERATIONS.get(self.opcodes[index])
+
+    def constant(self, index: int) -> int | float:
+        position = self.left[index]
+        if position in self.integers:
+            return self.integers[position]
+        value = self.constants[position]
+        return int(value) if self.opcodes[index] == _CONSTANT_INT else value
+
+    def flatten_commutative(self, index: int) -> list[int]:
+        # Slots of the operands of the run of one operation rooted at index,
+        # left to right
+        opcode = self.opcodes[index]
+        operands: list[int] = []
+        stack = [index]
+        while stack:
+            current = stack.pop()
+            if current != index and self.opcodes[current] != opcode:
+                operands.append(current)
+                continue
+            stack.append(self.right[current])
+            stack.append(self.left[current])
+        return operands
+
+    def to_tree(self) -> ExpressionNode | int | float:
+        nodes: list[ExpressionNode | int | float] = []
+        for index, opcode in enumerate(self.opcodes):
+            if opcode <= _CONSTANT_FLOAT:
+                nodes.append(self.constant(index))
+            else:
+                nodes.append(
+                    ExpressionNode(
+                        operation=_OPERATIONS[opcode],
+                        left=nodes[self.left[index]],
+                        right=nodes[self.right[index]],
+                    )
+                )
+        return nodes[self.root]
+
+    def _operand(self, operand: _Slot | int | float) -> int:
+        if isinstance(operand, _Slot):
+            return operand.index
+
+        # 1 and TemplateParameter(1) have one repr
+        key = (type(operand), repr(operand))
+        index = self._constant_slots.get(key)
+        if index is not None:
+            return index
+
+        position = len(self.constants)
+        if isinstance(operand, int):
+            if abs(operand) > _EXACT_INT_LIMIT or type(operand) is not int:
+                self.integers[position] = operand
+                self.constants.append(math.nan)
+            else:
+                self.constants.append(operand)
+            index = self._append(_CONSTANT_INT, position, 0)
+        else:
+            self.constants.append(operand)
+            index = self._append(_CONSTANT_FLOAT, position, 0)
+        self._constant_slots[key] = index
+        return index
+
+    def _append(self, opcode: int, left: int, right: int) -> int:
+        self.opcodes.append(opcode)
+        self.left.append(left)
+        self.right.append(right)
+        return len(self.opcodes) - 1
 
+
+# Operator stack markers for the iterative parser
+_LEFT_PARENTHESIS = "("
+_UNARY_MINUS = "USub"
+_UNARY_PLUS = "UAdd"
+
+_UNARY_PRECEDENCE = 3
+
+# symbol -> (precedence, is_right_associative, operation)
+# Operators Python would accept but we do not support are still parsed so
+# that syntax errors are reported before unsupported operators, like ast did.
+_BINARY_OPERATORS: dict[str, tuple[int, bool, OperationEnum | str]] = {
+    "+": (1, False, OperationEnum.ADD),
+    "-": (1, False, OperationEnum.SUB),
+    "*": (2, False, OperationEnum.MUL),
+    "/": (2, False, OperationEnum.DIV),
+    "%": (2, False, "Mod"),
+    "//": (2, False, "FloorDiv"),
+    "**": (4, True, "Pow"),
+}
+
+
+class _UnsupportedOperand:
+    # Stands in for a subtree containing an unsupported operator; the error
+    # is raised once parsing finishes, reporting the operator nearest the root
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+REGEX_TOKEN = re.compile(
+    r"\s*(?:(?P<number>[0-9]+(?:\.[0-9]*)?|\.[0-9]+)"
+    r"|(?P<name>[A-Za-z_][A-Za-z0-9_]*)"
+    r"|(?P<operator>\*\*|//|[-+*/%])"
+    r"|(?P<parenthesis>[()])"
+    r"|(?P<other>\S))"
+)
+
+
+class ExpressionParser:
     def __init__(self):
         self.operations = []
 
     def parse(self, expression: str) -> ExpressionNode | float | int:
-        clean_expr = self._clean_expression(expression)
-        try:
-            tree = ast.parse(clean_expr, mode="eval")
-        except SyntaxError as e:
-            raise ExpressionSyntaxError(expression, str(e)) from e
-        expr_tree = self._build_expression_tree(tree.body)
-        logger.info(f"Parsed Expression Tree:\n{expr_tree}")
+        # Identical subtrees are built once and shared (hash-consing), so the
+        # result is a DAG in which a repeated subexpression is a single node
+        interned: dict[tuple, ExpressionNode] = {}
+        expr_tree = self._parse_tokens(expression, partial(self._intern, interned))
+        logger.debug("Parsed Expression Tree:\n%s", expr_tree)
 
         return expr_tree
 
-    def _build_expression_tree(self, node) -> ExpressionNode | float | int:
-        if isinstance(node, ast.BinOp):
-            op_symbol = self.OPERATORS.get(type(node.op))
-            if op_symbol is None:
-                raise UnsupportedOperatorError(str(type(node.op).__name__))
+    def parse_prepared(
+        self, expression: str
+    ) -> tuple[ExpressionNode | Variable | float | int, list[str]]:
+        # Same grammar plus names, each a Variable numbered in order of first
+        # appearance; the names are returned in that order
+        interned: dict[tuple, ExpressionNode] = {}
+        variables: dict[str, Variable] = {}
+        expr_tree = self._parse_tokens(
+            expression,
+            partial(self._intern, interned),
+            partial(self._variable, variables),
+        )
+        return expr_tree, list(variables)
 
-            left = self._build_expression_tree(node.left)
-            right = self._build_expression_tree(node.right)
+    def parse_compact(self, expression: str) -> CompactExpression:
+        # Same grammar and errors as parse, written straight into arrays
+        compact = CompactExpression()
+        return compact.finish(self._parse_tokens(expression, compact.intern))
 
-            return ExpressionNode(operation=op_symbol, left=left, right=right)
+    def _parse_tokens(
+        self,
+        expression: str,
+        combine: Callable[..., ExpressionNode | _Slot],
+        variable: Callable[[str], Variable] | None = None,
+    ) -> ExpressionNode | _Slot | float | int:
+        valid_characters = (
+            REGEX_VALID_CHARACTERS
+            if variable is None
+            else REGEX_VALID_PREPARED_CHARACTERS
+        )
+        syntax_error = partial(
+            self._raise_syntax_error, expression, valid_characters=valid_characters
+        )
+        operands: list[ExpressionNode | _Slot | float | int] = []
+        operators: list[tuple[int, str | OperationEnum]] = []
+        expect_operand = True
+        has_tokens = False
 
-        if isinstance(node, ast.Constant):
-            return node.value
+        for match in REGEX_TOKEN.finditer(expression):
+            kind = match.lastgroup
+            token = match.group(kind)
+            has_tokens = True
 
-        if not isinstance(node, ast.UnaryOp):
-            raise UnsupportedNodeError(type(node).__name__)
+            if kind == "number":
+                if not expect_operand:
+                    syntax_error("invalid syntax")
+                operands.append(self._to_number(expression, token, syntax_error))
+                expect_operand = False
 
-        if not isinstance(node.op, ast.USub):
-            raise UnsupportedUnaryOperatorError(type(node.op).__name__)
+            elif kind == "name":
+                if not expect_operand or variable is None:
+                    syntax_error("invalid syntax")
+                operands.append(variable(token))
+                expect_operand = False
 
-        operand = self._build_expression_tree(node.operand)
-        if isinstance(operand, (int, float)):
-            return -operand
-        else:
-            return ExpressionNode(operation=OperationEnum.SUB, left=0, right=operand)
+            elif kind == "operator":
+                if expect_operand:
+                    if token == "-":
+                        operators.append((_UNARY_PRECEDENCE, _UNARY_MINUS))
+                    elif token == "+":
+                        operators.append((_UNARY_PRECEDENCE, _UNARY_PLUS))
+                    else:
+                        syntax_error("invalid syntax")
+                    continue
+
+                precedence, right_associative, operation = _BINARY_OPERATORS[token]
+                while operators and (
+                    operators[-1][0] > precedence
+                    or (operators[-1][0] == precedence and not right_associative)
+                ):
+                    self._reduce(operators.pop()[1], operands, combine)
+                operators.append((precedence, operation))
+                expect_operand = True
+
+            elif kind == "parenthesis":
+                if token == "(":
+                    if not expect_operand:
+                        syntax_error("invalid syntax")
+                    operators.append((0, _LEFT_PARENTHESIS))
+                    continue
 
+                if expect_operand:
+                    syntax_error("invalid syntax")
+                while operators and operators[-1][1] != _LEFT_PARENTHESIS:
+                    self._reduce(operators.pop()[1], operands, combine)
+                if not operators:
+                    syntax_error("unmatched ')'")
+                operators.pop()
 
-    def _clean_expression(self, expression: str) -> str:
-        clean = REGEX_SPACES.sub("", expression)
-        if not clean:
+            else:
+                syntax_error("invalid syntax")
+
+        if not has_tokens:
             raise ExpressionSyntaxError(expression, "Expression cannot be empty")
 
-        if not REGEX_VALID_CHARACTERS.match(clean):
+        if any(operation == _LEFT_PARENTHESIS for _, operation in operators):
+            syntax_error("'(' was never closed")
+
+        if expect_operand:
+            syntax_error("invalid syntax")
+
+        while operators:
+            self._reduce(operators.pop()[1], operands, combine)
+
+        expr_tree = operands[0]
+        if isinstance(expr_tree, _UnsupportedOperand):
+            raise expr_tree.error
+
+        return expr_tree
+
+    @staticmethod
+    def _reduce(
+        operation: str | OperationEnum,
+        operands: list[ExpressionNode | _Slot | float | int | _UnsupportedOperand],
+        combine: Callable[..., ExpressionNode | _Slot],
+    ) -> None:
+        if isinstance(operation, OperationEnum):
+            right = operands.pop()
+            left = operands.pop()
+            if isinstance(left, _UnsupportedOperand):
+                operands.append(left)
+            elif isinstance(right, _UnsupportedOperand):
+                operands.append(right)
+            else:
+                operands.append(combine(operation, left, right))
+            return
+
+        if operation == _UNARY_MINUS:
+            operand = operands.pop()
+            if isinstance(operand, (int, float)) and not isinstance(operand, Variable):
+                operands.append(-operand)
+            elif isinstance(operand, _UnsupportedOperand):
+                operands.append(operand)
+            else:
+                operands.append(combine(OperationEnum.SUB, 0, operand))
+            return
+
+        if operation == _UNARY_PLUS:
+            operands[-1] = _UnsupportedOperand(UnsupportedUnaryOperatorError(operation))
+            return
+
+        operands.pop()
+        operands[-1] = _UnsupportedOperand(UnsupportedOperatorError(operation))
+
+    @staticmethod
+    def _intern(
+        interned: dict[tuple, ExpressionNode],
+        operation: OperationEnum,
+        left: ExpressionNode | float | int,
+        right: ExpressionNode | float | int,
+    ) -> ExpressionNode:
+        # Children are already interned, so identity stands for structure;
+        # repr keeps 1, 1.0 and -0.0 apart
+        key = tuple(
+            id(operand) if isinstance(operand, ExpressionNode) else repr(operand)
+            for operand in (left, right)
+        )
+        node = interned.get((operation, *key))
+        if node is None:
+            node = ExpressionNode(operation=operation, left=left, right=right)
+            interned[(operation, *key)] = node
+        return node
+
+    @staticmethod
+    def _variable(variables: dict[str, Variable], name: str) -> Variable:
+        if name not in variables:
+            variables[name] = Variable(len(variables), name)
+        return variables[name]
+
+    def _to_number(
+        self, expression: str, token: str, syntax_error: Callable[[str], None]
+    ) -> float | int:
+        if "." in token:
+            return float(token)
+
+        if token[0] == "0" and token.strip("0"):
+            syntax_error("leading zeros in decimal integer literals are not permitted")
+        try:
+            return int(token)
+        except ValueError as e:
+            raise ExpressionSyntaxError(expression, str(e)) from e
+
+    def _raise_syntax_error(
+        self,
+        expression: str,
+        message: str,
+        valid_characters: re.Pattern = REGEX_VALID_CHARACTERS,
+    ) -> None:
+        # Invalid characters take precedence over syntax errors
+        if not valid_characters.match(expression):
             raise ExpressionSyntaxError(
                 expression, "Expression contains invalid characters"
             )
-        return clean
+        raise ExpressionSyntaxError(expression, message)
@@ -0,0 +1,171 @@
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .evaluator import PROGRAM_INPUT_PREFIX, evaluate_program
+from .expression_parser import ExpressionNode
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FusedChunk:
+    program: list[int | float | str]
+    inputs: list["FusedChunk"] = field(default_factory=list)
+    operations: int = 0
+
+
+class FusionPlanner:
+    def __init__(
+        self,
+        hop_latency_seconds: float,
+        worker_concurrency: int,
+        op_cost_seconds: float | None = None,
+        smoothing: float = 0.2,
+    ):
+        self.hop_latency_seconds = hop_latency_seconds
+        self.worker_concurrency = max(1, worker_concurrency)
+        self.op_cost_seconds = op_cost_seconds or self.measure_op_cost()
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def measure_op_cost(operations: int = 20_000) -> float:
+        program: list[int | float | str] = [1.5]
+        for _ in range(operations):
+            program.extend((1.0000001, "*"))
+
+        started = time.perf_counter()
+        evaluate_program(program, [])
+        return (time.perf_counter() - started) / operations
+
+    def record_workflow_latency(self, elapsed_seconds: float, hops: int) -> None:
+        # Exponentially weighted estimate of the cost of one broker round trip,
+        # fed by the end-to-end latency of every dispatched workflow
+        if hops <= 0:
+            return
+        sample = elapsed_seconds / hops
+        with self._lock:
+            self.hop_latency_seconds += self.smoothing * (
+                sample - self.hop_latency_seconds
+            )
+
+    def target_chunk_operations(self, total_operations: int) -> int:
+        # A chunk must do at least a hop's worth of work, and the tree is
+        # spread over as many chunks as there are workers to keep busy
+        break_even = math.ceil(self.hop_latency_seconds / self.op_cost_seconds)
+        spread = math.ceil(total_operations / self.worker_concurrency)
+        return max(1, break_even, spread)
+
+    def plan(self, node: ExpressionNode) -> FusedChunk:
+        target = self.target_chunk_operations(self._count_operations(node))
+        cut_points = self._find_cut_points(node, target)
+
+        # One chunk per cut point, however many chunks read its value
+        chunks: dict[int, FusedChunk] = {id(node): FusedChunk(program=[])}
+        pending: list[ExpressionNode] = [node]
+        while pending:
+            chunk_root = pending.pop()
+            chunk = chunks[id(chunk_root)]
+            for input_node in self._emit_program(chunk_root, chunk, cut_points):
+                input_chunk = chunks.get(id(input_node))
+                if input_chunk is None:
+                    input_chunk = chunks[id(input_node)] = FusedChunk(program=[])
+                    pending.append(input_node)
+                chunk.inputs.append(input_chunk)
+
+        logger.info(
+            f"Fusion plan: target {target} ops per chunk, {len(chunks)} chunks"
+        )
+        return chunks[id(node)]
+
+    def _count_operations(self, node: ExpressionNode) -> int:
+        # Distinct operations: the parser shares repeated subtrees
+        seen: set[int] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if id(current) in seen:
+                continue
+            seen.add(id(current))
+            for child in (current.left, current.right):
+                if isinstance(child, ExpressionNode):
+                    stack.append(child)
+        return len(seen)
+
+    def _find_cut_points(self, node: ExpressionNode, target: int) -> set[int]:
+        # Post-order walk accumulating the operations not yet assigned to a
+        # chunk; a subtree becomes its own chunk once it reaches the target.
+        # A shared subtree left in place is inlined once per parent, so it is
+        # cut as soon as the repeated work would reach the target too
+        parents = self._count_parents(node)
+        unassigned: dict[int, int] = {}
+        cut_points: set[int] = set()
+        stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+
+        while stack:
+            current, children_done = stack.pop()
+            if not children_done:
+                if id(current) in unassigned:
+                    continue
+                stack.append((current, True))
+                for child in (current.right, current.left):
+                    if isinstance(child, ExpressionNode):
+                        stack.append((child, False))
+                continue
+
+            operations = 1 + sum(
+                unassigned[id(child)]
+                for child in (current.left, current.right)
+                if isinstance(child, ExpressionNode)
+            )
+            repeated = operations * (parents.get(id(current), 1) - 1)
+            if current is not node and max(operations, repeated) >= target:
+                cut_points.add(id(current))
+                operations = 0
+            unassigned[id(current)] = operations
+
+        return cut_points
+
+    @staticmethod
+    def _count_parents(node: ExpressionNode) -> dict[int, int]:
+        parents: dict[int, int] = {}
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for child in (current.left, current.right):
+                if not isinstance(child, ExpressionNode):
+                    continue
+                parents[id(child)] = parents.get(id(child), 0) + 1
+                if parents[id(child)] == 1:
+                    stack.append(child)
+        return parents
+
+    def _emit_program(
+        self, chunk_root: ExpressionNode, chunk: FusedChunk, cut_points: set[int]
+    ) -> list[ExpressionNode]:
+        input_nodes: list[ExpressionNode] = []
+        # id(cut node) -> its input position, so a value read twice is fetched once
+        positions: dict[int, int] = {}
+        stack: list[ExpressionNode | int | float | str] = [chunk_root]
+
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                chunk.program.append(item)
+                chunk.operations += 1
+            elif not isinstance(item, ExpressionNode):
+                chunk.program.append(item)
+            elif item is not chunk_root and id(item) in cut_points:
+                if id(item) not in positions:
+                    positions[id(item)] = len(input_nodes)
+                    input_nodes.append(item)
+                chunk.program.append(f"{PROGRAM_INPUT_PREFIX}{positions[id(item)]}")
+            else:
+                stack.append(item._get_operation_symbol())
+                stack.append(item.right)
+                stack.append(item.left)
+
+        return input_nodes
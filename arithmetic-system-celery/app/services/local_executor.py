@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+from .evaluator import evaluate, evaluate_compact
+from .expression_parser import CompactExpression, ExpressionNode
+
+LOCAL_POOLS = ("thread", "process")
+
+
+def local_pool(kind: str, max_workers: int) -> Executor:
+    # Threads start instantly and share the tree, but hold the GIL while they
+    # compute; processes compute in parallel with the API and each other
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers, thread_name_prefix="local-executor")
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers)
+    raise ValueError(f"Unknown local pool {kind!r}, expected one of {LOCAL_POOLS}")
+
+
+class LocalExecutor:
+    # Evaluates expressions up to max_operations in the API process, with the
+    # worker tasks' arithmetic, on any concurrent.futures.Executor; larger
+    # ones are left to the workers
+    def __init__(self, pool: Executor, max_operations: int):
+        self.pool = pool
+        self.max_operations = max_operations
+        # A process gets the array form, which pickles without recursing
+        # through the tree
+        self._compact = isinstance(pool, ProcessPoolExecutor)
+
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.operations = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def accepts(self, operations: int) -> bool:
+        return operations <= self.max_operations
+
+    async def evaluate(
+        self, tree: ExpressionNode, operations: int, timeout: float
+    ) -> int | float:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        if self._compact:
+            future = loop.run_in_executor(
+                self.pool, evaluate_compact, CompactExpression.from_tree(tree)
+            )
+        else:
+            future = loop.run_in_executor(self.pool, evaluate, tree)
+        failed = True
+        try:
+            value = await asyncio.wait_for(future, timeout)
+            failed = False
+        except asyncio.TimeoutError:
+            # Same error as a workflow that does not finish in time
+            raise CeleryTimeoutError("The operation timed out.")
+        finally:
+            with self._lock:
+                self.evaluations += 1
+                self.operations += operations
+                self.errors += failed
+                self.seconds += time.perf_counter() - started
+        return value
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "evaluations": self.evaluations,
+                "operations": self.operations,
+                "errors": self.errors,
+                "mean_seconds": (
+                    self.seconds / self.evaluations if self.evaluations else 0.0
+                ),
+            }
@@ -1,5 +1,14 @@
+import asyncio
+import hashlib
 import logging
+import time
+from collections.abc import AsyncIterable, AsyncIterator
+from concurrent.futures import Executor
+from dataclasses import dataclass
 
+from celery import Signature, group
+
+from app.celery import app as celery_app
 from app.workers import (
     add_task,
     subtract_task,
@@ -7,17 +16,126 @@ from app.workers import (
     divide_task,
     subtract_list_task,
     divide_list_task,
+    evaluate_columns_task,
 )
 
-from .expression_parser import ExpressionParser, OperationEnum
+from .batch_planner import BatchPlanner, SharedSubtree
+from .cache import LRUCache
+from .chain_rewriter import ChainRewriter
+from .column_evaluator import ColumnOperand, compile_columns, evaluate_columns
+from .constant_folder import ConstantFolder, FoldedSubtree
+from .dag_executor import DagExecutor
+from .execution_backend import (
+    CeleryBackend,
+    CompiledWorkflow,
+    DagBackend,
+    ExecutionBackend,
+    LocalBackend,
+)
+from .fusion_planner import FusionPlanner
+from .local_executor import LocalExecutor, local_pool
+from .result_cache import ResultCache
+from .result_waiter import ResultWaiter
+from .single_flight import SingleFlight
+from .subtree_memo import SubtreeMemo
+from .tree_rebalancer import TreeRebalancer
+from .expression_parser import (
+    REGEX_SPACES,
+    ExpressionNode,
+    ExpressionParser,
+    OperationEnum,
+    Variable,
+)
 from .workflow_builder import WorkflowBuilder
+from .workflow_template import PreparedWorkflow
 from typing import Callable
+from app.config import (
+    BATCH_RESULT_TIMEOUT_SECONDS,
+    BATCH_SHARED_SUBTREE_MIN_OPERATIONS,
+    CELERY_RESULT_BACKEND_URL,
+    CHAIN_REWRITE_ENABLED,
+    COLUMNS_CHUNK_ROWS,
+    COLUMNS_LOCAL_MAX_ROWS,
+    COMPILE_IN_THREAD_MIN_CHARS,
+    COMMON_SUBTREE_ELIMINATION_ENABLED,
+    COMMON_SUBTREE_TASK_COST_SECONDS,
+    CONSTANT_FOLDING_ENABLED,
+    CONSTANT_FOLDING_MAX_DEPTH,
+    CONSTANT_FOLDING_MAX_NODES,
+    DAG_EXECUTOR_ENABLED,
+    DAG_KEY_PREFIX,
+    DAG_RUN_TTL_SECONDS,
+    FLAT_REDUCTION_MAX_FAN_IN,
+    FUSION_ENABLED,
+    FUSION_HOP_LATENCY_SECONDS,
+    FUSION_WORKER_CONCURRENCY,
+    LOCAL_EXECUTION_ENABLED,
+    LOCAL_EXECUTION_MAX_OPERATIONS,
+    LOCAL_EXECUTION_MAX_WORKERS,
+    LOCAL_EXECUTION_POOL,
+    PREPARED_EXPRESSIONS_MAX_SIZE,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_KEY_PREFIX,
+    RESULT_CACHE_L1_MAX_SIZE,
+    RESULT_CACHE_L2_ENABLED,
+    RESULT_CACHE_L2_MAX_ENTRIES,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_TIMEOUT_SECONDS,
+    SINGLE_FLIGHT_ENABLED,
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS,
+    SINGLE_FLIGHT_POLL_INTERVAL_SECONDS,
+    SINGLE_FLIGHT_REPLICA_LOCK_ENABLED,
+    SKIP_INTERMEDIATE_RESULTS,
+    STREAM_MAX_IN_FLIGHT,
+    SUBTREE_MEMO_ENABLED,
+    SUBTREE_MEMO_MAX_SUBTREES,
+    SUBTREE_MEMO_MIN_OPERATIONS,
+    TREE_REBALANCE_ENABLED,
+    WORKFLOW_CACHE_MAX_SIZE,
+    WORKFLOW_CACHE_TTL_SECONDS,
+    WORKFLOW_STRING_MAX_CHARS,
+    WORKFLOW_TEMPLATE_CACHE_ENABLED,
+    WORKFLOW_TEMPLATE_CACHE_MAX_SIZE,
+)
+from app.models.models import (
+    CalculateExpressionResponse,
+    ColumnError,
+    EvaluateColumnsResponse,
+)
+from app.types.errors import PreparedExpressionNotFoundError, VariableBindingError
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class PreparedExpression:
+    expression_id: str
+    expression: str
+    # Names in the order execute binds them
+    variables: list[str]
+    workflow: PreparedWorkflow
+    # Steps and result operand for evaluating whole columns of values
+    columns: tuple[list[list[ColumnOperand]], ColumnOperand]
+
+
 class WorkflowOrchestrator:
-    def __init__(self):
+    def __init__(
+        self,
+        cache_max_size: int = WORKFLOW_CACHE_MAX_SIZE,
+        cache_ttl_seconds: float | None = WORKFLOW_CACHE_TTL_SECONDS,
+        constant_folding: bool = CONSTANT_FOLDING_ENABLED,
+        fusion: bool = FUSION_ENABLED,
+        result_cache: bool = RESULT_CACHE_ENABLED,
+        single_flight: bool = SINGLE_FLIGHT_ENABLED,
+        subtree_memo: bool = SUBTREE_MEMO_ENABLED,
+        common_subtree_elimination: bool = COMMON_SUBTREE_ELIMINATION_ENABLED,
+        chain_rewrite: bool = CHAIN_REWRITE_ENABLED,
+        tree_rebalance: bool = TREE_REBALANCE_ENABLED,
+        workflow_templates: bool = WORKFLOW_TEMPLATE_CACHE_ENABLED,
+        dag_executor: bool = DAG_EXECUTOR_ENABLED,
+        local_execution: bool = LOCAL_EXECUTION_ENABLED,
+        local_executor_pool: Executor | None = None,
+    ):
         self.task_map: dict[OperationEnum, Callable[..., int | float]] = {
             OperationEnum.ADD: add_task,
             OperationEnum.SUB: subtract_task,
@@ -30,14 +148,671 @@ class WorkflowOrchestrator:
             OperationEnum.DIV: divide_list_task,
         }
 
+        folder = (
+            ConstantFolder(CONSTANT_FOLDING_MAX_NODES, CONSTANT_FOLDING_MAX_DEPTH)
+            if constant_folding
+            else None
+        )
+
+        self.planner = (
+            FusionPlanner(FUSION_HOP_LATENCY_SECONDS, FUSION_WORKER_CONCURRENCY)
+            if fusion
+            else None
+        )
+
+        self.rebalancer = (
+            TreeRebalancer(FUSION_HOP_LATENCY_SECONDS) if tree_rebalance else None
+        )
+        # The rebalancer already regroups SUB/DIV chains, and its shapes are
+        # not meant to be regrouped again
+        rewriter = (
+            ChainRewriter() if chain_rewrite and self.rebalancer is None else None
+        )
+
+        self.template_cache = (
+            LRUCache(WORKFLOW_TEMPLATE_CACHE_MAX_SIZE) if workflow_templates else None
+        )
+
         self.parser = ExpressionParser()
-        self.builder = WorkflowBuilder(self.task_map, self.task_map_chord)
+        self.builder = WorkflowBuilder(
+            self.task_map,
+            self.task_map_chord,
+            folder,
+            self.planner,
+            FLAT_REDUCTION_MAX_FAN_IN,
+            rewriter,
+            self.rebalancer,
+            WORKFLOW_STRING_MAX_CHARS,
+            self.template_cache,
+            SKIP_INTERMEDIATE_RESULTS,
+        )
+        self.batch_planner = BatchPlanner(
+            self.builder, BATCH_SHARED_SUBTREE_MIN_OPERATIONS
+        )
+        self.common_subtree_elimination = common_subtree_elimination
+        self.workflow_cache = LRUCache(cache_max_size, cache_ttl_seconds)
+        self.prepared_expressions = LRUCache(PREPARED_EXPRESSIONS_MAX_SIZE)
+        self.result_waiter = ResultWaiter(celery_app, CELERY_RESULT_BACKEND_URL)
+        self.celery_backend = CeleryBackend(
+            self.builder,
+            self.result_waiter,
+            self.planner,
+            self._eliminate_common_subtrees,
+        )
+        self.result_cache = (
+            ResultCache(
+                RESULT_CACHE_L1_MAX_SIZE,
+                RESULT_CACHE_TTL_SECONDS,
+                CELERY_RESULT_BACKEND_URL if RESULT_CACHE_L2_ENABLED else None,
+                RESULT_CACHE_L2_MAX_ENTRIES,
+                RESULT_CACHE_KEY_PREFIX,
+            )
+            if result_cache
+            else None
+        )
+        # Subtree values are read through the result cache; workers store
+        # them straight into its L2 keyspace
+        self.subtree_memo = (
+            SubtreeMemo(
+                self.batch_planner,
+                self.result_cache,
+                SUBTREE_MEMO_MIN_OPERATIONS,
+                SUBTREE_MEMO_MAX_SUBTREES,
+            )
+            if subtree_memo and self.result_cache is not None
+            else None
+        )
+        self.dag_executor = (
+            DagExecutor(CELERY_RESULT_BACKEND_URL, DAG_KEY_PREFIX, DAG_RUN_TTL_SECONDS)
+            if dag_executor
+            else None
+        )
+        # Any concurrent.futures.Executor can run the local evaluations
+        self.local_executor = (
+            LocalExecutor(
+                local_executor_pool
+                or local_pool(LOCAL_EXECUTION_POOL, LOCAL_EXECUTION_MAX_WORKERS),
+                LOCAL_EXECUTION_MAX_OPERATIONS,
+            )
+            if local_execution
+            else None
+        )
+        # Waiting on another replica needs its result to land in the shared L2
+        replica_lock = (
+            SINGLE_FLIGHT_REPLICA_LOCK_ENABLED
+            and result_cache
+            and RESULT_CACHE_L2_ENABLED
+        )
+        self.single_flight = (
+            SingleFlight(
+                CELERY_RESULT_BACKEND_URL if replica_lock else None,
+                SINGLE_FLIGHT_LOCK_TTL_SECONDS,
+                SINGLE_FLIGHT_POLL_INTERVAL_SECONDS,
+            )
+            if single_flight
+            else None
+        )
 
-    def calculate(self, expression: str) -> CalculateExpressionResponse:
-        parsed = self.parser.parse(expression)
-        workflow_async_result, workflow_str = self.builder.build(parsed)
-        final_result = workflow_async_result.get(timeout=3)
-        logging.info(f"Workflow String: {workflow_str}")
+    async def calculate(self, expression: str) -> CalculateExpressionResponse:
+        if len(expression) >= COMPILE_IN_THREAD_MIN_CHARS:
+            compiled = await asyncio.to_thread(self.compile, expression)
+        else:
+            compiled = self.compile(expression)
+
+        if isinstance(compiled.workflow, Signature):
+            if self.result_cache is not None:
+                hit = await self.result_cache.get(compiled.canonical_key)
+                if hit is not None:
+                    value, tier = hit
+                    logger.info(f"Result cache {tier} hit: {value}")
+                    return CalculateExpressionResponse(
+                        result=value, workflow=compiled.workflow_string, cached=True
+                    )
+            compiled = await self._recall_subtrees(compiled)
+
+        if isinstance(compiled.workflow, Signature) and self.single_flight is not None:
+            # Concurrent requests for the same expression share one workflow
+            final_result, workflow_string = await self.single_flight.do(
+                compiled.canonical_key,
+                lambda: self._execute(compiled),
+                lambda: self._peek_result(compiled),
+            )
+        else:
+            final_result, workflow_string = await self._execute(compiled)
+        logging.info(f"Workflow String: {workflow_string}")
         logger.info(f"Final Result: {final_result}")
 
-        return CalculateExpressionResponse(result=final_result, workflow=workflow_str)
+        return CalculateExpressionResponse(
+            result=final_result, workflow=workflow_string
+        )
+
+    def prepare(self, expression: str) -> PreparedExpression:
+        # Parsed, optimized and built once; the id follows from the text, so
+        # preparing the same expression again is a lookup
+        expression_id = hashlib.blake2b(
+            REGEX_SPACES.sub("", expression).encode(), digest_size=16
+        ).hexdigest()
+        prepared = self.prepared_expressions.get(expression_id)
+        if prepared is None:
+            tree, variables = self.parser.parse_prepared(expression)
+            prepared = PreparedExpression(
+                expression_id,
+                expression,
+                variables,
+                self.builder.prepare(tree),
+                compile_columns(tree),
+            )
+            self.prepared_expressions.set(expression_id, prepared)
+        return prepared
+
+    async def execute(
+        self, expression_id: str, values: dict[str, int | float]
+    ) -> CalculateExpressionResponse:
+        # Only binds the values into the prepared workflow and dispatches it
+        prepared = self._prepared(expression_id, values)
+        workflow, workflow_string = self.builder.bind(
+            prepared.workflow, [values[name] for name in prepared.variables]
+        )
+        final_result = await self.result_waiter.wait(
+            self.builder.dispatch(workflow), RESULT_TIMEOUT_SECONDS
+        )
+        return CalculateExpressionResponse(
+            result=final_result, workflow=workflow_string
+        )
+
+    async def evaluate_columns(
+        self,
+        expression_id: str,
+        columns: dict[str, list[int | float]],
+        local_max_rows: int = COLUMNS_LOCAL_MAX_ROWS,
+        chunk_rows: int = COLUMNS_CHUNK_ROWS,
+    ) -> EvaluateColumnsResponse:
+        # Row i binds every variable to the i-th value of its column. Short
+        # columns are evaluated here; longer ones go out as one group of chunks
+        prepared = self._prepared(expression_id, columns)
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise VariableBindingError(
+                list(columns), "Columns differ in length for variables"
+            )
+        rows = lengths.pop() if lengths else 1
+        steps, result = prepared.columns
+        ordered = [columns[name] for name in prepared.variables]
+
+        if rows <= local_max_rows:
+            values, errors = await asyncio.to_thread(
+                evaluate_columns, steps, result, ordered, rows
+            )
+            workflow_string = f"vectorized({len(steps)} steps, {rows} rows)"
+        else:
+            starts = range(0, rows, chunk_rows)
+            chunks = [
+                evaluate_columns_task.s(
+                    steps,
+                    result,
+                    [column[start : start + chunk_rows] for column in ordered],
+                    min(chunk_rows, rows - start),
+                )
+                for start in starts
+            ]
+            outcomes = await self._run_group(chunks)
+            values, errors = [], []
+            for start, outcome in zip(starts, outcomes):
+                if isinstance(outcome, Exception):
+                    raise outcome
+                values.extend(outcome["values"])
+                errors.extend((start + row, error) for row, error in outcome["errors"])
+            workflow_string = (
+                f"group({len(chunks)} x vectorized({len(steps)} steps, "
+                f"{chunk_rows} rows))"
+            )
+
+        logger.info(f"Evaluated {rows} rows with {len(errors)} errors")
+        return EvaluateColumnsResponse(
+            results=values,
+            errors=[ColumnError(row=row, error=error) for row, error in errors],
+            workflow=workflow_string,
+        )
+
+    def _prepared(self, expression_id: str, values: dict) -> PreparedExpression:
+        prepared = self.prepared_expressions.get(expression_id)
+        if prepared is None:
+            raise PreparedExpressionNotFoundError(expression_id)
+        missing = [name for name in prepared.variables if name not in values]
+        if missing:
+            raise VariableBindingError(missing, "Missing values for variables")
+        unknown = [name for name in values if name not in prepared.variables]
+        if unknown:
+            raise VariableBindingError(unknown, "Unknown variables")
+        return prepared
+
+    async def _recall_subtrees(self, compiled: CompiledWorkflow) -> CompiledWorkflow:
+        # Subtrees an earlier workflow already computed become constants, so
+        # the dispatched workflow shrinks as the memo warms
+        if self.subtree_memo is None:
+            return compiled
+        values = await self.subtree_memo.recall(compiled.memo_subtrees)
+        if not values:
+            return compiled
+
+        tree, used = self.batch_planner.substitute(compiled.expression_tree, values)
+        remaining = {
+            key: node
+            for key, node in compiled.memo_subtrees.items()
+            if key not in values
+        }
+        workflow, workflow_string = self.builder.compile(
+            tree, self._memo_links(remaining)
+        )
+        backend, workflow_string = self._remote_backend(
+            tree, workflow, workflow_string
+        )
+        recalled = "; ".join(
+            str(FoldedSubtree(compiled.memo_subtrees[key].to_infix(), values[key]))
+            for key in used
+        )
+        return CompiledWorkflow(
+            tree,
+            workflow,
+            f"recalled({recalled}) -> {workflow_string}",
+            self.builder.critical_path_hops(workflow),
+            compiled.canonical_key,
+            remaining,
+            *self._plan_common_subtrees(tree, workflow),
+            backend,
+        )
+
+    def _local_operations(self, tree: ExpressionNode | float | int) -> int | None:
+        # Routes by size: the operation count of a tree small enough to
+        # evaluate in-process, None for one the workers should get
+        if self.local_executor is None or not isinstance(tree, ExpressionNode):
+            return None
+        operations = self.batch_planner.operation_counts(tree)[id(tree)]
+        return operations if self.local_executor.accepts(operations) else None
+
+    def _remote_backend(
+        self, tree, workflow: Signature | float | int, workflow_string: str
+    ) -> tuple[ExecutionBackend, str]:
+        # With the DAG executor, whatever would go out as a workflow goes out
+        # as the DAG of the same tree instead
+        if self.dag_executor is None or not isinstance(workflow, Signature):
+            return self.celery_backend, workflow_string
+        nodes, workflow_string = self.builder.compile_dag(tree)
+        return DagBackend(self.dag_executor, self.result_waiter, nodes), workflow_string
+
+    def _plan_common_subtrees(
+        self, tree: ExpressionNode | float | int, workflow: Signature | float | int
+    ) -> tuple[list[SharedSubtree], list[Signature], PreparedWorkflow | None]:
+        # A DAG computes every distinct subtree once anyway
+        if not self.common_subtree_elimination or self.dag_executor is not None:
+            return [], [], None
+        shared: list[SharedSubtree] = []
+        workflows: list[Signature] = []
+        for subtree in self.batch_planner.shared_subtrees([tree]):
+            shared_workflow = self.builder.compile(subtree.node)[0]
+            # A subtree the folder evaluates in-process is not worth a stage
+            if isinstance(shared_workflow, Signature):
+                shared.append(subtree)
+                workflows.append(shared_workflow)
+        if not shared:
+            return [], [], None
+
+        # Stage two is prepared like an expression whose variables are the
+        # shared subtrees, so each request only binds their values. Like any
+        # template, it links no memo subtrees. One the folder evaluates whole
+        # is compiled per request instead: folding beats a dispatch
+        variables = {
+            subtree.key: Variable(index, f"shared{index}")
+            for index, subtree in enumerate(shared)
+        }
+        stage_two_tree, _ = self.batch_planner.substitute(tree, variables)
+        folder = self.builder.folder
+        if folder is not None and folder.folds_whole(stage_two_tree):
+            stage_two = None
+        else:
+            stage_two = self.builder.prepare(stage_two_tree)
+
+        stage_two_workflow = stage_two.template if stage_two is not None else None
+        if not self._stage_one_pays_off(workflow, workflows, stage_two_workflow):
+            return [], [], None
+        return shared, workflows, stage_two
+
+    def _stage_one_pays_off(
+        self,
+        workflow: Signature | float | int,
+        stage_one: list[Signature],
+        stage_two: Signature | float | int | None,
+    ) -> bool:
+        # Stage one is a round trip through the API before stage two starts;
+        # it has to save the workers more than the hops it adds to the path
+        tasks_saved = (
+            self.builder.task_count(workflow)
+            - self.builder.task_count(stage_two)
+            - sum(self.builder.task_count(shared) for shared in stage_one)
+        )
+        hops_added = (
+            max(self.builder.critical_path_hops(shared) for shared in stage_one)
+            + self.builder.critical_path_hops(stage_two)
+            - self.builder.critical_path_hops(workflow)
+        )
+        hop_latency = (
+            self.planner.hop_latency_seconds
+            if self.planner is not None
+            else FUSION_HOP_LATENCY_SECONDS
+        )
+        return tasks_saved * COMMON_SUBTREE_TASK_COST_SECONDS > hops_added * hop_latency
+
+    async def _eliminate_common_subtrees(
+        self, compiled: CompiledWorkflow
+    ) -> tuple[Signature | float | int, str]:
+        # Stage one evaluates every repeated subtree once; stage two binds
+        # their values at each occurrence
+        results = await self._run_group(
+            compiled.shared_workflows, RESULT_TIMEOUT_SECONDS
+        )
+        if compiled.shared_stage_two is None:
+            values = {
+                subtree.key: result
+                for subtree, result in zip(compiled.shared_subtrees, results)
+            }
+            tree, _ = self.batch_planner.substitute(compiled.expression_tree, values)
+            workflow, workflow_string = self.builder.compile(tree)
+        else:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            workflow, workflow_string = self.builder.bind(
+                compiled.shared_stage_two, results
+            )
+
+        tasks_after = self.builder.task_count(workflow) + sum(
+            self.builder.task_count(shared) for shared in compiled.shared_workflows
+        )
+        tasks_before = self.builder.task_count(compiled.workflow)
+        shown = "; ".join(
+            str(FoldedSubtree(subtree.node.to_infix(), result))
+            for subtree, result in zip(compiled.shared_subtrees, results)
+        )
+        return workflow, (
+            f"cse({tasks_before} -> {tasks_after} tasks) -> "
+            f"shared({shown}) -> {workflow_string}"
+        )
+
+    def _memo_links(self, subtrees: dict[str, ExpressionNode]) -> dict[int, str]:
+        # Only a shared L2 lets a worker hand a subtree value to later requests
+        if not RESULT_CACHE_L2_ENABLED:
+            return {}
+        return {id(node): key for key, node in subtrees.items()}
+
+    async def _execute(self, compiled: CompiledWorkflow) -> tuple[int | float, str]:
+        started = time.perf_counter()
+        final_result, workflow_string = await compiled.backend.run(
+            compiled, RESULT_TIMEOUT_SECONDS
+        )
+        if self.result_cache is not None and isinstance(
+            compiled.workflow, Signature
+        ):
+            await self.result_cache.set(
+                compiled.canonical_key, final_result, time.perf_counter() - started
+            )
+        return final_result, workflow_string
+
+    async def _peek_result(
+        self, compiled: CompiledWorkflow
+    ) -> tuple[int | float, str] | None:
+        if self.result_cache is None:
+            return None
+        hit = await self.result_cache.get(compiled.canonical_key)
+        return (hit[0], compiled.workflow_string) if hit is not None else None
+
+    async def calculate_batch(
+        self, expressions: list[str]
+    ) -> tuple[list[CalculateExpressionResponse | Exception], str]:
+        # Identical expressions (after canonicalization) are evaluated once and
+        # every distinct workflow goes out in a single group
+        if sum(map(len, expressions)) >= COMPILE_IN_THREAD_MIN_CHARS:
+            outcomes, compiled_by_expression = await asyncio.to_thread(
+                self._compile_batch, expressions
+            )
+        else:
+            outcomes, compiled_by_expression = self._compile_batch(expressions)
+
+        distinct = list(
+            {id(c): c for c in compiled_by_expression.values()}.values()
+        )
+        shared = self.batch_planner.shared_subtrees(
+            [compiled.expression_tree for compiled in distinct]
+        )
+
+        batch_string = f"group({len(distinct)} workflows)"
+        shared_values: dict[str, int | float | Exception] = {}
+        shared_strings: dict[str, str] = {}
+        if shared:
+            # Stage one evaluates subtrees that appear in several expressions
+            stage_one = [self.builder.compile(subtree.node)[0] for subtree in shared]
+            results = await self._run_group(stage_one)
+            for subtree, result in zip(shared, results):
+                shared_values[subtree.key] = result
+                if not isinstance(result, Exception):
+                    shared_strings[subtree.key] = str(
+                        FoldedSubtree(subtree.node.to_infix(), result)
+                    )
+            batch_string = f"group({len(shared)} shared subtrees) -> {batch_string}"
+
+        workflows: list[Signature | float | int] = []
+        workflow_strings: list[str] = []
+        responses: dict[int, CalculateExpressionResponse | Exception] = {}
+        for compiled in distinct:
+            try:
+                tree, used = self.batch_planner.substitute(
+                    compiled.expression_tree, shared_values
+                )
+            except Exception as e:
+                responses[id(compiled)] = e
+                continue
+
+            if used:
+                workflow, workflow_string = self.builder.compile(tree)
+                shown = "; ".join(shared_strings[key] for key in used)
+                workflow_string = f"shared({shown}) -> {workflow_string}"
+            else:
+                workflow, workflow_string = compiled.workflow, compiled.workflow_string
+            workflows.append(workflow)
+            workflow_strings.append(workflow_string)
+            responses[id(compiled)] = None
+
+        pending = [key for key, value in responses.items() if value is None]
+        results = await self._run_group(workflows)
+        for key, result, workflow_string in zip(pending, results, workflow_strings):
+            if isinstance(result, Exception):
+                responses[key] = result
+            else:
+                responses[key] = CalculateExpressionResponse(
+                    result=result, workflow=workflow_string
+                )
+
+        for expression, compiled in compiled_by_expression.items():
+            outcomes[expression] = responses[id(compiled)]
+
+        logger.info(
+            f"Batch of {len(expressions)} expressions evaluated as {batch_string}"
+        )
+        return [outcomes[expression] for expression in expressions], batch_string
+
+    def _compile_batch(
+        self, expressions: list[str]
+    ) -> tuple[
+        dict[str, CalculateExpressionResponse | Exception],
+        dict[str, CompiledWorkflow],
+    ]:
+        # Outcomes so far (compile errors) and the compiled distinct expressions
+        outcomes: dict[str, CalculateExpressionResponse | Exception] = {}
+        compiled_by_expression: dict[str, CompiledWorkflow] = {}
+        for expression in dict.fromkeys(expressions):
+            try:
+                compiled_by_expression[expression] = self.compile(expression)
+            except Exception as e:
+                outcomes[expression] = e
+        return outcomes, compiled_by_expression
+
+    async def calculate_stream(
+        self,
+        expressions: AsyncIterable[str],
+        max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+    ) -> AsyncIterator[tuple[int, str, CalculateExpressionResponse | Exception]]:
+        # Yields (index, expression, outcome) in completion order; the input is
+        # only read while fewer than max_in_flight workflows are outstanding
+        in_flight: set[asyncio.Task] = set()
+        try:
+            index = 0
+            async for expression in expressions:
+                if len(in_flight) >= max_in_flight:
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.add(
+                    asyncio.create_task(self._calculate_item(index, expression))
+                )
+                index += 1
+
+                for task in [task for task in in_flight if task.done()]:
+                    in_flight.discard(task)
+                    yield task.result()
+
+            while in_flight:
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            # The client went away or the input failed; stop outstanding work
+            for task in in_flight:
+                task.cancel()
+
+    async def _calculate_item(
+        self, index: int, expression: str
+    ) -> tuple[int, str, CalculateExpressionResponse | Exception]:
+        try:
+            return index, expression, await self.calculate(expression)
+        except Exception as e:
+            return index, expression, e
+
+    async def _run_group(
+        self,
+        workflows: list[Signature | float | int],
+        timeout: float = BATCH_RESULT_TIMEOUT_SECONDS,
+    ) -> list[int | float | Exception]:
+        results: list[int | float | Exception] = list(workflows)
+        indexes = [
+            index
+            for index, workflow in enumerate(workflows)
+            if isinstance(workflow, Signature)
+        ]
+        if not indexes:
+            return results
+
+        # Cached templates are shared between requests; dispatch copies
+        signatures = [workflows[index].clone() for index in indexes]
+        group_result = group(signatures).apply_async()
+        values = await asyncio.gather(
+            *(
+                self.result_waiter.wait(child, timeout)
+                for child in group_result.results
+            ),
+            return_exceptions=True,
+        )
+        for index, value in zip(indexes, values):
+            results[index] = value
+        return results
+
+    def compile(self, expression: str) -> CompiledWorkflow:
+        # Identical text skips the parser; a different spelling of the same
+        # expression (spacing, operand order of + and *) skips the builder
+        text_key = ("text", REGEX_SPACES.sub("", expression))
+        compiled = self.workflow_cache.get(text_key)
+        if compiled is not None:
+            return compiled
+
+        # The array form is enough for the key; only a miss makes the tree the
+        # optimization passes and planners still walk
+        compact = self.parser.parse_compact(expression)
+        canonical = self.builder.canonical_key(compact)
+        compiled = self.workflow_cache.get(("canonical", canonical))
+        if compiled is None:
+            parsed = compact.to_tree()
+            local_operations = self._local_operations(parsed)
+            memo_subtrees = (
+                self.subtree_memo.select(parsed)
+                if self.subtree_memo is not None and local_operations is None
+                else {}
+            )
+            workflow, workflow_str = self.builder.compile(
+                parsed, self._memo_links(memo_subtrees)
+            )
+            if local_operations is not None and isinstance(workflow, Signature):
+                # The workflow is still built for batches, which send every
+                # expression out in one group
+                backend = LocalBackend(self.local_executor, local_operations)
+                shared = ([], [], None)
+                workflow_str = f"local({local_operations} operations)"
+            else:
+                backend, workflow_str = self._remote_backend(
+                    parsed, workflow, workflow_str
+                )
+                shared = self._plan_common_subtrees(parsed, workflow)
+            compiled = CompiledWorkflow(
+                parsed,
+                workflow,
+                workflow_str,
+                self.builder.critical_path_hops(workflow),
+                canonical,
+                memo_subtrees,
+                *shared,
+                backend,
+            )
+            self.workflow_cache.set(("canonical", canonical), compiled)
+
+        self.workflow_cache.set(text_key, compiled)
+        return compiled
+
+    async def close(self) -> None:
+        await self.result_waiter.close()
+        if self.result_cache is not None:
+            await self.result_cache.close()
+        if self.single_flight is not None:
+            await self.single_flight.close()
+        if self.dag_executor is not None:
+            await self.dag_executor.close()
+        if self.local_executor is not None:
+            self.local_executor.close()
+
+    def metrics(self) -> dict[str, dict]:
+        metrics = {
+            "workflow_cache": self.workflow_cache.stats(),
+            "prepared_expressions": self.prepared_expressions.stats(),
+        }
+        if self.result_cache is not None:
+            metrics["result_cache"] = self.result_cache.stats()
+        if self.single_flight is not None:
+            metrics["single_flight"] = self.single_flight.stats()
+        if self.subtree_memo is not None:
+            metrics["subtree_memo"] = self.subtree_memo.stats()
+        if self.planner is not None:
+            metrics["fusion"] = {
+                "hop_latency_seconds": self.planner.hop_latency_seconds,
+                "op_cost_seconds": self.planner.op_cost_seconds,
+                "worker_concurrency": self.planner.worker_concurrency,
+            }
+        if self.rebalancer is not None:
+            metrics["rebalancer"] = self.rebalancer.stats()
+        if self.dag_executor is not None:
+            metrics["dag_executor"] = self.dag_executor.stats()
+        if self.local_executor is not None:
+            metrics["local_executor"] = self.local_executor.stats()
+        if self.template_cache is not None:
+            stats = self.template_cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            metrics["workflow_templates"] = {
+                **stats,
+                "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+            }
+        return metrics
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Callable
+
+from redis import asyncio as aioredis
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# SET with TTL, then index the key by write time and drop the oldest entries
+# beyond the cap so the keyspace stays bounded next to the result backend
+L2_SET_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3] - ARGV[2])
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local evicted = redis.call('ZPOPMIN', KEYS[2], overflow)
+    for i = 1, #evicted, 2 do
+        redis.call('DEL', evicted[i])
+    end
+end
+"""
+
+
+class ResultCache:
+    # Final results of deterministic expressions, keyed by canonical hash:
+    # an in-process LRU in front of a TTL'd, size-capped Redis keyspace
+    def __init__(
+        self,
+        l1_max_size: int,
+        ttl_seconds: float,
+        redis_url: str | None = None,
+        l2_max_entries: int = 0,
+        key_prefix: str = "result-cache:",
+        l2_retry_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.l1 = LRUCache(l1_max_size, ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.redis_url = redis_url
+        self.l2_max_entries = l2_max_entries
+        self.key_prefix = key_prefix
+        self.l2_retry_seconds = l2_retry_seconds
+        self._clock = clock
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: aioredis.Redis | None = None
+        self._set_script = None
+        self._l2_unavailable_until = 0.0
+
+        self._lock = threading.Lock()
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+        self.misses = 0
+        self.mean_miss_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    async def get(self, key: str) -> tuple[int | float, str] | None:
+        # Returns (value, tier) on a hit
+        started = self._clock()
+        value = self.l1.get(key)
+        if value is not None:
+            self._record_hit(started)
+            return value, "l1"
+
+        client = self._l2_client()
+        if client is not None:
+            try:
+                stored = await client.get(self.key_prefix + key)
+            except Exception as e:
+                self._l2_failed(e)
+                stored = None
+            else:
+                with self._lock:
+                    if stored is None:
+                        self.l2_misses += 1
+                    else:
+                        self.l2_hits += 1
+            if stored is not None:
+                value = json.loads(stored)
+                self.l1.set(key, value)
+                self._record_hit(started)
+                return value, "l2"
+
+        return None
+
+    async def get_many(self, keys: list[str]) -> dict[str, int | float]:
+        # Values for whichever keys are cached; L2 misses share one MGET. The
+        # callers (subtree memo probes) keep their own statistics, so these
+        # lookups stay out of the hit ratio
+        found: dict[str, int | float] = {}
+        missing: list[str] = []
+        for key in keys:
+            value = self.l1.peek(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        client = self._l2_client() if missing else None
+        if client is None:
+            return found
+        try:
+            stored = await client.mget([self.key_prefix + key for key in missing])
+        except Exception as e:
+            self._l2_failed(e)
+            return found
+
+        for key, value in zip(missing, stored):
+            if value is None:
+                continue
+            found[key] = json.loads(value)
+            self.l1.set(key, found[key])
+        return found
+
+    async def set(self, key: str, value: int | float, elapsed_seconds: float) -> None:
+        # elapsed_seconds is what computing the value cost; a later hit saves it
+        with self._lock:
+            self.misses += 1
+            self.mean_miss_seconds += (
+                elapsed_seconds - self.mean_miss_seconds
+            ) / self.misses
+        self.l1.set(key, value)
+
+        client = self._l2_client()
+        if client is None:
+            return
+        try:
+            await self._set_script(
+                keys=[self.key_prefix + key, f"{self.key_prefix}index"],
+                args=[
+                    json.dumps(value),
+                    max(1, int(self.ttl_seconds)),
+                    time.time(),
+                    self.l2_max_entries,
+                ],
+            )
+        except Exception as e:
+            self._l2_failed(e)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._loop = self._client = self._set_script = None
+
+    def stats(self) -> dict:
+        l1 = self.l1.stats()
+        with self._lock:
+            hits = l1["hits"] + self.l2_hits
+            lookups = l1["hits"] + l1["misses"]
+            return {
+                "l1": l1,
+                "l2_hits": self.l2_hits,
+                "l2_misses": self.l2_misses,
+                "l2_errors": self.l2_errors,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "mean_miss_seconds": self.mean_miss_seconds,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def _record_hit(self, started: float) -> None:
+        lookup_seconds = self._clock() - started
+        with self._lock:
+            self.saved_seconds += max(0.0, self.mean_miss_seconds - lookup_seconds)
+
+    def _l2_client(self) -> aioredis.Redis | None:
+        if self.redis_url is None or self._clock() < self._l2_unavailable_until:
+            return None
+
+        # Redis connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = aioredis.Redis.from_url(self.redis_url)
+            self._set_script = self._client.register_script(L2_SET_SCRIPT)
+        return self._client
+
+    def _l2_failed(self, error: Exception) -> None:
+        # Serve from L1 only for a while instead of paying a failed round trip
+        # on every request
+        logger.warning(f"Result cache L2 unavailable: {str(error)}")
+        with self._lock:
+            self.l2_errors += 1
+        self._l2_unavailable_until = self._clock() + self.l2_retry_seconds
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+
+from celery import Celery, states
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult, EagerResult
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+
+class ResultWaiter:
+    # Awaits workflow results over the Redis backend's pub/sub channels, so an
+    # in-flight request costs a future instead of a blocked threadpool thread
+    def __init__(self, celery_app: Celery, redis_url: str):
+        self.celery_app = celery_app
+        self.redis_url = redis_url
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: aioredis.Redis | None = None
+        self._pubsub = None
+        self._reader: asyncio.Task | None = None
+        self._waiters: dict[bytes, asyncio.Future] = {}
+
+    async def wait(self, result: AsyncResult, timeout: float) -> int | float:
+        if isinstance(result, EagerResult):
+            return result.get(timeout=timeout)
+
+        self._bind_to_running_loop()
+        backend = self.celery_app.backend
+        channel = backend.get_key_for_task(result.id)
+        future = self._loop.create_future()
+        self._waiters[channel] = future
+
+        try:
+            await self._pubsub.subscribe(channel)
+            if self._reader is None or self._reader.done():
+                self._reader = self._loop.create_task(self._read_messages())
+
+            # The workflow may have finished before the subscription was active
+            stored = await self._client.get(channel)
+            if stored is not None:
+                self._resolve(channel, stored)
+
+            meta = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CeleryTimeoutError("The operation timed out.")
+        finally:
+            self._waiters.pop(channel, None)
+            await self._unsubscribe(channel)
+
+        if meta["status"] == states.SUCCESS:
+            return meta["result"]
+        raise backend.exception_to_python(meta["result"])
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+        self._loop = self._client = self._pubsub = self._reader = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._waiters)
+
+    def _bind_to_running_loop(self) -> None:
+        # Redis connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._client = aioredis.Redis.from_url(self.redis_url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._reader = None
+
+    async def _read_messages(self) -> None:
+        try:
+            while True:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    self._resolve(message["channel"], message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Result subscription failed: {str(e)}")
+            # Reconnect on the next wait, after closing the failed connections
+            pubsub, client = self._pubsub, self._client
+            self._loop = None
+            for future in self._waiters.values():
+                if not future.done():
+                    future.set_exception(e)
+            await self._discard(pubsub, client)
+
+    async def _discard(self, pubsub, client: aioredis.Redis) -> None:
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close the result subscription: {str(e)}")
+
+    def _resolve(self, channel: bytes, payload: bytes) -> None:
+        future = self._waiters.get(channel)
+        if future is None or future.done():
+            return
+
+        # Progress updates such as STARTED are published on the same channel
+        meta = self.celery_app.backend.decode_result(payload)
+        if meta["status"] in states.READY_STATES:
+            future.set_result(meta)
+
+    async def _unsubscribe(self, channel: bytes) -> None:
+        try:
+            await self._pubsub.unsubscribe(channel)
+        except Exception as e:
+            logger.warning(f"Failed to unsubscribe from {channel!r}: {str(e)}")
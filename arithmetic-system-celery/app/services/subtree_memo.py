@@ -0,0 +1,76 @@
+import logging
+import threading
+
+from .batch_planner import BatchPlanner
+from .expression_parser import ExpressionNode
+from .result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class SubtreeMemo:
+    # Values of subtrees computed by earlier workflows. A subtree's canonical
+    # digest equals the result cache key of the same expression on its own,
+    # so stored subtrees and whole results share one keyspace
+    def __init__(
+        self,
+        batch_planner: BatchPlanner,
+        result_cache: ResultCache,
+        min_operations: int,
+        max_subtrees: int,
+    ):
+        self.batch_planner = batch_planner
+        self.result_cache = result_cache
+        self.min_operations = min_operations
+        self.max_subtrees = max_subtrees
+
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def select(self, tree: ExpressionNode | float | int) -> dict[str, ExpressionNode]:
+        # The largest proper subtrees worth remembering, by digest; the root
+        # itself is already covered by the result cache
+        if not isinstance(tree, ExpressionNode):
+            return {}
+
+        digests = self.batch_planner.builder.subtree_digests(tree)
+        sizes = self.batch_planner.operation_counts(tree)
+        candidates: dict[str, ExpressionNode] = {}
+        stack = [child for child in (tree.left, tree.right)]
+        while stack:
+            current = stack.pop()
+            if not isinstance(current, ExpressionNode):
+                continue
+            if sizes[id(current)] < self.min_operations:
+                continue
+            key = digests.get(id(current))
+            if key is not None:
+                candidates.setdefault(key, current)
+            stack.extend((current.left, current.right))
+
+        largest = sorted(
+            candidates.items(), key=lambda item: sizes[id(item[1])], reverse=True
+        )
+        return dict(largest[: self.max_subtrees])
+
+    async def recall(
+        self, subtrees: dict[str, ExpressionNode]
+    ) -> dict[str, int | float]:
+        if not subtrees:
+            return {}
+        values = await self.result_cache.get_many(list(subtrees))
+        with self._lock:
+            self.lookups += len(subtrees)
+            self.hits += len(values)
+        if values:
+            logger.info(f"Recalled {len(values)} of {len(subtrees)} subtrees")
+        return values
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+            }
@@ -0,0 +1,287 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+from .chain_rewriter import factors_regroupable, terms_regroupable
+from .expression_parser import ExpressionNode, OperationEnum
+
+logger = logging.getLogger(__name__)
+
+# (operation, inverse) of each family; the operands of a region of one family
+# can be regrouped as long as each keeps its sign
+_FAMILIES = {
+    OperationEnum.ADD: (OperationEnum.ADD, OperationEnum.SUB),
+    OperationEnum.SUB: (OperationEnum.ADD, OperationEnum.SUB),
+    OperationEnum.MUL: (OperationEnum.MUL, OperationEnum.DIV),
+    OperationEnum.DIV: (OperationEnum.MUL, OperationEnum.DIV),
+}
+_COMMUTATIVE = (OperationEnum.ADD, OperationEnum.MUL)
+
+
+@dataclass(frozen=True)
+class RebalanceReport:
+    depth_before: int
+    depth_after: int
+    estimated_seconds_saved: float
+
+    def __str__(self) -> str:
+        return (
+            f"rebalanced(depth {self.depth_before} -> {self.depth_after}, "
+            f"~{self.estimated_seconds_saved * 1e3:.1f}ms)"
+        )
+
+
+class TreeRebalancer:
+    # Depth is counted the way the builder dispatches: a run of one
+    # commutative operation is a single aggregation, any other node one hop.
+    # Operands of an ADD/SUB or MUL/DIV region are regrouped shallowest first,
+    # so deep operands join the result as late as possible. A divisor's own
+    # divisors are left in place, moving them to the numerator would skip
+    # their zero check, and a region is only regrouped when the chain
+    # rewriter could regroup its terms or factors
+    def __init__(self, hop_latency_seconds: float):
+        self.hop_latency_seconds = hop_latency_seconds
+
+        self._lock = threading.Lock()
+        self.trees = 0
+        self.rebalanced = 0
+        self.depth_saved = 0
+
+    def rebalance(
+        self, node: ExpressionNode | int | float
+    ) -> tuple[ExpressionNode | int | float, RebalanceReport]:
+        # Subtrees that are already as shallow are returned as the same objects
+        if not isinstance(node, ExpressionNode):
+            return node, RebalanceReport(0, 0, 0.0)
+
+        depths = self._measure_tree(node)
+        # Nodes built along the way stay referenced until the pass is done, so
+        # their ids in depths cannot be reused
+        created: list[ExpressionNode] = []
+        rewritten: dict[int, ExpressionNode | int | float] = {}
+        stack: list[tuple[ExpressionNode, list | None]] = [(node, None)]
+
+        while stack:
+            current, terms = stack.pop()
+            if id(current) in rewritten:
+                continue
+            if terms is None:
+                terms = self._region(current)
+                stack.append((current, terms))
+                stack.extend(
+                    (operand, None)
+                    for _, operand in terms
+                    if isinstance(operand, ExpressionNode)
+                    and id(operand) not in rewritten
+                )
+                continue
+            rewritten[id(current)] = self._rebuild(
+                current, terms, rewritten, depths, created
+            )
+
+        result = rewritten[id(node)]
+        before = self._depth(depths, node)
+        after = self._depth(depths, result)
+        saved = max(0, before - after)
+        with self._lock:
+            self.trees += 1
+            if saved:
+                self.rebalanced += 1
+                self.depth_saved += saved
+        if saved:
+            logger.info(f"Rebalanced tree: depth {before} -> {after}")
+        return result, RebalanceReport(
+            before, after, saved * self.hop_latency_seconds
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "trees": self.trees,
+                "rebalanced": self.rebalanced,
+                "depth_saved": self.depth_saved,
+                "estimated_seconds_saved": self.depth_saved
+                * self.hop_latency_seconds,
+            }
+
+    def _region(
+        self, node: ExpressionNode
+    ) -> list[tuple[bool, ExpressionNode | int | float]]:
+        # Operands of the same-family region rooted at node, left to right, as
+        # (inverted, operand); a node shared within the region is an operand
+        forward, inverse = _FAMILIES[node.operation]
+        terms: list[tuple[bool, ExpressionNode | int | float]] = []
+        expanded: set[int] = set()
+        stack: list[tuple[ExpressionNode | int | float, bool]] = [(node, False)]
+        while stack:
+            current, inverted = stack.pop()
+            expand = (
+                isinstance(current, ExpressionNode)
+                and current.operation in (forward, inverse)
+                and id(current) not in expanded
+                and not (inverted and current.operation == OperationEnum.DIV)
+            )
+            if not expand:
+                terms.append((inverted, current))
+                continue
+            expanded.add(id(current))
+            stack.append((current.right, inverted != (current.operation == inverse)))
+            stack.append((current.left, inverted))
+
+        # The leftmost operand of a region is never inverted
+        kept = [operand for inverted, operand in terms if not inverted]
+        inverted = [operand for inverted, operand in terms if inverted]
+        if forward == OperationEnum.ADD:
+            regroupable = terms_regroupable(kept, inverted)
+        else:
+            regroupable = not inverted or factors_regroupable(
+                kept[0], kept[1:], inverted
+            )
+        if not regroupable:
+            # The children are then regions of their own
+            return [(False, node.left), (node.operation == inverse, node.right)]
+        return terms
+
+    def _rebuild(
+        self,
+        node: ExpressionNode,
+        terms: list[tuple[bool, ExpressionNode | int | float]],
+        rewritten: dict[int, ExpressionNode | int | float],
+        depths: dict[int, tuple[int, int]],
+        created: list[ExpressionNode],
+    ) -> ExpressionNode:
+        operands = [
+            (inverted, rewritten.get(id(operand), operand))
+            for inverted, operand in terms
+        ]
+        changed = any(new is not old for (_, new), (_, old) in zip(operands, terms))
+
+        if len(operands) > 2:
+            regrouped = self._regroup(node.operation, operands, depths, created)
+            if changed or self._depth(depths, regrouped) < self._depth(depths, node):
+                return regrouped
+            return node
+        if not changed:
+            return node
+        return self._node(
+            node.operation, operands[0][1], operands[1][1], depths, created
+        )
+
+    def _regroup(
+        self,
+        operation: OperationEnum,
+        operands: list[tuple[bool, ExpressionNode | int | float]],
+        depths: dict[int, tuple[int, int]],
+        created: list[ExpressionNode],
+    ) -> ExpressionNode | int | float:
+        # Operands of equal depth are combined in one step; the partial result
+        # is carried into the next deeper step. The leftmost operand of a
+        # region is never inverted, so neither is the final result
+        ordered = sorted(operands, key=lambda term: self._depth(depths, term[1]))
+        carried: tuple[bool, ExpressionNode | int | float] | None = None
+        step: list[tuple[bool, ExpressionNode | int | float]] = []
+        for index, term in enumerate(ordered):
+            step.append(term)
+            depth = self._depth(depths, term[1])
+            if index + 1 < len(ordered) and (
+                self._depth(depths, ordered[index + 1][1]) == depth
+            ):
+                continue
+            if carried is not None:
+                step.append(carried)
+            carried = self._combine(operation, step, depths, created)
+            step = []
+        return carried[1]
+
+    def _combine(
+        self,
+        operation: OperationEnum,
+        terms: list[tuple[bool, ExpressionNode | int | float]],
+        depths: dict[int, tuple[int, int]],
+        created: list[ExpressionNode],
+    ) -> tuple[bool, ExpressionNode | int | float]:
+        forward, inverse = _FAMILIES[operation]
+        kept = [operand for inverted, operand in terms if not inverted]
+        inverted = [operand for inverted, operand in terms if inverted]
+        if not inverted:
+            return False, self._run(forward, kept, depths, created)
+        if not kept:
+            return True, self._run(forward, inverted, depths, created)
+        return False, self._node(
+            inverse,
+            self._run(forward, kept, depths, created),
+            self._run(forward, inverted, depths, created),
+            depths,
+            created,
+        )
+
+    def _run(
+        self,
+        operation: OperationEnum,
+        operands: list[ExpressionNode | int | float],
+        depths: dict[int, tuple[int, int]],
+        created: list[ExpressionNode],
+    ) -> ExpressionNode | int | float:
+        # Balanced, so evaluators that do not flatten runs also stay shallow
+        while len(operands) > 1:
+            paired = [
+                self._node(operation, left, right, depths, created)
+                for left, right in zip(operands[::2], operands[1::2])
+            ]
+            if len(operands) % 2:
+                paired.append(operands[-1])
+            operands = paired
+        return operands[0]
+
+    def _node(
+        self,
+        operation: OperationEnum,
+        left: ExpressionNode | int | float,
+        right: ExpressionNode | int | float,
+        depths: dict[int, tuple[int, int]],
+        created: list[ExpressionNode],
+    ) -> ExpressionNode:
+        node = ExpressionNode(operation=operation, left=left, right=right)
+        self._measure(depths, node)
+        created.append(node)
+        return node
+
+    def _measure_tree(self, node: ExpressionNode) -> dict[int, tuple[int, int]]:
+        depths: dict[int, tuple[int, int]] = {}
+        stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if id(current) in depths:
+                continue
+            if not children_done:
+                stack.append((current, True))
+                stack.extend(
+                    (child, False)
+                    for child in (current.left, current.right)
+                    if isinstance(child, ExpressionNode) and id(child) not in depths
+                )
+                continue
+            self._measure(depths, current)
+        return depths
+
+    @staticmethod
+    def _measure(depths: dict[int, tuple[int, int]], node: ExpressionNode) -> None:
+        # (depth, deepest operand of the run the node belongs to)
+        def operand_depth(child: ExpressionNode | int | float) -> int:
+            if not isinstance(child, ExpressionNode):
+                return 0
+            depth, run = depths[id(child)]
+            if child.operation == node.operation and node.operation in _COMMUTATIVE:
+                return run
+            return depth
+
+        run = max(operand_depth(node.left), operand_depth(node.right))
+        depths[id(node)] = (run + 1, run)
+
+    @staticmethod
+    def _depth(
+        depths: dict[int, tuple[int, int]], node: ExpressionNode | int | float
+    ) -> int:
+        if not isinstance(node, ExpressionNode):
+            return 0
+        return depths[id(node)][0]
@@ -1,68 +1,441 @@
 from celery import group, Signature, chord
 from celery.result import EagerResult, AsyncResult
+import hashlib
 import uuid
-from .expression_parser import ExpressionNode, OperationEnum
+from .cache import LRUCache
+from .chain_rewriter import ChainRewriter
+from .constant_folder import ConstantFolder, FoldedSubtree
+from .dag_planner import DagNode, compile_dag, dag_to_string
+from .evaluator import PROGRAM_INPUT_PREFIX, PROGRAM_OPERATORS, program_to_infix
+from .expression_parser import CompactExpression, ExpressionNode, OperationEnum
+from .fusion_planner import FusedChunk, FusionPlanner
+from .tree_rebalancer import TreeRebalancer
+from .workflow_template import (
+    PreparedWorkflow,
+    TemplateParameter,
+    bind_variables,
+    expression_shape,
+    parameterize,
+)
 import logging
-from app.workers import xsum_task, xprod_task
+from app.workers import (
+    xsum_task,
+    xprod_task,
+    evaluate_subtree_task,
+    store_subtree_result_task,
+)
 from typing import Callable
 from celery.canvas import _chain
 
 logger = logging.getLogger(__name__)
 
+FOLDED_SUBTREES_SHOWN = 10
+PROGRAM_RENDER_LIMIT = 64
+
 
 class WorkflowBuilder:
     def __init__(
         self,
         task_map: dict[OperationEnum, Callable[..., int | float]],
         task_chord_map: dict[OperationEnum, Callable[..., int | float]] = None,
+        folder: ConstantFolder | None = None,
+        planner: FusionPlanner | None = None,
+        max_fan_in: int | None = None,
+        rewriter: ChainRewriter | None = None,
+        rebalancer: TreeRebalancer | None = None,
+        max_string_length: int | None = None,
+        templates: LRUCache | None = None,
+        skip_intermediate_results: bool = False,
     ):
         self.task_map = task_map
         self.task_chord_map = task_chord_map
+        self.folder = folder
+        self.planner = planner
+        self.max_fan_in = max_fan_in
+        self.rewriter = rewriter
+        self.rebalancer = rebalancer
+        self.max_string_length = max_string_length
+        self.templates = templates
+        self.skip_intermediate_results = skip_intermediate_results
 
     def build(self, node) -> tuple[AsyncResult, str]:
-        workflow_or_result = self._build_recursive(node)
-        workflow_string = ""
+        workflow, workflow_string = self.compile(node)
+        return self.dispatch(workflow), workflow_string
+
+    def compile(
+        self, node, memo_links: dict[int, str] | None = None
+    ) -> tuple[Signature | float | int, str]:
+        # memo_links maps id() of subtrees whose value should be stored under
+        # the given key once their part of the workflow completes
+        node, prefix, memo_links = self._optimize(node, memo_links)
+
+        if self.templates is not None and isinstance(node, ExpressionNode) and (
+            not memo_links
+        ):
+            workflow_or_result = self._instantiate(*self._template(node))
+        else:
+            workflow_or_result = self._build_workflow(node, memo_links)
 
+        return workflow_or_result, self._describe(workflow_or_result, prefix)
+
+    def compile_dag(self, node) -> tuple[list[DagNode] | float | int, str]:
+        # The tree compile would build a workflow from, as nodes for the DAG
+        # executor; flattened runs obey the same fan-in limit
+        node, prefix, _ = self._optimize(node)
+        if not isinstance(node, ExpressionNode):
+            return node, self._describe(node, prefix)
+        nodes = compile_dag(node, self.max_fan_in)
+        return nodes, f"{prefix}{dag_to_string(nodes)}"
+
+    def prepare(self, node) -> PreparedWorkflow:
+        # Everything but binding the variables, done once per prepared
+        # expression; the folder leaves subtrees with variables alone
+        node, prefix, _ = self._optimize(node)
+        if not isinstance(node, ExpressionNode):
+            return PreparedWorkflow(None, [node], prefix)
+        return PreparedWorkflow(*self._template(node), prefix)
+
+    def bind(
+        self, prepared: PreparedWorkflow, arguments: list[int | float]
+    ) -> tuple[Signature | float | int, str]:
+        values = bind_variables(prepared.values, arguments)
+        if prepared.template is None:
+            workflow_or_result = values[0]
+        else:
+            workflow_or_result = self._instantiate(prepared.template, values)
+        workflow_string = self._describe(workflow_or_result, prepared.prefix)
+        return workflow_or_result, workflow_string
+
+    def _optimize(
+        self, node, memo_links: dict[int, str] | None = None
+    ) -> tuple[ExpressionNode | float | int, str, dict[int, str] | None]:
+        # The rebalancer and rewriter keep untouched subtrees as the same
+        # objects; the prefix reports what was done for the workflow string
+        report = None
+        if self.rebalancer is not None:
+            node, report = self.rebalancer.rebalance(node)
+        if self.rewriter is not None:
+            node = self.rewriter.rewrite(node)
+
+        folded: list[FoldedSubtree] = []
+        if self.folder is not None:
+            original = node
+            node, folded = self.folder.fold(node)
+            if memo_links:
+                memo_links = self._carry_over(original, node, memo_links)
+
+        prefix = f"{self._folded_to_string(folded)} -> " if folded else ""
+        if report is not None and report.depth_after < report.depth_before:
+            prefix = f"{report} -> {prefix}"
+        return node, prefix, memo_links
+
+    def _describe(
+        self, workflow_or_result: Signature | float | int, prefix: str
+    ) -> str:
         if isinstance(workflow_or_result, (int, float)):
-            task_id = str(uuid.uuid4())
-            async_result = EagerResult(task_id, workflow_or_result, "SUCCESS")
             workflow_string = f"constant({workflow_or_result})"
         elif isinstance(workflow_or_result, Signature):
-            async_result = workflow_or_result.apply_async()
             workflow_string = self._signature_to_string(workflow_or_result)
         else:
             raise TypeError(
                 f"Build process returned an unexpected type: {type(workflow_or_result)}"
             )
 
-        return async_result, workflow_string
-
-    def _build_recursive(self, node) -> Signature | float | int:
-        if isinstance(node, (int, float)):
-            return node
+        return f"{prefix}{workflow_string}"
 
-        if not isinstance(node, ExpressionNode):
+    def _build_workflow(
+        self, node, memo_links: dict[int, str] | None = None
+    ) -> Signature | float | int:
+        if not isinstance(node, (ExpressionNode, int, float)):
             raise TypeError(f"Invalid node type: {type(node)}")
+        if self.planner is not None and isinstance(node, ExpressionNode):
+            # Fused chunks do not line up with subtrees, so nothing is linked
+            workflow = self._build_fused(self.planner.plan(node))
+        else:
+            # Built from the array form; memo links follow their nodes' slots
+            slots: dict[int, int] = {}
+            expression = CompactExpression.from_tree(node, slots)
+            links = {
+                slots[key]: memo_key
+                for key, memo_key in (memo_links or {}).items()
+                if key in slots
+            }
+            workflow = self._build_tree(expression, links)
+        if self.skip_intermediate_results and isinstance(workflow, Signature):
+            self._ignore_intermediate_results(workflow)
+        return workflow
+
+    @staticmethod
+    def _ignore_intermediate_results(workflow: Signature) -> None:
+        # A chain link hands its value to the next link in the message, so
+        # only chord members (read by the join) and the last task (read by
+        # the orchestrator) write their result to the backend. Failures are
+        # still stored and propagated down the chain
+        stack: list[tuple[Signature, bool]] = [(workflow, True)]
+        while stack:
+            sig, stored = stack.pop()
+            if isinstance(sig, chord):
+                stack.extend((task, True) for task in sig.tasks)
+                stack.append((sig.body, stored))
+            elif isinstance(sig, _chain):
+                *links, last = sig.tasks
+                stack.extend((link, False) for link in links)
+                stack.append((last, stored))
+            elif isinstance(sig, group):
+                # A group inside a chain becomes a chord header
+                stack.extend((task, True) for task in sig.tasks)
+            elif not stored:
+                sig.set(ignore_result=True)
+
+    def _template(
+        self, node: ExpressionNode
+    ) -> tuple[Signature | float | int, list[int | float]]:
+        # Expressions that differ only in their constants share one template;
+        # memo links are per subtree, so linked trees are always built
+        shape, values = expression_shape(node)
+        template = self.templates.get(shape) if self.templates is not None else None
+        if template is None:
+            template = self._build_workflow(parameterize(node))
+            if self.templates is not None:
+                self.templates.set(shape, template)
+        return template, values
+
+    @staticmethod
+    def _instantiate(
+        template: Signature | float | int, values: list[int | float]
+    ) -> Signature | float | int:
+        # Copies the signatures, dicts and sequences of the template with each
+        # parameter replaced by its value; the template itself is shared
+        copied: list = [None]
+        stack: list[tuple] = [(template, copied, 0)]
+        while stack:
+            source, target, key = stack.pop()
+            if source is tuple:
+                # Queued below the items of a tuple, so they are all copied
+                target[key] = tuple(target[key])
+            elif isinstance(source, TemplateParameter):
+                target[key] = values[source]
+            elif isinstance(source, dict):
+                copy = type(source).__new__(type(source))
+                if isinstance(source, Signature):
+                    copy.__dict__.update(source.__dict__)
+                target[key] = copy
+                # Reversed, so that keys are inserted in their original order
+                items = list(source.items())
+                stack.extend((value, copy, name) for name, value in reversed(items))
+            elif isinstance(source, (list, tuple)):
+                target[key] = [None] * len(source)
+                if isinstance(source, tuple):
+                    stack.append((tuple, target, key))
+                stack.extend(
+                    (value, target[key], index) for index, value in enumerate(source)
+                )
+            else:
+                target[key] = source
+        return copied[0]
+
+    def _carry_over(
+        self, original, folded, memo_links: dict[int, str]
+    ) -> dict[int, str]:
+        # Folding only replaces subtrees with constants, so the folded tree
+        # still lines up with the original node for node
+        carried: dict[int, str] = {}
+        stack = [(original, folded)]
+        while stack:
+            before, after = stack.pop()
+            if not isinstance(after, ExpressionNode):
+                continue
+            if id(before) in memo_links:
+                carried[id(after)] = memo_links[id(before)]
+            stack.append((before.left, after.left))
+            stack.append((before.right, after.right))
+        return carried
+
+    def _folded_to_string(self, folded: list[FoldedSubtree]) -> str:
+        shown = [str(subtree) for subtree in folded[:FOLDED_SUBTREES_SHOWN]]
+        if len(folded) > FOLDED_SUBTREES_SHOWN:
+            shown.append(f"... {len(folded) - FOLDED_SUBTREES_SHOWN} more")
+        return f"folded({'; '.join(shown)})"
+
+    def dispatch(self, workflow: Signature | float | int) -> AsyncResult:
+        if isinstance(workflow, (int, float)):
+            task_id = str(uuid.uuid4())
+            return EagerResult(task_id, workflow, "SUCCESS")
+
+        return workflow.apply_async()
+
+    def critical_path_hops(self, workflow: Signature | float | int) -> int:
+        # Number of sequential broker round trips before the result is ready
+        if not isinstance(workflow, Signature):
+            return 0
+
+        hops: dict[int, int] = {}
+        stack: list[tuple[Signature, bool]] = [(workflow, False)]
+        while stack:
+            sig, children_done = stack.pop()
+            children = list(sig.tasks) if hasattr(sig, "tasks") else []
+            if isinstance(sig, chord):
+                children.append(sig.body)
+            if not children_done and children:
+                stack.append((sig, True))
+                stack.extend((child, False) for child in children)
+                continue
+
+            if isinstance(sig, chord):
+                header = max((hops[id(task)] for task in sig.tasks), default=0)
+                hops[id(sig)] = header + hops[id(sig.body)]
+            elif isinstance(sig, _chain):
+                hops[id(sig)] = sum(hops[id(task)] for task in sig.tasks)
+            elif children:
+                hops[id(sig)] = max(hops[id(task)] for task in sig.tasks)
+            else:
+                hops[id(sig)] = 1
+
+        return hops[id(workflow)]
+
+    def task_count(self, workflow: Signature | float | int) -> int:
+        # Number of task messages the workflow sends, link callbacks aside
+        tasks = 0
+        stack = [workflow] if isinstance(workflow, Signature) else []
+        while stack:
+            sig = stack.pop()
+            if hasattr(sig, "tasks"):
+                stack.extend(sig.tasks)
+                if isinstance(sig, chord):
+                    stack.append(sig.body)
+            else:
+                tasks += 1
+        return tasks
+
+    def canonical_key(self, expression: CompactExpression) -> str:
+        if expression.operation(expression.root) is None:
+            return repr(expression.constant(expression.root))
+        return self.canonical_digests(expression)[expression.root]
+
+    def canonical_digests(self, expression: CompactExpression) -> list[str | None]:
+        # Digest of every distinct subtree, by slot; constants and slots only
+        # inside a flattened run of the same commutative operation get none
+        digests: list[str | None] = [None] * len(expression)
+        stack: list[tuple[int, list[int] | None]] = [(expression.root, None)]
+
+        while stack:
+            index, operands = stack.pop()
+            if operands is None:
+                operation = expression.operation(index)
+                if operation is None or digests[index] is not None:
+                    continue
+                if operation.is_commutative:
+                    operands = expression.flatten_commutative(index)
+                else:
+                    operands = [expression.left[index], expression.right[index]]
+                stack.append((index, operands))
+                stack.extend(
+                    (operand, None) for operand in operands if digests[operand] is None
+                )
+                continue
+
+            operation = expression.operation(index)
+            parts = [
+                repr(expression.constant(operand))
+                if digests[operand] is None
+                else digests[operand]
+                for operand in operands
+            ]
+            if operation.is_commutative:
+                parts.sort()
+            canonical = f"{operation.name}({','.join(parts)})"
+            digests[index] = hashlib.blake2b(
+                canonical.encode(), digest_size=16
+            ).hexdigest()
+
+        return digests
+
+    def subtree_digests(self, node: ExpressionNode) -> dict[int, str]:
+        # canonical_digests by node id, for the planners that walk trees
+        slots: dict[int, int] = {}
+        digests = self.canonical_digests(CompactExpression.from_tree(node, slots))
+        return {
+            key: digests[index]
+            for key, index in slots.items()
+            if digests[index] is not None
+        }
+
+    def _build_tree(
+        self, expression: CompactExpression, memo_links: dict[int, str] | None = None
+    ) -> Signature | float | int:
+        # Post-order over an explicit stack of slots, so that depth is not
+        # bounded by the recursion limit: a slot is expanded into its
+        # operands, and combined once their workflows are on top of `built`.
+        # memo_links are by slot
+        built: list[Signature | float | int] = []
+        stack: list[tuple[int, list[int] | None]] = [(expression.root, None)]
+
+        while stack:
+            index, operands = stack.pop()
+            if operands is None:
+                if expression.operation(index) is None:
+                    built.append(expression.constant(index))
+                    continue
+                operands = self._operands(expression, index)
+                stack.append((index, operands))
+                stack.extend((operand, None) for operand in reversed(operands))
+                continue
+
+            workflows = built[len(built) - len(operands) :]
+            del built[len(built) - len(operands) :]
+            built.append(
+                self._link_memo(
+                    index, self._combine(expression, index, workflows), memo_links
+                )
+            )
+
+        return built[0]
+
+    @staticmethod
+    def _operands(expression: CompactExpression, index: int) -> list[int]:
+        # A run of one commutative operation is built as a single flat workflow
+        if expression.operation(index).is_commutative:
+            return expression.flatten_commutative(index)
+        return [expression.left[index], expression.right[index]]
 
-        is_left_constant = isinstance(node.left, (int, float))
-        is_right_constant = isinstance(node.right, (int, float))
+    def _link_memo(
+        self,
+        index: int,
+        workflow: Signature | float | int,
+        memo_links: dict[int, str] | None,
+    ) -> Signature | float | int:
+        if memo_links and index in memo_links and isinstance(workflow, Signature):
+            # A link callback gets the subtree's value without delaying the
+            # tasks that consume it; options on a chain itself would be
+            # copied onto every step, so link its last task
+            last = workflow
+            while isinstance(last, _chain):
+                last = last.tasks[-1]
+            last.link(store_subtree_result_task.s(key=memo_links[index]))
+        return workflow
+
+    def _combine(
+        self,
+        expression: CompactExpression,
+        index: int,
+        workflows: list[Signature | float | int],
+    ) -> Signature | float | int:
+        operation = expression.operation(index)
+        is_left_constant = expression.operation(expression.left[index]) is None
+        is_right_constant = expression.operation(expression.right[index]) is None
 
         # Both are constants
         if is_left_constant and is_right_constant:
-            op_task = self.task_map[node.operation]
-            logger.info(f"Building constant workflow for operation: {node.operation}")
-            return op_task.s(node.left, node.right)
+            op_task = self.task_map[operation]
+            logger.debug(f"Building constant workflow for operation: {operation}")
+            return op_task.s(*workflows)
 
         # Both are same operation and commutative
-        if node.operation.is_commutative and (
-            not is_left_constant or not is_right_constant
-        ):
-            return self._build_flat_workflow(node)
-
-        left_workflow = self._build_recursive(node.left)
-        right_workflow = self._build_recursive(node.right)
+        if operation.is_commutative:
+            return self._build_flat_workflow(operation, workflows)
 
-        op_task = self.task_map[node.operation]
+        left_workflow, right_workflow = workflows
+        op_task = self.task_map[operation]
 
         # Left is constant, Right is OperationNode
         if not is_left_constant and is_right_constant:
@@ -73,23 +446,46 @@ class WorkflowBuilder:
             return right_workflow | op_task.s(y=left_workflow, is_left_fixed=True)
 
         # Both are OperationNodes
-        op_chord_task = self.task_chord_map.get(node.operation)
+        op_chord_task = self.task_chord_map.get(operation)
         parallel_tasks = group(left_workflow, right_workflow)
         return chord(parallel_tasks, op_chord_task.s())
 
-    def _build_flat_workflow(self, node: ExpressionNode) -> Signature | float:
-        op_task = self.task_map[node.operation]
-        aggregator_task = (
-            xsum_task if node.operation == OperationEnum.ADD else xprod_task
-        )
+    def _build_fused(self, root: FusedChunk) -> Signature:
+        # A chunk read by several chunks is dispatched under each of them, as
+        # a canvas hands a result to one consumer; within a chunk it is one input
+        built: list[Signature] = []
+        stack: list[tuple[FusedChunk, bool]] = [(root, False)]
+
+        while stack:
+            chunk, inputs_done = stack.pop()
+            if not chunk.inputs:
+                built.append(evaluate_subtree_task.s([], program=chunk.program))
+                continue
+            if not inputs_done:
+                stack.append((chunk, True))
+                stack.extend(
+                    (input_chunk, False) for input_chunk in reversed(chunk.inputs)
+                )
+                continue
 
-        flatten_commutative_nodes = self._flatten_commutative_operands(
-            node, node.operation
-        )
+            input_workflows = built[len(built) - len(chunk.inputs) :]
+            del built[len(built) - len(chunk.inputs) :]
+            fused_task = evaluate_subtree_task.s(program=chunk.program)
+            if len(input_workflows) == 1:
+                built.append(input_workflows[0] | fused_task)
+            else:
+                built.append(chord(group(input_workflows), fused_task))
 
-        child_workflows = [
-            self._build_recursive(sub_node) for sub_node in flatten_commutative_nodes
-        ]
+        return built[0]
+
+    def _build_flat_workflow(
+        self,
+        operation: OperationEnum,
+        child_workflows: list[Signature | float | int],
+    ) -> Signature | float:
+        # child_workflows are the built operands of the flattened run
+        op_task = self.task_map[operation]
+        aggregator_task = xsum_task if operation == OperationEnum.ADD else xprod_task
 
         tasks = [
             workflow for workflow in child_workflows if isinstance(workflow, Signature)
@@ -99,8 +495,15 @@ class WorkflowBuilder:
             for workflow in child_workflows
             if not isinstance(workflow, Signature)
         ]
+        if self.max_fan_in is not None and len(constants) > self.max_fan_in:
+            # Too many constants for one message: aggregate them in parallel
+            tasks.extend(
+                aggregator_task.s(chunk)
+                for chunk in self._balanced_chunks(constants, self.max_fan_in)
+            )
+            constants = []
 
-        identity = 0.0 if node.operation == OperationEnum.ADD else 1.0
+        identity = 0.0 if operation == OperationEnum.ADD else 1.0
         num_tasks = len(tasks)
         num_constants = len(constants)
 
@@ -125,55 +528,84 @@ class WorkflowBuilder:
             return chord(header=group(tasks), body=aggregator_task.s())
 
         # Case: Multiple tasks
+        if num_constants > 1:
+            tasks.append(aggregator_task.s(constants))
+        header = group(self._reduce_to_fan_in(tasks, aggregator_task))
         if num_constants == 1:
-            return chord(header=group(tasks), body=aggregator_task.s()) | op_task.s(
+            return chord(header=header, body=aggregator_task.s()) | op_task.s(
                 y=constants[0]
             )
-        if num_constants > 1:
-            tasks.append(aggregator_task.s(constants))
-            return chord(header=group(tasks), body=aggregator_task.s())
-
-        return chord(header=group(tasks), body=aggregator_task.s())
+        return chord(header=header, body=aggregator_task.s())
+
+    def _reduce_to_fan_in(
+        self, tasks: list[Signature], aggregator_task
+    ) -> list[Signature]:
+        # Balanced k-ary tree of partial aggregations: no chord joins more
+        # than max_fan_in members, and each level runs in parallel
+        if self.max_fan_in is None:
+            return tasks
+        while len(tasks) > self.max_fan_in:
+            tasks = [
+                chord(header=group(chunk), body=aggregator_task.s())
+                if len(chunk) > 1
+                else chunk[0]
+                for chunk in self._balanced_chunks(tasks, self.max_fan_in)
+            ]
+        return tasks
+
+    @staticmethod
+    def _balanced_chunks(items: list, max_size: int) -> list[list]:
+        # As few chunks as max_size allows, of near-equal size
+        count = -(-len(items) // max_size)
+        size = -(-len(items) // count)
+        return [items[index : index + size] for index in range(0, len(items), size)]
 
-    def _flatten_commutative_operands(
-        self, node, operation: OperationEnum
-    ) -> list[ExpressionNode | float | int]:
-        sub_commutative_expression: list[ExpressionNode | float | int] = []
-
-        if node is None:
-            return sub_commutative_expression
-
-        if not isinstance(node, ExpressionNode) or node.operation != operation:
-            sub_commutative_expression.append(node)
-            return sub_commutative_expression
+    def _signature_to_string(self, sig: Signature) -> str:
+        # Explicit stack of signatures still to render and literal pieces,
+        # joined once; nobody reads megabytes of workflow, so rendering stops
+        # after max_string_length characters
+        pieces: list[str] = []
+        length = 0
+        stack: list[Signature | str] = [sig]
+
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+                length += len(item)
+                if self.max_string_length is not None and (
+                    length > self.max_string_length
+                ):
+                    return "".join(pieces)[: self.max_string_length] + "..."
+                continue
+
+            # Chord
+            if isinstance(item, chord):
+                parts = ["chord([", *self._separated(item.tasks, ", "), "], "]
+                parts.extend((item.body, ")"))
+            # Chain
+            elif isinstance(item, _chain):
+                parts = self._separated(item.tasks, " | ")
+            # Group
+            elif hasattr(item, "tasks"):
+                parts = ["group([", *self._separated(item.tasks, ", "), "])"]
+            # Single Task
+            else:
+                parts = [self._task_to_string(item)]
+            stack.extend(reversed(parts))
 
-        sub_commutative_expression.extend(
-            self._flatten_commutative_operands(node.left, operation)
-        )
-        sub_commutative_expression.extend(
-            self._flatten_commutative_operands(node.right, operation)
-        )
+        return "".join(pieces)
 
-        return sub_commutative_expression
+    @staticmethod
+    def _separated(items, separator: str) -> list:
+        separated = []
+        for item in items:
+            if separated:
+                separated.append(separator)
+            separated.append(item)
+        return separated
 
-    def _signature_to_string(self, sig: Signature) -> str:
-        # Chord
-        if isinstance(sig, chord):
-            header_tasks = [self._signature_to_string(task) for task in sig.tasks]
-            body_str = self._signature_to_string(sig.body)
-            return f"chord([{', '.join(header_tasks)}], {body_str})"
-
-        # Chain
-        if isinstance(sig, _chain):
-            task_strings = [self._signature_to_string(task) for task in sig.tasks]
-            return " | ".join(task_strings)
-
-        # Group
-        if hasattr(sig, "tasks"):
-            task_strings = [self._signature_to_string(task) for task in sig.tasks]
-            return f"group([{', '.join(task_strings)}])"
-
-        # Single Task
+    def _task_to_string(self, sig: Signature) -> str:
         if hasattr(sig, "task") and sig.task:
             if isinstance(sig.task, str):
                 task_name = sig.task.split(".")[-1]
@@ -224,7 +656,22 @@ class WorkflowBuilder:
                 parts.append(f"{key}={value}")
             elif key in ["is_left_fixed"]:
                 parts.append(f"{key}={value}")
+            elif key == "program" and isinstance(value, list):
+                parts.append(self._format_program(value))
             else:
                 parts.append(f"{key}=?")
 
         return f"({', '.join(parts)})" if parts else ""
+
+    def _format_program(self, program: list[int | float | str]) -> str:
+        # Inputs ($0, $1, ...) are the cut points where upstream chunks feed in
+        if len(program) <= PROGRAM_RENDER_LIMIT:
+            return f"program={program_to_infix(program)}"
+
+        operations = sum(1 for token in program if token in PROGRAM_OPERATORS)
+        inputs = [
+            token
+            for token in program
+            if isinstance(token, str) and token.startswith(PROGRAM_INPUT_PREFIX)
+        ]
+        return f"program=<{operations} ops over {', '.join(inputs) or 'constants'}>"
@@ -0,0 +1,95 @@
+import hashlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from .expression_parser import ExpressionNode, Variable
+
+
+class TemplateParameter(int):
+    # Stands in for the n-th constant of an expression shape while the
+    # shape's template is built. Being a number, the builder handles it like
+    # any constant; being an int, a float() of it is still told apart in
+    # serialized inputs
+    __slots__ = ()
+
+
+@dataclass(frozen=True)
+class PreparedWorkflow:
+    # A workflow but for its variables: the template of the optimized tree
+    # (None when the tree is a single leaf), the values of the template's
+    # parameters with Variables among them, and the workflow string prefix
+    # reporting the optimizations
+    template: object
+    values: list[int | float]
+    prefix: str
+
+
+def bind_variables(
+    values: list[int | float], arguments: list[int | float]
+) -> list[int | float]:
+    # arguments are the variable values in order of the variables' indexes
+    return [
+        arguments[value] if isinstance(value, Variable) else value
+        for value in values
+    ]
+
+
+def expression_shape(node: ExpressionNode) -> tuple[str, list[int | float]]:
+    # Digest of the tree with its constants abstracted, shared subtrees
+    # included, and the constants in the order of their parameters
+    tokens: list[str] = []
+    values: list[int | float] = []
+    for item, first in _postfix(node):
+        if first is not None:
+            tokens.append(f"@{first}")
+        elif isinstance(item, ExpressionNode):
+            tokens.append(item.operation.name)
+        else:
+            tokens.append("#")
+            values.append(item)
+    digest = hashlib.blake2b(" ".join(tokens).encode(), digest_size=16)
+    return digest.hexdigest(), values
+
+
+def parameterize(node: ExpressionNode) -> ExpressionNode:
+    # The same tree with each constant replaced by the parameter of its
+    # position in expression_shape's values
+    built: list[ExpressionNode | TemplateParameter] = []
+    distinct: list[ExpressionNode] = []
+    parameters = 0
+    for item, first in _postfix(node):
+        if first is not None:
+            built.append(distinct[first])
+        elif isinstance(item, ExpressionNode):
+            right = built.pop()
+            left = built.pop()
+            distinct.append(
+                ExpressionNode(operation=item.operation, left=left, right=right)
+            )
+            built.append(distinct[-1])
+        else:
+            built.append(TemplateParameter(parameters))
+            parameters += 1
+    return built[0]
+
+
+def _postfix(
+    node: ExpressionNode,
+) -> Iterator[tuple[ExpressionNode | int | float, int | None]]:
+    # Operands before their operation; a subtree that was already visited is
+    # yielded again with the position of its first visit among the operations
+    positions: dict[int, int] = {}
+    stack: list[tuple[ExpressionNode | int | float, bool]] = [(node, False)]
+    while stack:
+        current, expanded = stack.pop()
+        if not isinstance(current, ExpressionNode):
+            yield current, None
+        elif id(current) in positions:
+            yield current, positions[id(current)]
+        elif not expanded:
+            stack.append((current, True))
+            stack.append((current.right, False))
+            stack.append((current.left, False))
+        else:
+            positions[id(current)] = len(positions)
+            yield current, None
@@ -27,3 +27,16 @@ class UnsupportedOperatorError(ExpressionError):
         self.operator = operator
         self.message = message
         super().__init__(f"{message}: '{operator}'")
+
+
+class PreparedExpressionNotFoundError(ExpressionError):
+    def __init__(self, expression_id: str):
+        self.expression_id = expression_id
+        super().__init__(f"Unknown prepared expression: '{expression_id}'")
+
+
+class VariableBindingError(ExpressionError):
+    def __init__(self, variables: list[str], message: str):
+        self.variables = variables
+        self.message = message
+        super().__init__(f"{message}: {', '.join(variables)}")
@@ -6,6 +6,10 @@ from .xsum_service import xsum_task
 from .xprod_service import xprod_task
 from .sub_list_service import subtract_list_task
 from .div_list_service import divide_list_task
+from .eval_subtree_service import evaluate_subtree_task
+from .eval_columns_service import evaluate_columns_task
+from .memo_service import store_subtree_result_task
+from .dag_node_service import dag_node_task
 
 __all__ = [
     "add_task",
@@ -16,4 +20,8 @@ __all__ = [
     "xprod_task",
     "subtract_list_task",
     "divide_list_task",
+    "evaluate_subtree_task",
+    "evaluate_columns_task",
+    "store_subtree_result_task",
+    "dag_node_task",
 ]
@@ -0,0 +1,72 @@
+from ..celery import app
+from ..config import DAG_KEY_PREFIX
+from ..services.dag_planner import DAG_COMPLETE_SCRIPT
+from ..services.evaluator import PROGRAM_OPERATORS, apply_operation
+from celery.result import AsyncResult
+from functools import reduce
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="dag_node_task", queue="dag_tasks")
+def dag_node_task(
+    run_id: str,
+    index: int,
+    symbol: str,
+    operands: list[int | float],
+    parents: list[int],
+) -> int | float:
+    # Computes one node of a registered DAG and publishes the parents it was
+    # the last input of; the root's value is the run's result
+    operation = PROGRAM_OPERATORS[symbol]
+    client = app.backend.client
+    key = f"{DAG_KEY_PREFIX}{run_id}"
+    try:
+        value = reduce(
+            lambda left, right: apply_operation(operation, left, right), operands
+        )
+    except Exception as e:
+        logger.error(f"Error in dag_node_task for node {index} of {run_id}: {e}")
+        # The first failure is the run's result; the root is never reached
+        if parents and client.hsetnx(key, "failed", 1):
+            app.backend.mark_as_failure(run_id, e)
+        raise
+
+    if not parents:
+        client.delete(key)
+        return value
+
+    ready = client.register_script(DAG_COMPLETE_SCRIPT)(
+        keys=[key], args=[index, json.dumps(value), *parents]
+    )
+    for parent, spec, *values in ready:
+        parent_symbol, parent_operands, grandparents = json.loads(spec)
+        inputs = iter(values)
+        publish_dag_node(
+            run_id,
+            int(parent),
+            parent_symbol,
+            [
+                json.loads(next(inputs)) if isinstance(operand, str) else operand
+                for operand in parent_operands
+            ],
+            grandparents,
+        )
+    return value
+
+
+def publish_dag_node(
+    run_id: str,
+    index: int,
+    symbol: str,
+    operands: list[int | float],
+    parents: list[int],
+) -> AsyncResult:
+    # The root runs under the run's id, so the backend stores its result where
+    # the orchestrator waits; every other value goes through the run's hash
+    arguments = (run_id, index, symbol, operands, parents)
+    if parents:
+        return dag_node_task.apply_async(arguments, ignore_result=True)
+    return dag_node_task.apply_async(arguments, task_id=run_id)
@@ -0,0 +1,27 @@
+from ..celery import app
+from ..services.column_evaluator import evaluate_columns
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="evaluate_columns_task", queue="eval_tasks")
+def evaluate_columns_task(
+    steps: list[list[int | float | str]],
+    result: int | float | str,
+    columns: list[list[int | float]],
+    rows: int,
+) -> dict:
+    # One chunk of rows; failed rows are reported as [row, error] within it
+    if not isinstance(columns, list):
+        raise TypeError(f"columns must be a list, got {type(columns).__name__}")
+
+    if any(len(column) != rows for column in columns):
+        raise ValueError(f"Every column must have {rows} rows")
+
+    try:
+        values, errors = evaluate_columns(steps, result, columns, rows)
+    except Exception as e:
+        logger.error(f"Error in evaluate_columns_task for {rows} rows: {e}")
+        raise
+    return {"values": values, "errors": errors}
@@ -0,0 +1,24 @@
+from ..celery import app
+from ..services.evaluator import evaluate_program
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="evaluate_subtree_task", queue="eval_tasks")
+def evaluate_subtree_task(
+    inputs: list[int | float] | int | float, program: list[int | float | str]
+) -> float:
+    # A chord body receives the list of header results, a chain link the
+    # single result of the previous task
+    if not isinstance(inputs, list):
+        inputs = [inputs]
+
+    if not isinstance(program, list):
+        raise TypeError(f"program must be a list, got {type(program).__name__}")
+
+    try:
+        return evaluate_program(program, inputs)
+    except Exception as e:
+        logger.error(f"Error in evaluate_subtree_task for {len(program)} tokens: {e}")
+        raise
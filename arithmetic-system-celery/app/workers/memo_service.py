@@ -0,0 +1,31 @@
+from ..celery import app
+from ..config import (
+    RESULT_CACHE_KEY_PREFIX,
+    RESULT_CACHE_L2_MAX_ENTRIES,
+    RESULT_CACHE_TTL_SECONDS,
+)
+from ..services.result_cache import L2_SET_SCRIPT
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="store_subtree_result_task", queue="memo_tasks", ignore_result=True)
+def store_subtree_result_task(value: int | float, key: str) -> None:
+    # Linked to a subtree's workflow, so it runs beside the rest of the
+    # workflow rather than in front of it; losing a write only costs a miss
+    try:
+        client = app.backend.client
+        client.register_script(L2_SET_SCRIPT)(
+            keys=[RESULT_CACHE_KEY_PREFIX + key, f"{RESULT_CACHE_KEY_PREFIX}index"],
+            args=[
+                json.dumps(value),
+                max(1, int(RESULT_CACHE_TTL_SECONDS)),
+                time.time(),
+                RESULT_CACHE_L2_MAX_ENTRIES,
+            ],
+        )
+    except Exception as e:
+        logger.warning(f"Could not store subtree result {key}: {e}")
@@ -0,0 +1,145 @@
+"""Row-by-row vs vectorized evaluation of a prepared expression over columns.
+
+Executing a prepared expression once per row costs a workflow per row; even
+the in-process evaluator still walks the expression once per row. The
+column evaluator runs one NumPy ufunc per operation over whole columns.
+This times, for the same columns: evaluate_program per row, the column
+evaluator in one call, and the column evaluator on chunks spread over a
+process pool, the way long inputs are spread over the eval workers. Rows
+whose divisor is zero are included, so the per-row error path is timed too.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_columns --rows 1000000 --workers 8
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import COLUMNS_CHUNK_ROWS
+from app.services.column_evaluator import compile_columns, evaluate_columns
+from app.services.evaluator import (
+    PROGRAM_INPUT_PREFIX,
+    PROGRAM_OPERATORS,
+    evaluate_program,
+)
+from app.services.expression_parser import ExpressionNode, ExpressionParser, Variable
+
+EXPRESSION = "(price * quantity - discount) / (quantity - 3) + price * 0.2 - 1"
+
+_SYMBOLS = {operation: symbol for symbol, operation in PROGRAM_OPERATORS.items()}
+
+
+def postfix_program(node: ExpressionNode) -> list[int | float | str]:
+    # The scalar evaluator's program, variables read from the row's inputs
+    program: list[int | float | str] = []
+    stack: list[tuple[ExpressionNode | int | float, bool]] = [(node, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if isinstance(current, Variable):
+            program.append(f"{PROGRAM_INPUT_PREFIX}{int(current)}")
+        elif not isinstance(current, ExpressionNode):
+            program.append(current)
+        elif children_done:
+            program.append(_SYMBOLS[current.operation])
+        else:
+            stack.append((current, True))
+            stack.extend(((current.right, False), (current.left, False)))
+    return program
+
+
+def row_by_row(
+    program: list[int | float | str], columns: list[list[float]]
+) -> tuple[list[float | None], int]:
+    results: list[float | None] = []
+    errors = 0
+    for row in zip(*columns):
+        try:
+            results.append(evaluate_program(program, list(row)))
+        except ZeroDivisionError:
+            results.append(None)
+            errors += 1
+    return results, errors
+
+
+def chunked(
+    pool: ProcessPoolExecutor,
+    steps: list,
+    result: int | float | str,
+    columns: list[list[float]],
+    rows: int,
+    chunk_rows: int,
+) -> tuple[list[float | None], int]:
+    futures = [
+        pool.submit(
+            evaluate_columns,
+            steps,
+            result,
+            [column[start : start + chunk_rows] for column in columns],
+            min(chunk_rows, rows - start),
+        )
+        for start in range(0, rows, chunk_rows)
+    ]
+    results: list[float | None] = []
+    errors = 0
+    for future in futures:
+        values, failed = future.result()
+        results.extend(values)
+        errors += len(failed)
+    return results, errors
+
+
+def timed(function, *args) -> tuple[object, float]:
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-rows", type=int, default=COLUMNS_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    tree, variables = ExpressionParser().parse_prepared(EXPRESSION)
+    rng = random.Random(7)
+    columns = [
+        [float(rng.randint(0, 6)) for _ in range(args.rows)] for _ in variables
+    ]
+    steps, result = compile_columns(tree)
+    print(f"{EXPRESSION}: {len(steps)} steps, {args.rows} rows")
+    print(f"{'mode':>12} {'seconds':>9} {'rows/s':>12} {'errors':>8}")
+
+    (expected, errors), seconds = timed(row_by_row, postfix_program(tree), columns)
+    baseline = seconds
+    print(
+        f"{'row-by-row':>12} {seconds:>9.3f} {args.rows / seconds:>12.0f} "
+        f"{errors:>8}"
+    )
+
+    (values, failed), seconds = timed(
+        evaluate_columns, steps, result, columns, args.rows
+    )
+    assert values == expected
+    print(
+        f"{'vectorized':>12} {seconds:>9.3f} {args.rows / seconds:>12.0f} "
+        f"{len(failed):>8}  x{baseline / seconds:.1f}"
+    )
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        # Start the processes before timing
+        list(pool.map(abs, range(args.workers)))
+        (values, errors), seconds = timed(
+            chunked, pool, steps, result, columns, args.rows, args.chunk_rows
+        )
+    assert values == expected
+    print(
+        f"{'chunked':>12} {seconds:>9.3f} {args.rows / seconds:>12.0f} "
+        f"{errors:>8}  x{baseline / seconds:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Memory and time of the dataclass tree vs the compact array form.
+
+An ExpressionNode costs a Python object per operation (and every distinct
+float leaf is another object); CompactExpression keeps opcodes, child
+indices and constants in typed arrays. This parses the same generated
+expression both ways and reports parse time, evaluation time and the
+memory each result keeps alive, measured with tracemalloc.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_compact_expression --operations 1000000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from app.services.evaluator import evaluate, evaluate_compact
+from app.services.expression_parser import ExpressionParser
+
+
+def generated_input(operations: int, seed: int = 7) -> str:
+    # Code-generator style: long mixed runs with float constants and some
+    # parenthesised groups
+    rng = random.Random(seed)
+    parts = [f"{rng.uniform(1, 100):.3f}"]
+    while len(parts) // 2 < operations:
+        operand = f"{rng.uniform(1, 100):.3f}"
+        if rng.random() < 0.2:
+            operand = f"({operand} {rng.choice('+-*')} {rng.uniform(1, 100):.3f})"
+        parts.extend((rng.choice("+-*/"), operand))
+    return " ".join(parts)
+
+
+def measure(parse, expression: str) -> tuple[int, int]:
+    # Separate from the timed run, tracemalloc slows allocation down
+    gc.collect()
+    tracemalloc.start()
+    result = parse(expression)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak
+
+
+def timed(function, *args) -> tuple[object, float]:
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    expression = generated_input(args.operations)
+    expression_parser = ExpressionParser()
+    print(f"{args.operations} operations, {len(expression) / 1e6:.1f} MB of text")
+    print(
+        f"{'form':<10} {'parse s':>8} {'eval s':>8} "
+        f"{'kept MB':>8} {'peak MB':>8} {'B/op':>6}"
+    )
+
+    for label, parse, run in (
+        ("tree", expression_parser.parse, evaluate),
+        ("compact", expression_parser.parse_compact, evaluate_compact),
+    ):
+        retained, peak = measure(parse, expression)
+        result, parse_seconds = timed(parse, expression)
+        _, eval_seconds = timed(run, result)
+        print(
+            f"{label:<10} {parse_seconds:>8.2f} {eval_seconds:>8.2f} "
+            f"{retained / 1e6:>8.1f} {peak / 1e6:>8.1f} "
+            f"{retained / args.operations:>6.0f}"
+        )
+        del result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Concurrent load against /api/calculate on a running deployment.
+
+Start the stack and fire a few thousand overlapping requests at it:
+
+    docker compose up -d
+    uv run python -m benchmarks.bench_concurrent_calculate --concurrency 2000
+
+With the blocking handler the in-flight count is capped by the Starlette
+threadpool (40 threads); the async handler keeps them all in flight.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+def expression_for(i: int) -> str:
+    # Vary the operands so every request dispatches its own workflow
+    return f"({i} + {i % 7}) * ({i % 11} - 3) / 2"
+
+
+async def run(url: str, requests: int, concurrency: int, timeout: float) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors: Counter[str] = Counter()
+    in_flight = peak_in_flight = 0
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=timeout
+    ) as client:
+
+        async def one(i: int) -> None:
+            nonlocal in_flight, peak_in_flight
+            async with semaphore:
+                in_flight += 1
+                peak_in_flight = max(peak_in_flight, in_flight)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(
+                        "/api/calculate", params={"expression": expression_for(i)}
+                    )
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] += 1
+                finally:
+                    in_flight -= 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{requests} requests, concurrency {concurrency}, peak in flight {peak_in_flight}")
+    print(f"  throughput {len(latencies) / elapsed:9.1f} req/s over {elapsed:.2f} s")
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"  latency    p50 {statistics.median(latencies) * 1e3:8.1f} ms"
+            f"  p99 {p99 * 1e3:8.1f} ms  max {latencies[-1] * 1e3:8.1f} ms"
+        )
+    if errors:
+        print(f"  errors     {dict(errors)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.requests, args.concurrency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
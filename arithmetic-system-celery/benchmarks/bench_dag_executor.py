@@ -0,0 +1,136 @@
+"""Celery canvas vs the Redis DAG executor: messages, Redis round trips, latency.
+
+The canvas runs every node with two remote operands, and every flattened
+ADD/MUL run, as a chord, and each chord join is result backend bookkeeping
+(a counter and the header results fetched by the worker completing the
+last member). The DAG executor registers the whole expression in one hash;
+a Lua script counts down each node's inputs and hands the values of a
+ready node to the worker that publishes it, so each node costs one message
+and one script call. This runs the same generated expressions through both
+on an in-process worker (in-memory broker, the Redis result backend at
+--redis-url) and reports per expression the task messages published, the
+worker's Redis round trips and the mean time to the result.
+
+Start Redis, then run from the project root:
+
+    docker compose up -d redis
+    uv run python -m benchmarks.bench_dag_executor --expressions 50
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+
+from celery.contrib.testing.worker import start_worker
+from redis.connection import Connection
+
+from app.celery import app as celery_app
+from app.services.orchestrator import WorkflowOrchestrator
+
+QUEUES = ["add_tasks", "sub_tasks", "mul_tasks", "div_tasks", "dag_tasks"]
+
+counts: Counter = Counter()
+
+
+def count_messages() -> None:
+    send_task_message = celery_app.amqp.send_task_message
+
+    def counted(*args, **kwargs):
+        counts["messages"] += 1
+        return send_task_message(*args, **kwargs)
+
+    celery_app.amqp.send_task_message = counted
+
+
+def count_round_trips() -> None:
+    # The synchronous client is the workers'; the API side uses the asyncio one
+    send_packed_command = Connection.send_packed_command
+
+    def counted(self, *args, **kwargs):
+        counts["round_trips"] += 1
+        return send_packed_command(self, *args, **kwargs)
+
+    Connection.send_packed_command = counted
+
+
+def nested_expression(rng: random.Random, depth: int) -> str:
+    if depth == 0 or rng.random() < 0.15:
+        return str(rng.randint(1, 9))
+    operator = rng.choice("+-*/")
+    left = nested_expression(rng, depth - 1)
+    right = nested_expression(rng, depth - 1)
+    return f"({left} {operator} {right})"
+
+
+async def run(
+    dag: bool, expressions: list[str], redis_url: str
+) -> tuple[Counter, float, int]:
+    # Folding and caching off, so that every expression goes out in full
+    orchestrator = WorkflowOrchestrator(
+        constant_folding=False,
+        result_cache=False,
+        single_flight=False,
+        subtree_memo=False,
+        dag_executor=dag,
+    )
+    orchestrator.result_waiter.redis_url = redis_url
+    if orchestrator.dag_executor is not None:
+        orchestrator.dag_executor.redis_url = redis_url
+
+    counts.clear()
+    failed = 0
+    started = time.perf_counter()
+    for expression in expressions:
+        try:
+            await orchestrator.calculate(expression)
+        except Exception:
+            failed += 1
+    elapsed = time.perf_counter() - started
+    await orchestrator.close()
+    return Counter(counts), elapsed / len(expressions), failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expressions", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    celery_app.conf.update(
+        broker_url="memory://",
+        broker_transport_options={"polling_interval": 0.001},
+        result_backend=args.redis_url,
+    )
+    count_messages()
+    count_round_trips()
+
+    rng = random.Random(7)
+    expressions = [
+        nested_expression(rng, args.depth) for _ in range(args.expressions)
+    ]
+    print(f"{len(expressions)} expressions of depth {args.depth}")
+    print(
+        f"{'executor':>8} {'messages':>9} {'round trips':>12} {'ms':>8} "
+        f"{'failed':>7}"
+    )
+    with start_worker(
+        celery_app, queues=QUEUES, perform_ping_check=False, pool="solo"
+    ):
+        for dag in (False, True):
+            counted, seconds, failed = asyncio.run(
+                run(dag, expressions, args.redis_url)
+            )
+            print(
+                f"{'dag' if dag else 'canvas':>8} "
+                f"{counted['messages'] / len(expressions):>9.1f} "
+                f"{counted['round_trips'] / len(expressions):>12.1f} "
+                f"{seconds * 1e3:>8.1f} {failed:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
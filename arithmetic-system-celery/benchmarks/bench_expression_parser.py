@@ -0,0 +1,90 @@
+"""Parser throughput: iterative tokenizer vs the previous ast-based path.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_expression_parser
+"""
+import ast
+import re
+import sys
+import timeit
+
+from app.services.expression_parser import (
+    ExpressionNode,
+    ExpressionParser,
+    OperationEnum,
+)
+
+AST_OPERATORS = {
+    ast.Add: OperationEnum.ADD,
+    ast.Sub: OperationEnum.SUB,
+    ast.Mult: OperationEnum.MUL,
+    ast.Div: OperationEnum.DIV,
+}
+
+
+def ast_parse(expression: str) -> ExpressionNode | float | int:
+    # The pre-tokenizer implementation, kept here as the baseline
+    clean = re.sub(r"\s+", "", expression)
+    if not re.match(r"^[0-9+\-*/().%\s]+$", clean):
+        raise ValueError("Expression contains invalid characters")
+    return _ast_build(ast.parse(clean, mode="eval").body)
+
+
+def _ast_build(node) -> ExpressionNode | float | int:
+    if isinstance(node, ast.BinOp):
+        return ExpressionNode(
+            operation=AST_OPERATORS[type(node.op)],
+            left=_ast_build(node.left),
+            right=_ast_build(node.right),
+        )
+    if isinstance(node, ast.Constant):
+        return node.value
+    operand = _ast_build(node.operand)
+    if isinstance(operand, (int, float)):
+        return -operand
+    return ExpressionNode(operation=OperationEnum.SUB, left=0, right=operand)
+
+
+def shallow_input() -> str:
+    return "(1 + 2.5) * 3 - 4 / (5 - 6) + 7 * 8"
+
+
+def deep_input(depth: int) -> str:
+    return "(" * depth + "1" + "".join(f" + {i})" for i in range(depth))
+
+
+def wide_input(terms: int) -> str:
+    return " + ".join(f"{i} * {i + 1}" for i in range(terms))
+
+
+def run_case(name: str, expression: str, number: int) -> None:
+    parser = ExpressionParser()
+    results = {}
+    for label, parse in (("ast", ast_parse), ("tokenizer", parser.parse)):
+        try:
+            seconds = min(
+                timeit.repeat(lambda: parse(expression), number=number, repeat=3)
+            )
+        except (RecursionError, SyntaxError, MemoryError) as e:
+            results[label] = f"failed: {type(e).__name__}"
+            continue
+        per_call = seconds / number
+        results[label] = f"{per_call * 1e3:9.3f} ms/call {len(expression) / per_call / 1e6:7.2f} MB/s"
+
+    print(f"{name:<24} {len(expression):>9} chars")
+    for label, outcome in results.items():
+        print(f"  {label:<10} {outcome}")
+
+
+def main() -> None:
+    print(f"Python {sys.version.split()[0]}, recursion limit {sys.getrecursionlimit()}")
+    run_case("shallow", shallow_input(), number=20000)
+    run_case("deep (depth=150)", deep_input(150), number=200)
+    run_case("deep (depth=5000)", deep_input(5000), number=5)
+    run_case("wide (terms=1000)", wide_input(1000), number=50)
+    run_case("wide (terms=50000)", wide_input(50000), number=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Arity of the aggregator tree for wide ADD/MUL chains.
+
+A flattened chain of N operands is reduced by a k-ary tree of xsum/xprod
+tasks. A wider fan-in means fewer levels, i.e. fewer broker hops on the
+critical path, but bigger messages and chord joins per task. This measures
+what one aggregator message of k operands costs (serialize, deserialize,
+reduce) and combines it with the hop latency into a modelled end-to-end
+time per arity, to pick FLAT_REDUCTION_MAX_FAN_IN.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_fan_in --operands 100000
+"""
+import argparse
+import math
+import random
+import timeit
+
+from kombu.serialization import dumps, loads
+
+from app.celery import app as celery_app
+from app.config import (
+    FLAT_REDUCTION_MAX_FAN_IN,
+    FUSION_HOP_LATENCY_SECONDS,
+    FUSION_WORKER_CONCURRENCY,
+)
+
+ARITIES = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+
+def message_seconds(values: list[float], number: int) -> tuple[float, int]:
+    # One aggregator task: the request carrying the operands and the
+    # reduction, as a worker sees it
+    serializer = celery_app.conf.task_serializer
+
+    def roundtrip() -> float:
+        content_type, encoding, body = dumps(((values,), {}, {}), serializer=serializer)
+        (operands,), _, _ = loads(body, content_type, encoding, accept=[content_type])
+        return sum(operands)
+
+    _, _, body = dumps(((values,), {}, {}), serializer=serializer)
+    seconds = min(timeit.repeat(roundtrip, number=number, repeat=3)) / number
+    return seconds, len(body)
+
+
+def modelled_seconds(
+    operands: int, arity: int, per_message: float, hop: float, workers: int
+) -> tuple[int, float]:
+    # Each level costs a hop plus its messages spread over the workers; the
+    # chord join at the top of a level receives up to arity results
+    levels = max(1, math.ceil(math.log(operands, arity)))
+    total = 0.0
+    remaining = operands
+    for _ in range(levels):
+        messages = math.ceil(remaining / arity)
+        waves = math.ceil(messages / workers)
+        total += hop + waves * per_message
+        remaining = messages
+    return levels, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operands", type=int, default=100_000)
+    parser.add_argument("--hop", type=float, default=FUSION_HOP_LATENCY_SECONDS)
+    parser.add_argument("--workers", type=int, default=FUSION_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    print(
+        f"{args.operands} operands, hop {args.hop * 1e3:.1f} ms, "
+        f"{args.workers} workers (configured fan-in {FLAT_REDUCTION_MAX_FAN_IN})"
+    )
+    print(f"{'arity':>7} {'bytes':>10} {'ms/msg':>9} {'levels':>7} {'model ms':>9}")
+
+    best = None
+    for arity in (*ARITIES, args.operands):
+        if arity > args.operands:
+            continue
+        values = [random.random() for _ in range(arity)]
+        per_message, size = message_seconds(values, number=max(1, 20_000 // arity))
+        levels, total = modelled_seconds(
+            args.operands, arity, per_message, args.hop, args.workers
+        )
+        print(
+            f"{arity:>7} {size:>10} {per_message * 1e3:>9.3f} "
+            f"{levels:>7} {total * 1e3:>9.2f}"
+        )
+        if best is None or total < best[1]:
+            best = (arity, total)
+
+    print(f"fastest modelled arity: {best[0]}")
+
+
+if __name__ == "__main__":
+    main()
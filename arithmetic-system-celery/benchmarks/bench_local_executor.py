@@ -0,0 +1,140 @@
+"""Local vs distributed execution: latency by expression size.
+
+Evaluating in the API process skips the broker and the result backend, so
+small expressions come back in microseconds instead of a few round trips;
+past some size the arithmetic itself dominates and the API would be doing
+the workers' job. This runs the same generated expressions, a few sizes of
+them, through the local executor on a thread pool and on a process pool and
+through the Celery canvas on an in-process worker (in-memory broker, the
+Redis result backend at --redis-url), and reports the mean time to the
+result per expression. LOCAL_EXECUTION_MAX_OPERATIONS belongs where the
+local columns stop being much faster than the canvas one.
+
+Start Redis, then run from the project root (the local columns alone need
+no Redis: --executors thread process):
+
+    docker compose up -d redis
+    uv run python -m benchmarks.bench_local_executor --expressions 20
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from celery.contrib.testing.worker import start_worker
+
+from app.celery import app as celery_app
+from app.services.local_executor import local_pool
+from app.services.orchestrator import WorkflowOrchestrator
+
+QUEUES = ["add_tasks", "sub_tasks", "mul_tasks", "div_tasks"]
+EXECUTORS = ["thread", "process", "canvas"]
+
+
+def random_expression(rng: random.Random, operations: int) -> str:
+    if operations == 0:
+        return str(rng.randint(1, 9))
+    operator = rng.choice("+-*/")
+    # Dividing by a constant only, so that no expression divides by zero
+    left = operations - 1 if operator == "/" else rng.randint(0, operations - 1)
+    return (
+        f"({random_expression(rng, left)} {operator} "
+        f"{random_expression(rng, operations - 1 - left)})"
+    )
+
+
+def orchestrator_for(
+    executor: str, redis_url: str, max_operations: int
+) -> WorkflowOrchestrator:
+    # Folding and caching off, so that every expression is evaluated in full
+    orchestrator = WorkflowOrchestrator(
+        constant_folding=False,
+        result_cache=False,
+        single_flight=False,
+        subtree_memo=False,
+        local_execution=executor != "canvas",
+        local_executor_pool=(
+            local_pool(executor, 4) if executor != "canvas" else None
+        ),
+    )
+    orchestrator.result_waiter.redis_url = redis_url
+    if orchestrator.local_executor is not None:
+        orchestrator.local_executor.max_operations = max_operations
+    return orchestrator
+
+
+async def time_expressions(
+    orchestrator: WorkflowOrchestrator, expressions: list[str]
+) -> tuple[float, int]:
+    # Compiled up front: only the evaluation is timed
+    for expression in expressions:
+        orchestrator.compile(expression)
+    failed = 0
+    started = time.perf_counter()
+    for expression in expressions:
+        try:
+            await orchestrator.calculate(expression)
+        except Exception:
+            failed += 1
+    return (time.perf_counter() - started) / len(expressions), failed
+
+
+async def run(
+    orchestrators: dict[str, WorkflowOrchestrator], sizes: list[int], count: int
+) -> bool:
+    rng = random.Random(7)
+    any_failed = False
+    for size in sizes:
+        expressions = [random_expression(rng, size) for _ in range(count)]
+        cells = []
+        for orchestrator in orchestrators.values():
+            # The first call starts pool workers and connections
+            await time_expressions(orchestrator, expressions[:1])
+            seconds, failed = await time_expressions(orchestrator, expressions)
+            cells.append(f"{seconds * 1e3:>9.2f}" + ("*" if failed else " "))
+            any_failed = any_failed or failed > 0
+        print(f"{size:>10} " + " ".join(cells))
+    for orchestrator in orchestrators.values():
+        await orchestrator.close()
+    return any_failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expressions", type=int, default=20)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[8, 64, 512, 4096]
+    )
+    parser.add_argument(
+        "--executors",
+        nargs="+",
+        choices=EXECUTORS,
+        default=EXECUTORS,
+    )
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    celery_app.conf.update(
+        broker_url="memory://",
+        broker_transport_options={"polling_interval": 0.001},
+        result_backend=args.redis_url,
+    )
+
+    orchestrators = {
+        executor: orchestrator_for(executor, args.redis_url, max(args.sizes))
+        for executor in args.executors
+    }
+    print(f"{args.expressions} expressions per size, mean ms per expression")
+    print(f"{'operations':>10} " + " ".join(f"{name:>9} " for name in orchestrators))
+    with start_worker(
+        celery_app, queues=QUEUES, perform_ping_check=False, pool="solo"
+    ):
+        failed = asyncio.run(run(orchestrators, args.sizes, args.expressions))
+    if failed:
+        print("* some expressions failed or timed out")
+
+
+if __name__ == "__main__":
+    main()
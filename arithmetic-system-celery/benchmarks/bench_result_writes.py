@@ -0,0 +1,129 @@
+"""Result backend writes per expression, with and without intermediate results.
+
+Every task of a workflow used to write its return value to the result
+backend, though only chord joins and the orchestrator read any of them.
+This runs generated expressions through an in-process worker (in-memory
+broker and key-value result backend), counts the backend writes by
+kind and reports them per expression for both settings of
+SKIP_INTERMEDIATE_RESULTS. The Redis backend stores a result with the
+same one SET per task; only its chord bookkeeping differs.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_result_writes --expressions 50
+"""
+import argparse
+import logging
+import random
+from collections import Counter
+
+from celery.contrib.testing.worker import start_worker
+from celery.exceptions import ChordError
+
+from app.celery import app as celery_app
+from app.services.orchestrator import WorkflowOrchestrator
+
+QUEUES = ["add_tasks", "sub_tasks", "mul_tasks", "div_tasks", "eval_tasks"]
+# Writes only: reads are mostly the orchestrator polling for the result
+OPERATIONS = ("set", "incr", "expire", "delete")
+
+counts: Counter = Counter()
+
+
+def counting(backend_class: type, operation: str):
+    method = getattr(backend_class, operation)
+
+    def counted(self, *args, **kwargs):
+        counts[operation] += 1
+        return method(self, *args, **kwargs)
+
+    return counted
+
+
+def nested_expression(rng: random.Random, depth: int) -> str:
+    # Mostly chords, with short chains where one side is a constant
+    if depth == 0 or rng.random() < 0.2:
+        return str(rng.randint(1, 9))
+    operator = rng.choice("+-*/")
+    left = nested_expression(rng, depth - 1)
+    right = nested_expression(rng, depth - 1)
+    return f"({left} {operator} {right})"
+
+
+def chained_expression(rng: random.Random, depth: int) -> str:
+    # One chain of depth links; alternating operators keep it from being
+    # flattened into an aggregate
+    expression = str(rng.randint(1, 9))
+    for index in range(depth):
+        operator = "+-"[index % 2] if rng.random() < 0.5 else "*/"[index % 2]
+        expression = f"({expression} {operator} {rng.randint(1, 9)})"
+    return expression
+
+
+SHAPES = {"nested": nested_expression, "chained": chained_expression}
+
+
+def run(skip: bool, expressions: list[str]) -> Counter:
+    # Folding and caching off, so that every expression goes out in full
+    orchestrator = WorkflowOrchestrator(
+        constant_folding=False, result_cache=False, workflow_templates=False
+    )
+    orchestrator.builder.skip_intermediate_results = skip
+    counts.clear()
+    for expression in expressions:
+        tree = orchestrator.parser.parse(expression)
+        workflow, _ = orchestrator.builder.compile(tree)
+        try:
+            orchestrator.builder.dispatch(workflow).get(timeout=30)
+        except (ZeroDivisionError, ChordError):
+            pass
+    return Counter(counts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expressions", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    celery_app.conf.update(
+        broker_url="memory://",
+        broker_transport_options={"polling_interval": 0.001},
+        result_backend="cache+memory://",
+    )
+    # Each thread has its own backend instance, so count on the class
+    backend_class = type(celery_app.backend)
+    for operation in OPERATIONS:
+        setattr(backend_class, operation, counting(backend_class, operation))
+
+    print(f"{args.expressions} expressions of depth {args.depth} per shape")
+    print(
+        f"{'shape':>8} {'intermediate':>12} "
+        + " ".join(f"{op:>7}" for op in OPERATIONS)
+    )
+    with start_worker(
+        celery_app, queues=QUEUES, perform_ping_check=False, pool="solo"
+    ):
+        for shape, generate in SHAPES.items():
+            rng = random.Random(7)
+            expressions = [
+                generate(rng, args.depth) for _ in range(args.expressions)
+            ]
+            writes = {}
+            for skip in (False, True):
+                counted = run(skip, expressions)
+                writes[skip] = counted["set"]
+                per_expression = (
+                    counted[op] / len(expressions) for op in OPERATIONS
+                )
+                print(
+                    f"{shape:>8} {'skipped' if skip else 'stored':>12} "
+                    + " ".join(f"{value:>7.2f}" for value in per_expression)
+                )
+            ratio = writes[True] / writes[False]
+            print(f"{'':>8} result writes: {ratio:.0%} of before")
+
+
+if __name__ == "__main__":
+    main()
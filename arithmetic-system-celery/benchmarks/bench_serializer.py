@@ -0,0 +1,75 @@
+"""Message size and encode/decode time of the packed serializer vs JSON.
+
+An aggregator task carries its operands as one list; with JSON every number
+is formatted as text on the API side and parsed back on the worker, and the
+text is what RabbitMQ and Redis hold. The packed serializer moves such lists
+into typed binary arrays and compresses large bodies. This encodes an
+xsum_task message body of N operands with both and reports the body size
+and the time to encode and to decode it, for int, float and mixed operands.
+
+Run from the project root:
+
+    uv run python -m benchmarks.bench_serializer --operands 100000
+"""
+import argparse
+import random
+import timeit
+
+from kombu.serialization import dumps, loads
+
+from app.celery import app as celery_app
+from app.serializer import PACKED_SERIALIZER
+
+KINDS = {
+    "int": lambda rng: rng.randint(-(10**6), 10**6),
+    "float": lambda rng: rng.uniform(-1e6, 1e6),
+    "mixed": lambda rng: rng.choice((rng.randint(0, 100), rng.random())),
+}
+
+
+def measure(
+    message: tuple, serializer: str, number: int
+) -> tuple[int, float, float]:
+    content_type, encoding, body = dumps(message, serializer=serializer)
+    encode = min(
+        timeit.repeat(lambda: dumps(message, serializer=serializer), number=number)
+    )
+    decode = min(
+        timeit.repeat(
+            lambda: loads(body, content_type, encoding, accept=[content_type]),
+            number=number,
+        )
+    )
+    return len(body), encode / number, decode / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operands", type=int, nargs="+", default=[100, 100_000])
+    args = parser.parse_args()
+
+    print(f"configured task serializer: {celery_app.conf.task_serializer}")
+    print(
+        f"{'operands':>9} {'kind':>6} {'serializer':>10} {'bytes':>10} "
+        f"{'encode ms':>10} {'decode ms':>10}"
+    )
+    rng = random.Random(7)
+    for operands in args.operands:
+        number = max(1, 200_000 // operands)
+        for kind, generate in KINDS.items():
+            values = [generate(rng) for _ in range(operands)]
+            message = ((values,), {}, {"callbacks": None, "chord": None})
+            sizes = {}
+            for serializer in ("json", PACKED_SERIALIZER):
+                size, encode, decode = measure(message, serializer, number)
+                sizes[serializer] = size
+                print(
+                    f"{operands:>9} {kind:>6} {serializer:>10} {size:>10} "
+                    f"{encode * 1e3:>10.3f} {decode * 1e3:>10.3f}"
+                )
+            ratio = sizes["json"] / sizes[PACKED_SERIALIZER]
+            print(f"{'':>17} size ratio {ratio:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -97,3 +99,162 @@ class TestCalculateAPI:
         assert any(
             "Field required" in str(error.get("msg", "")) for error in data["detail"]
         )
+
+    def test_metrics_report_workflow_cache(self, client: TestClient):
+        """Tests that repeated expressions show up as workflow cache hits."""
+        before = client.get("/api/metrics").json()["workflow_cache"]
+        client.get("/api/calculate", params={"expression": "7 * 6"})
+        client.get("/api/calculate", params={"expression": "7 * 6"})
+        after = client.get("/api/metrics").json()["workflow_cache"]
+
+        assert after["hits"] >= before["hits"] + 1
+        assert after["size"] <= after["max_size"]
+
+    def test_small_expressions_are_folded(self, client: TestClient):
+        """Tests that cheap expressions are evaluated in-process and reported."""
+        response = client.get("/api/calculate", params={"expression": "(1 + 2) * 4"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["result"] == 12
+        assert data["workflow"] == "folded((1 + 2) * 4 = 12) -> constant(12)"
+
+
+class TestPreparedExpressionAPI:
+    """Test suite for the /api/expressions endpoints."""
+
+    def test_prepare_then_execute(self, client: TestClient):
+        """Tests that a prepared expression runs with the values it is given."""
+        prepared = client.post("/api/expressions", json={"expression": "x * 2 + y"})
+        assert prepared.status_code == 200
+        data = prepared.json()
+        assert data["variables"] == ["x", "y"]
+
+        response = client.post(
+            f"/api/expressions/{data['id']}/execute",
+            json={"values": {"x": 4, "y": 1.5}},
+        )
+        assert response.status_code == 200
+        assert response.json()["result"] == 9.5
+
+    @pytest.mark.parametrize(
+        "expression_id, values, status_code, detail",
+        [
+            ("unknown", {}, 404, "Unknown prepared expression"),
+            (None, {"x": 1}, 400, "Missing values for variables: y"),
+            (None, {"x": 1, "y": 0}, 400, "Cannot divide by zero"),
+        ],
+    )
+    def test_execute_errors(
+        self, client: TestClient, expression_id, values, status_code, detail
+    ):
+        """Tests unknown handles, missing values and errors while executing."""
+        prepared = client.post("/api/expressions", json={"expression": "x / y"})
+        expression_id = expression_id or prepared.json()["id"]
+
+        response = client.post(
+            f"/api/expressions/{expression_id}/execute", json={"values": values}
+        )
+        assert response.status_code == status_code
+        assert detail in response.json()["detail"]
+
+    def test_prepare_rejects_invalid_expressions(self, client: TestClient):
+        """Tests that syntax errors are reported when preparing."""
+        response = client.post("/api/expressions", json={"expression": "x +"})
+
+        assert response.status_code == 400
+        assert "invalid syntax" in response.json()["detail"]
+
+    def test_evaluate_columns(self, client: TestClient):
+        """Tests that failed rows are reported next to the other results."""
+        prepared = client.post("/api/expressions", json={"expression": "x / y"})
+
+        response = client.post(
+            f"/api/expressions/{prepared.json()['id']}/columns",
+            json={"columns": {"x": [1, 3], "y": [0, 2]}},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"] == [None, 1.5]
+        assert data["errors"] == [{"row": 0, "error": "Cannot divide 1.0 by zero."}]
+
+
+class TestCalculateBatchAPI:
+    """Test suite for the /api/calculate/batch endpoint."""
+
+    def test_batch_results_follow_request_order(self, client: TestClient):
+        """Tests that every item is answered in order, errors included."""
+        expressions = ["2 + 3 * 4", "10 / 0", "5 +", "(1 + 2) * 4", "2 + 3 * 4"]
+        response = client.post(
+            "/api/calculate/batch", json={"expressions": expressions}
+        )
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [item["expression"] for item in results] == expressions
+        assert results[0]["result"] == 14.0
+        assert results[1]["error"] == "Cannot divide by zero"
+        assert "invalid syntax" in results[2]["error"]
+        assert results[3]["result"] == 12.0
+        assert results[4] == results[0]
+
+    def test_batch_shares_common_subtrees(self, client: TestClient):
+        """Tests that a subtree used by several expressions is evaluated once."""
+        common = "((1 + 2) * (3 + 4) - (5 + 6) / (7 + 8) + 9 * 10)"
+        expressions = [f"{common} * 2", f"{common} - 1", f"3 / {common}"]
+        response = client.post(
+            "/api/calculate/batch", json={"expressions": expressions}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["workflow"].startswith("group(1 shared subtrees)")
+        value = 21 - 11 / 15 + 90
+        assert [item["result"] for item in data["results"]] == pytest.approx(
+            [value * 2, value - 1, 3 / value]
+        )
+        assert all(item["workflow"].startswith("shared(") for item in data["results"])
+
+    def test_empty_batch_is_rejected(self, client: TestClient):
+        """Tests that a batch must contain at least one expression."""
+        response = client.post("/api/calculate/batch", json={"expressions": []})
+
+        assert response.status_code == 422
+
+
+class TestCalculateStreamAPI:
+    """Test suite for the /api/calculate/stream endpoint."""
+
+    def test_stream_emits_one_ndjson_record_per_line(self, client: TestClient):
+        """Tests that every non-blank line gets a record, errors included."""
+        body = "2 + 3 * 4\n\n10 / 0\n(1 + 2) * 4\n5 +"
+        response = client.post("/api/calculate/stream", content=body)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = sorted(
+            (json.loads(line) for line in response.text.splitlines()),
+            key=lambda record: record["index"],
+        )
+        assert [record["expression"] for record in records] == [
+            "2 + 3 * 4",
+            "10 / 0",
+            "(1 + 2) * 4",
+            "5 +",
+        ]
+        assert records[0]["result"] == 14.0
+        assert records[1]["error"] == "Cannot divide by zero"
+        assert records[2]["result"] == 12.0
+        assert "invalid syntax" in records[3]["error"]
+
+    def test_stream_as_server_sent_events(self, client: TestClient):
+        """Tests that format=sse frames each record as an SSE data event."""
+        response = client.post(
+            "/api/calculate/stream", params={"format": "sse"}, content="6 * 7\n"
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event, separator = response.text.split("\n", 1)
+        assert separator == "\n"
+        assert json.loads(event.removeprefix("data: "))["result"] == 42.0
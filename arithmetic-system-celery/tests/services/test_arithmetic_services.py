@@ -4,6 +4,7 @@ from app.workers.sub_service import subtract_task
 from app.workers.mul_service import multiply_task
 from app.workers.div_service import divide_task
 from app.workers.xsum_service import xsum_task
+from app.workers.eval_subtree_service import evaluate_subtree_task
 
 
 def test_add_task():
@@ -78,3 +79,11 @@ def test_add_parametrized(a, b, expected):
 )
 def test_xsum_parametrized(numbers, expected):
     assert xsum_task(numbers) == pytest.approx(expected)
+
+
+def test_evaluate_subtree_task():
+    assert evaluate_subtree_task([], program=[1, 2, "+", 4, "*"]) == 12
+    assert evaluate_subtree_task(3, program=["$0", 2, "-"]) == 1
+    assert evaluate_subtree_task([6, 3], program=["$0", "$1", "/", 1, "+"]) == 3.0
+    with pytest.raises(ZeroDivisionError):
+        evaluate_subtree_task([0], program=[1, "$0", "/"])
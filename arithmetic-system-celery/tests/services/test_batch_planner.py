@@ -0,0 +1,61 @@
+import pytest
+
+from app.services.batch_planner import BatchPlanner
+from app.services.evaluator import evaluate
+from app.services.expression_parser import ExpressionParser
+from app.services.workflow_builder import WorkflowBuilder
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+@pytest.fixture
+def planner():
+    return BatchPlanner(WorkflowBuilder({}), min_operations=3)
+
+
+def test_outermost_shared_subtree_is_selected(parser, planner):
+    trees = [
+        parser.parse("((1 - 2) * (3 - 4)) / 5"),
+        parser.parse("7 - (3 - 4) * (1 - 2)"),
+    ]
+    shared = planner.shared_subtrees(trees)
+
+    assert [subtree.node.to_infix() for subtree in shared] == ["(1 - 2) * (3 - 4)"]
+
+
+def test_repeated_subtree_within_one_expression_is_shared(parser, planner):
+    # The parser returns a DAG, so the repeat is one node with two parents
+    tree = parser.parse("(1 - 2) * (3 - 4) + 5 / ((1 - 2) * (3 - 4))")
+    shared = planner.shared_subtrees([tree])
+
+    assert [subtree.node.to_infix() for subtree in shared] == ["(1 - 2) * (3 - 4)"]
+    substituted, _ = planner.substitute(tree, {shared[0].key: 1})
+    assert substituted.to_infix() == "1 + (5 / 1)"
+
+
+def test_small_or_unique_subtrees_are_not_shared(parser, planner):
+    trees = [parser.parse("(1 - 2) * 3"), parser.parse("(1 - 2) / 4")]
+    assert planner.shared_subtrees(trees) == []
+
+
+def test_substitute_replaces_shared_subtrees(parser, planner):
+    tree = parser.parse("7 - (3 - 4) * (1 - 2)")
+    key = planner.shared_subtrees([tree, parser.parse("(1 - 2) * (3 - 4)")])[0].key
+
+    substituted, used = planner.substitute(tree, {key: 1})
+    assert used == [key]
+    assert substituted.to_infix() == "7 - 1"
+    assert evaluate(substituted) == evaluate(tree)
+    # The cached input tree is left untouched
+    assert tree.to_infix() == "7 - ((3 - 4) * (1 - 2))"
+
+
+def test_substitute_propagates_shared_failures(parser, planner):
+    tree = parser.parse("7 - (3 - 4) * (1 - 2)")
+    key = planner.shared_subtrees([tree, tree])[0].key
+
+    with pytest.raises(ZeroDivisionError):
+        planner.substitute(tree, {key: ZeroDivisionError("Cannot divide 1 by zero.")})
@@ -0,0 +1,102 @@
+import pytest
+
+from app.services.chain_rewriter import ChainRewriter
+from app.services.evaluator import evaluate
+from app.services.expression_parser import ExpressionParser
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def test_regroups_subtraction_and_division_chains(parser):
+    rewriter = ChainRewriter()
+
+    assert rewriter.rewrite(parser.parse("20 - 1 - 2 - 3")).to_infix() == (
+        "20 - ((1 + 2) + 3)"
+    )
+    assert rewriter.rewrite(parser.parse("64 / 2 * 3 / 4 / 8")).to_infix() == (
+        "(64 * 3) / ((2 * 4) * 8)"
+    )
+
+
+def test_keeps_subtrees_that_need_no_rewriting(parser):
+    rewriter = ChainRewriter()
+    tree = parser.parse("(1 - 2) * (3 + 4 - 5) + 6")
+    assert rewriter.rewrite(tree) is tree
+
+    tree = parser.parse("(2 * 3 - 1 - 2 - 3) * (4 - 5)")
+    rewritten = rewriter.rewrite(tree)
+    assert rewritten is not tree
+    assert rewritten.right is tree.right
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "100 - 1 + 2 - 3 - 4 + 5",
+        "(7 - 1 - 2) * (8 / 2 / 2) - 3 - (4 - 1 - 1)",
+        "96 / 2 / 3 * 5 / 4",
+    ],
+)
+def test_rewritten_trees_evaluate_to_the_same_value(parser, expression):
+    tree = parser.parse(expression)
+    assert evaluate(ChainRewriter().rewrite(tree)) == pytest.approx(evaluate(tree))
+
+
+def test_zero_divisor_still_raises(parser):
+    tree = ChainRewriter().rewrite(parser.parse("8 / 2 / 0 / 4"))
+    with pytest.raises(ZeroDivisionError):
+        evaluate(tree)
+
+
+# The parser has no exponent notation
+TINY = f"0.{'0' * 199}1"
+HUGE = f"1{'0' * 200}.0"
+
+
+def test_divisors_that_underflow_together_are_not_regrouped(parser):
+    # 1e-200 * 1e-200 is zero, so 1e-200 / (1e-200 * 1e-200) would raise
+    tree = parser.parse(f"{TINY} / {TINY} / {TINY}")
+    rewritten = ChainRewriter().rewrite(tree)
+    assert rewritten is tree
+    assert evaluate(rewritten) == pytest.approx(1e200)
+
+
+def test_divisors_that_overflow_together_are_not_regrouped(parser):
+    # 1e200 * 1e200 is inf, so 1e200 / (1e200 * 1e200) would be 0.0 and
+    # (1e200 * 1e200) / (1e200 * 1e200) nan
+    tree = parser.parse(f"{HUGE} / {HUGE} / {HUGE} / 2")
+    assert evaluate(ChainRewriter().rewrite(tree)) == pytest.approx(5e-201)
+    tree = parser.parse(f"{HUGE} / {HUGE} * {HUGE} / {HUGE}")
+    assert evaluate(ChainRewriter().rewrite(tree)) == pytest.approx(1.0)
+
+
+def test_unknown_divisors_are_not_regrouped(parser):
+    tree = parser.parse("8 / (1 + 1) / (3 - 1) / 2")
+    assert ChainRewriter().rewrite(tree) is tree
+
+
+# 1e308 - 1e308 + 1e308 - 1 - 2 - ... - 20; (1e308 + 1e308) - (1 + 2 + ...) is inf
+MAX = f"1{'0' * 308}.0"
+CANCELLING = f"{MAX} - {MAX} + {MAX} - " + " - ".join(str(i) for i in range(1, 21))
+
+
+def test_terms_whose_sum_overflows_are_not_regrouped(parser):
+    tree = parser.parse(CANCELLING)
+    rewritten = ChainRewriter().rewrite(tree)
+    assert rewritten is tree
+    assert evaluate(rewritten) == 1e308
+
+
+def test_terms_that_cancel_are_not_regrouped(parser):
+    # (1e16 + 1 + 1) - (1e16 + 2 + 2) is -4.0, stepwise it is -2.0
+    tree = parser.parse("10000000000000000.0 - 10000000000000000.0 + 1 + 1 - 2 - 2")
+    assert evaluate(ChainRewriter().rewrite(tree)) == -2.0
+
+    # Ints add up exactly in any order
+    tree = parser.parse(f"{10**16} - {10**16} + 1 + 1 - 2 - 2")
+    assert ChainRewriter().rewrite(tree).to_infix() == (
+        f"(({10**16} + 1) + 1) - (({10**16} + 2) + 2)"
+    )
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from app.services.column_evaluator import compile_columns, evaluate_columns
+from app.services.evaluator import evaluate
+from app.services.expression_parser import ExpressionNode, ExpressionParser, Variable
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def bind(node, values):
+    # The tree with each variable replaced by its value, for evaluate()
+    if isinstance(node, Variable):
+        return values[node]
+    if not isinstance(node, ExpressionNode):
+        return node
+    return ExpressionNode(
+        operation=node.operation,
+        left=bind(node.left, values),
+        right=bind(node.right, values),
+    )
+
+
+def test_constant_subtrees_are_folded_and_shared_subtrees_computed_once(parser):
+    tree, _ = parser.parse_prepared("(x + 1) * (x + 1) - 2 * 3")
+    steps, result = compile_columns(tree)
+
+    assert steps == [["+", "$0", 1], ["*", "%0", "%0"], ["-", "%1", 6]]
+    assert result == "%2"
+
+
+def test_matches_row_by_row_evaluation(parser):
+    tree, variables = parser.parse_prepared("a / (b - 2) + (a * 3 - c) / b - c / 4")
+    rng = random.Random(3)
+    rows = 200
+    columns = [[float(rng.randint(-3, 4)) for _ in range(rows)] for _ in variables]
+
+    results, errors = evaluate_columns(*compile_columns(tree), columns, rows)
+
+    expected_errors = []
+    for row, values in enumerate(zip(*columns)):
+        try:
+            assert results[row] == evaluate(bind(tree, values))
+        except ZeroDivisionError as e:
+            assert results[row] is None
+            expected_errors.append((row, str(e)))
+    assert errors == expected_errors
+    assert errors
+
+
+def test_division_errors_match_divide_task(parser):
+    tree, _ = parser.parse_prepared("(6 / x) / (x - 1)")
+    results, errors = evaluate_columns(*compile_columns(tree), [[0, 1, 2]], 3)
+
+    assert results == [None, None, 3.0]
+    assert errors == [
+        (0, "Cannot divide 6 by zero."),
+        (1, "Cannot divide 6.0 by zero."),
+    ]
+
+
+def test_expressions_without_variables_fill_every_row(parser):
+    tree, _ = parser.parse_prepared("2 * 3")
+
+    assert evaluate_columns(*compile_columns(tree), [], 2) == ([6.0, 6.0], [])
@@ -0,0 +1,113 @@
+import pytest
+
+from app.services.constant_folder import ConstantFolder
+from app.services.evaluator import evaluate
+from app.services.expression_parser import (
+    ExpressionNode,
+    ExpressionParser,
+    OperationEnum,
+)
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def test_folds_whole_tree_below_threshold(parser):
+    folder = ConstantFolder(max_nodes=16, max_depth=4)
+    result, folded = folder.fold(parser.parse("(1 + 2) * 4"))
+
+    assert result == 12
+    assert [str(subtree) for subtree in folded] == ["(1 + 2) * 4 = 12"]
+
+
+def test_folds_only_cheap_subtrees(parser):
+    folder = ConstantFolder(max_nodes=3, max_depth=2)
+    tree = parser.parse("(1 + 2) * (3 + 4) - ((5 * 6) + (7 * 8) + 9 + 10) / 2")
+    result, folded = folder.fold(tree)
+
+    assert isinstance(result, ExpressionNode)
+    assert result.operation == OperationEnum.SUB
+    assert result.left == 21
+    assert evaluate(result) == evaluate(tree)
+    assert {subtree.value for subtree in folded} == {21, 86}
+
+
+def test_node_count_threshold(parser):
+    folder = ConstantFolder(max_nodes=1, max_depth=10)
+    result, folded = folder.fold(parser.parse("1 + 2 + 3"))
+
+    assert result == ExpressionNode(operation=OperationEnum.ADD, left=3, right=3)
+    assert len(folded) == 1
+
+
+def test_too_deep_node_with_folded_children_is_folded(parser):
+    folder = ConstantFolder(max_nodes=16, max_depth=4)
+    result, folded = folder.fold(parser.parse("1 - 2 - 3 - 4 - 5 - 6"))
+
+    assert result == -19
+    assert [str(subtree) for subtree in folded] == [
+        "(((1 - 2) - 3) - 4) - 5 = -13",
+        "-13 - 6 = -19",
+    ]
+
+
+def test_shared_subtree_is_folded_once(parser):
+    folder = ConstantFolder(max_nodes=4, max_depth=2)
+    shared = "(1 - 2) * (3 - 4)"
+    tree = parser.parse(
+        f"({shared} - (5 - 6) * (7 - 8)) * ({shared} - (9 - 10) * (11 - 12))"
+        f" + ({shared} - (13 - 14) * (15 - 16))"
+    )
+    result, folded = folder.fold(tree)
+
+    assert evaluate(result) == evaluate(tree)
+    assert [str(subtree) for subtree in folded].count(f"{shared} = 1") == 1
+
+
+def test_refolding_stops_at_the_node_count(parser):
+    folder = ConstantFolder(max_nodes=4, max_depth=2)
+    tree = parser.parse("((1 + 2) + 3) + 4 + 5 + 6")
+    result, _ = folder.fold(tree)
+
+    # Refolded up to four operations; the fifth goes to a worker
+    assert result == ExpressionNode(operation=OperationEnum.ADD, left=15, right=6)
+
+
+def test_does_not_mutate_input_tree(parser):
+    tree = parser.parse("(1 + 2) * (3 + 4) * (5 + 6) * (7 + 8)")
+    ConstantFolder(max_nodes=1, max_depth=1).fold(tree)
+
+    assert tree.left.left.left == ExpressionNode(
+        operation=OperationEnum.ADD, left=1, right=2
+    )
+
+
+def test_division_by_zero_is_raised(parser):
+    folder = ConstantFolder(max_nodes=16, max_depth=4)
+    with pytest.raises(ZeroDivisionError, match="Cannot divide .* by zero"):
+        folder.fold(parser.parse("(5 - 5) / (2 - 2)"))
+
+
+def test_constant_is_left_untouched():
+    assert ConstantFolder(max_nodes=1, max_depth=1).fold(7) == (7, [])
+
+
+def test_subtrees_with_variables_are_not_folded(parser):
+    folder = ConstantFolder(max_nodes=16, max_depth=4)
+    tree, _ = parser.parse_prepared("(1 + 2) * x + 4 * 5")
+    result, folded = folder.fold(tree)
+
+    assert result.to_infix() == "(3 * x) + 20"
+    assert [str(subtree) for subtree in folded] == ["1 + 2 = 3", "4 * 5 = 20"]
+
+
+
+def test_folds_whole_counts_variables_as_values(parser):
+    folder = ConstantFolder(max_nodes=3, max_depth=2)
+    tree, _ = parser.parse_prepared("(x + 1) * (y - 2)")
+
+    assert folder.folds_whole(tree)
+    assert not folder.folds_whole(parser.parse_prepared("(x + 1) * (y - 2) / z")[0])
+    assert folder.folds_whole(5)
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app.celery import app as celery_app
+from app.services.dag_executor import DagExecutor
+from app.services.dag_planner import DAG_COMPLETE_SCRIPT, compile_dag, dag_fields
+from app.services.expression_parser import ExpressionParser
+from app.workers import dag_node_service
+from app.workers.dag_node_service import dag_node_task
+
+
+class FakeRunStore:
+    # One run's hash, with DAG_COMPLETE_SCRIPT done in Python
+    def __init__(self, fields):
+        self.fields = {name: str(value) for name, value in fields.items()}
+        self.deleted = False
+
+    def register_script(self, script):
+        assert script == DAG_COMPLETE_SCRIPT
+        return self.complete
+
+    def complete(self, keys, args):
+        if "failed" in self.fields:
+            return []
+        index, value, *parents = map(str, args)
+        self.fields[f"value:{index}"] = value
+        ready = []
+        for parent in parents:
+            pending = int(self.fields[f"pending:{parent}"]) - 1
+            self.fields[f"pending:{parent}"] = str(pending)
+            if pending == 0:
+                children = self.fields[f"children:{parent}"].split()
+                ready.append(
+                    [parent, self.fields[f"node:{parent}"]]
+                    + [self.fields[f"value:{child}"] for child in children]
+                )
+        return ready
+
+    def hsetnx(self, key, field, value):
+        if field in self.fields:
+            return 0
+        self.fields[field] = str(value)
+        return 1
+
+    def delete(self, key):
+        self.deleted = True
+
+
+@pytest.fixture
+def run(mocker):
+    # Runs a DAG through dag_node_task, one published node at a time
+    published = []
+    mocker.patch.object(
+        dag_node_service,
+        "publish_dag_node",
+        side_effect=lambda *arguments: published.append(arguments),
+    )
+    failures = mocker.patch.object(celery_app.backend, "mark_as_failure")
+
+    def run_nodes(expression):
+        nodes = compile_dag(ExpressionParser().parse(expression))
+        store = FakeRunStore(dag_fields(nodes))
+        mocker.patch.object(celery_app.backend, "client", store)
+        published.extend(
+            ("run", index, node.symbol, node.operands, node.parents)
+            for index, node in enumerate(nodes)
+            if not node.children
+        )
+        # Node index -> its EagerResult, in the order the nodes ran
+        results = {}
+        while published:
+            arguments = published.pop(0)
+            assert arguments[1] not in results
+            results[arguments[1]] = dag_node_task.apply(arguments)
+        return results, store, failures
+
+    return run_nodes
+
+
+def test_each_node_runs_once_after_its_inputs(run):
+    results, store, _ = run("((1 + 2) * (1 + 2)) / (7 - 3) - 4")
+
+    assert list(results) == [0, 2, 1, 3, 4]
+    assert results[4].get() == -1.75
+    assert store.deleted
+
+
+def test_a_failed_node_fails_the_run_and_stops_it(run):
+    results, store, failures = run("(1 / (2 - 2)) + (3 * 4 - 5)")
+
+    assert isinstance(results[1].result, ZeroDivisionError)
+    # Stored under the run id, where the orchestrator waits for the root
+    run_id, error = failures.call_args_list[0].args
+    assert run_id == "run"
+    assert str(error) == "Cannot divide 1 by zero."
+    # The other branch completes without publishing the root
+    assert list(results) == [0, 2, 1, 3]
+    assert store.fields["failed"] == "1"
+    assert not store.deleted
+
+
+def test_start_registers_the_run_once_and_publishes_the_leaves(mocker):
+    executor = DagExecutor("redis://dag", key_prefix="dag:", ttl_seconds=60)
+    pipeline = mocker.MagicMock()
+    pipeline.execute = mocker.AsyncMock()
+    client = mocker.MagicMock()
+    client.pipeline.return_value.__aenter__.return_value = pipeline
+    mocker.patch(
+        "app.services.dag_executor.aioredis.Redis.from_url", return_value=client
+    )
+    publish = mocker.patch("app.services.dag_executor.publish_dag_node")
+    nodes = compile_dag(ExpressionParser().parse("(1 - 2) * (3 - 4) - 5"))
+
+    result = asyncio.run(executor.start(nodes))
+
+    key = f"dag:{result.id}"
+    pipeline.hset.assert_called_once_with(key, mapping=dag_fields(nodes))
+    pipeline.expire.assert_called_once_with(key, 60)
+    pipeline.execute.assert_awaited_once()
+    assert [call.args[1:] for call in publish.call_args_list] == [
+        (0, "-", [1, 2], [2]),
+        (1, "-", [3, 4], [2]),
+    ]
+    assert executor.stats() == {"runs": 1, "tasks": 4}
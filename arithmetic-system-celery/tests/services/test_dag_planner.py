@@ -0,0 +1,100 @@
+import random
+from functools import reduce
+
+import pytest
+
+from app.services.dag_planner import (
+    NODE_PREFIX,
+    compile_dag,
+    dag_fields,
+    dag_to_string,
+)
+from app.services.evaluator import PROGRAM_OPERATORS, apply_operation, evaluate
+from app.services.expression_parser import ExpressionParser
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def run_in_order(nodes):
+    # Children precede their parents, so one pass computes every node
+    values = []
+    for node in nodes:
+        operation = PROGRAM_OPERATORS[node.symbol]
+        operands = [
+            values[int(o[1:])] if isinstance(o, str) else o for o in node.operands
+        ]
+        values.append(
+            reduce(lambda x, y: apply_operation(operation, x, y), operands)
+        )
+    return values[-1]
+
+
+def test_equal_subtrees_are_one_node_with_a_parent_per_use(parser):
+    nodes = compile_dag(parser.parse("(1 + 2) * (1 + 2) - (3 - 4)"))
+
+    assert [(node.symbol, node.operands, node.parents) for node in nodes] == [
+        ("+", [1, 2], [1, 1]),
+        ("*", ["%0", "%0"], [3]),
+        ("-", [3, 4], [3]),
+        ("-", ["%1", "%2"], []),
+    ]
+    assert dag_fields(nodes) == {
+        "node:1": '["*", ["%0", "%0"], [3]]',
+        "children:1": "0 0",
+        "pending:1": 2,
+        "node:3": '["-", ["%1", "%2"], []]',
+        "children:3": "1 2",
+        "pending:3": 2,
+    }
+    assert dag_to_string(nodes) == "dag(4 tasks, 3 levels)"
+
+
+def test_runs_of_one_operation_are_one_node_up_to_the_fan_in(parser):
+    nodes = compile_dag(parser.parse("1 + 2 + 3 + 4 + 5 + 6 * 7"))
+    assert [node.operands for node in nodes] == [[6, 7], [1, 2, 3, 4, 5, "%0"]]
+
+    nodes = compile_dag(parser.parse("1 + 2 + 3 + 4 + 5 + 6 + 7"), max_fan_in=3)
+    assert [node.operands for node in nodes] == [
+        [1, 2, 3],
+        [4, 5, 6],
+        ["%0", "%1", 7],
+    ]
+    assert nodes[0].parents == nodes[1].parents == [2]
+
+
+def test_constants_of_different_types_are_not_merged(parser):
+    nodes = compile_dag(parser.parse("(1 + 2) - (1.0 + 2)"))
+    assert len(nodes) == 3
+
+
+def test_nodes_compute_the_expression(parser):
+    rng = random.Random(7)
+
+    def expression(depth):
+        if depth == 0 or rng.random() < 0.2:
+            return str(rng.randint(1, 9))
+        operator = rng.choice("+-*/")
+        return f"({expression(depth - 1)} {operator} {expression(depth - 1)})"
+
+    for _ in range(200):
+        tree = parser.parse(f"{expression(5)} - {expression(5)}")
+        nodes = compile_dag(tree, max_fan_in=4)
+        assert all(
+            len(node.operands) <= 4
+            and all(
+                int(o[1:]) < index
+                for o in node.operands
+                if isinstance(o, str) and o.startswith(NODE_PREFIX)
+            )
+            for index, node in enumerate(nodes)
+        )
+        try:
+            expected = evaluate(tree)
+        except ZeroDivisionError:
+            with pytest.raises(ZeroDivisionError):
+                run_in_order(nodes)
+        else:
+            assert run_in_order(nodes) == pytest.approx(expected)
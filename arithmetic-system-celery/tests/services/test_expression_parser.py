@@ -1,8 +1,18 @@
+import re
+
 import pytest
+from app.services.evaluator import evaluate, evaluate_compact
 from app.services.expression_parser import (
+    CompactExpression,
     ExpressionParser,
     ExpressionNode,
     OperationEnum,
+    Variable,
+)
+from app.types.errors import (
+    ExpressionSyntaxError,
+    UnsupportedOperatorError,
+    UnsupportedUnaryOperatorError,
 )
 
 
@@ -125,3 +135,135 @@ def test_parse_complex_expression(parser):
     assert right.left.operation == OperationEnum.MUL
     assert right.left.left == 3
     assert right.left.right.operation == OperationEnum.SUB
+
+
+def test_parse_unary_minus_on_subexpression(parser):
+    tree = parser.parse("-(2 + 3) * 4")
+    assert tree.operation == OperationEnum.MUL
+    assert tree.right == 4
+    assert tree.left.operation == OperationEnum.SUB
+    assert tree.left.left == 0
+    assert tree.left.right.operation == OperationEnum.ADD
+
+
+def test_parse_repeated_unary_minus(parser):
+    assert parser.parse("--3") == 3
+    assert parser.parse("2 - -3").right == -3
+
+
+def test_parse_shares_identical_subtrees(parser):
+    tree = parser.parse("(1 + 2) * (1 + 2) - (1 + 2) / 3")
+    assert tree.left.left is tree.left.right
+    assert tree.right.left is tree.left.left
+    # Same value, different spelling: still distinct nodes
+    tree = parser.parse("(1 + 2) * (1.0 + 2)")
+    assert tree.left is not tree.right
+
+
+def test_parse_keeps_number_types(parser):
+    assert isinstance(parser.parse("42"), int)
+    assert parser.parse(".5") == 0.5
+    assert parser.parse("7.") == 7.0
+
+
+def test_parse_deeply_nested_parentheses(parser):
+    depth = 50_000
+    tree = parser.parse("(" * depth + "1 + 2" + ")" * depth)
+    assert tree.operation == OperationEnum.ADD
+    assert tree.left == 1
+    assert tree.right == 2
+
+
+def test_parse_wide_expression(parser):
+    terms = 20_000
+    tree = parser.parse(" - ".join(str(i) for i in range(1, terms + 1)))
+    depth = 0
+    while isinstance(tree, ExpressionNode):
+        assert tree.operation == OperationEnum.SUB
+        assert tree.right == terms - depth
+        tree = tree.left
+        depth += 1
+    assert depth == terms - 1
+    assert tree == 1
+
+
+@pytest.mark.parametrize(
+    "expression, error, message_part",
+    [
+        ("5+*3", ExpressionSyntaxError, "invalid syntax"),
+        ("5 + ", ExpressionSyntaxError, "invalid syntax"),
+        ("(5 + 3", ExpressionSyntaxError, "'(' was never closed"),
+        ("5 + 3)", ExpressionSyntaxError, "unmatched ')'"),
+        ("1 2", ExpressionSyntaxError, "invalid syntax"),
+        ("012", ExpressionSyntaxError, "leading zeros"),
+        ("5 +* a", ExpressionSyntaxError, "invalid characters"),
+        ("   ", ExpressionSyntaxError, "Expression cannot be empty"),
+        ("5 % 2", UnsupportedOperatorError, "Mod"),
+        ("2 ** 3", UnsupportedOperatorError, "Pow"),
+        ("7 // 2", UnsupportedOperatorError, "FloorDiv"),
+        ("+3", UnsupportedUnaryOperatorError, "UAdd"),
+        ("5 % (2 +", ExpressionSyntaxError, "was never closed"),
+    ],
+)
+def test_parse_errors(parser, expression, error, message_part):
+    with pytest.raises(error, match=re.escape(message_part)):
+        parser.parse(expression)
+    with pytest.raises(error, match=re.escape(message_part)):
+        parser.parse_compact(expression)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["42", "-2.5", "(1 + 2) * (1 + 2) - -(3 / 4)", "2 * 3 - 12345678901234567890123"],
+)
+def test_parse_compact_matches_tree(parser, expression):
+    compact = parser.parse_compact(expression)
+    tree = parser.parse(expression)
+
+    assert evaluate_compact(compact) == evaluate(tree)
+    assert compact.to_tree() == tree
+    assert CompactExpression.from_tree(tree).to_tree() == tree
+
+
+def test_parse_compact_shares_slots(parser):
+    compact = parser.parse_compact("(1 + 2) * (1 + 2) + 1 + 3")
+    # 1, 2, 1 + 2, the product, 3 and two additions
+    assert len(compact) == 7
+    assert [
+        compact.constant(index)
+        if compact.operation(index) is None
+        else compact.operation(index)
+        for index in compact.flatten_commutative(compact.root)
+    ] == [OperationEnum.MUL, 1, 3]
+
+
+def test_parse_compact_wide_expression(parser):
+    terms = 20_000
+    compact = parser.parse_compact(" - ".join(str(i) for i in range(1, terms + 1)))
+    assert len(compact) == 2 * terms - 1
+    assert evaluate_compact(compact) == 1 - sum(range(2, terms + 1))
+
+
+def test_parse_prepared_numbers_variables_by_first_appearance(parser):
+    tree, variables = parser.parse_prepared("rate * (base + 2) - -rate")
+
+    assert variables == ["rate", "base"]
+    assert tree.to_infix() == "(rate * (base + 2)) - (0 - rate)"
+    rate = tree.left.left
+    assert isinstance(rate, Variable) and rate == 0
+    assert tree.right.right is rate
+
+
+@pytest.mark.parametrize(
+    "expression, message_part",
+    [
+        ("x y", "invalid syntax"),
+        ("2x", "invalid syntax"),
+        ("x + 01", "leading zeros"),
+        ("x + $", "invalid characters"),
+    ],
+)
+def test_parse_prepared_errors(parser, expression, message_part):
+    with pytest.raises(ExpressionSyntaxError, match=re.escape(message_part)):
+        parser.parse_prepared(expression)
+
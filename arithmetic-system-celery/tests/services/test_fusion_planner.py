@@ -0,0 +1,106 @@
+import pytest
+
+from app.services.evaluator import evaluate, evaluate_program
+from app.services.expression_parser import ExpressionParser
+from app.services.fusion_planner import FusedChunk, FusionPlanner
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def run_chunk(chunk: FusedChunk) -> float:
+    inputs = [run_chunk(input_chunk) for input_chunk in chunk.inputs]
+    return evaluate_program(chunk.program, inputs)
+
+
+def count_chunks(chunk: FusedChunk) -> int:
+    return 1 + sum(count_chunks(input_chunk) for input_chunk in chunk.inputs)
+
+
+def test_cheap_hops_fuse_whole_tree_when_unsplittable(parser):
+    planner = FusionPlanner(
+        hop_latency_seconds=1.0, worker_concurrency=1, op_cost_seconds=1e-6
+    )
+    chunk = planner.plan(parser.parse("(1 + 2) * (3 - 4) / 5"))
+
+    assert chunk.inputs == []
+    assert chunk.program == [1, 2, "+", 3, 4, "-", "*", 5, "/"]
+    assert chunk.operations == 4
+
+
+def test_tree_is_spread_over_workers(parser):
+    expression = " + ".join(f"({i} * {i + 1})" for i in range(64))
+    planner = FusionPlanner(
+        hop_latency_seconds=1e-6, worker_concurrency=4, op_cost_seconds=1e-6
+    )
+    tree = parser.parse(expression)
+    chunk = planner.plan(tree)
+
+    assert planner.target_chunk_operations(127) == 32
+    assert 1 < count_chunks(chunk) <= 8
+    assert run_chunk(chunk) == evaluate(tree)
+
+
+def test_cut_points_become_program_inputs(parser):
+    planner = FusionPlanner(
+        hop_latency_seconds=2e-6, worker_concurrency=3, op_cost_seconds=1e-6
+    )
+    tree = parser.parse("((1 + 2) * (3 + 4)) - ((5 + 6) / (7 - 8))")
+    chunk = planner.plan(tree)
+
+    assert chunk.program == ["$0", "$1", "-"]
+    assert [input_chunk.program for input_chunk in chunk.inputs] == [
+        [1, 2, "+", 3, 4, "+", "*"],
+        [5, 6, "+", 7, 8, "-", "/"],
+    ]
+    assert run_chunk(chunk) == evaluate(tree)
+
+
+def test_shared_subtree_is_one_input(parser):
+    planner = FusionPlanner(
+        hop_latency_seconds=3e-6, worker_concurrency=5, op_cost_seconds=1e-6
+    )
+    tree = parser.parse("((1 + 2) * (3 + 4)) - ((1 + 2) * (3 + 4)) / 5")
+    chunk = planner.plan(tree)
+
+    assert chunk.program == ["$0", "$0", 5, "/", "-"]
+    assert [input_chunk.program for input_chunk in chunk.inputs] == [
+        [1, 2, "+", 3, 4, "+", "*"]
+    ]
+    assert run_chunk(chunk) == evaluate(tree)
+
+
+def test_repeated_work_is_cut_once_it_reaches_the_target(parser):
+    planner = FusionPlanner(
+        hop_latency_seconds=4e-6, worker_concurrency=7, op_cost_seconds=1e-6
+    )
+    # Each use is under the target, all three together are over it
+    tree = parser.parse("(1 + 2 + 3) * 4 + (1 + 2 + 3) / 5 + ((1 + 2 + 3) - 6)")
+    chunk = planner.plan(tree)
+
+    assert chunk.program.count("$0") == 3
+    assert [input_chunk.program for input_chunk in chunk.inputs] == [
+        [1, 2, "+", 3, "+"]
+    ]
+    assert run_chunk(chunk) == evaluate(tree)
+
+
+def test_latency_samples_are_smoothed():
+    planner = FusionPlanner(
+        hop_latency_seconds=0.01,
+        worker_concurrency=1,
+        op_cost_seconds=1e-6,
+        smoothing=0.5,
+    )
+    planner.record_workflow_latency(0.09, hops=3)
+    assert planner.hop_latency_seconds == pytest.approx(0.02)
+
+    planner.record_workflow_latency(1.0, hops=0)
+    assert planner.hop_latency_seconds == pytest.approx(0.02)
+    assert planner.target_chunk_operations(10) == 20000
+
+
+def test_measured_op_cost_is_positive():
+    assert FusionPlanner.measure_op_cost(operations=1000) > 0
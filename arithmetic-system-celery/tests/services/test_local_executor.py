@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+from app.services.evaluator import evaluate
+from app.services.expression_parser import ExpressionParser
+from app.services.local_executor import LocalExecutor, local_pool
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_pools_evaluate_like_the_workers(parser, kind):
+    executor = LocalExecutor(local_pool(kind, 2), max_operations=64)
+    # Deep enough that the process pool must not pickle the tree itself
+    deep = " - ".join(str(i) for i in range(5000))
+    expressions = ["(1 + 2) * (1 + 2) / 4 - 7", f"{2**60} * 3 - 1", deep]
+
+    async def run():
+        return [
+            await executor.evaluate(parser.parse(expression), 0, 5.0)
+            for expression in expressions
+        ]
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.close()
+    assert results == [evaluate(parser.parse(e)) for e in expressions]
+    assert results[1] == 2**60 * 3 - 1
+
+
+def test_errors_match_the_worker_tasks(parser):
+    executor = LocalExecutor(local_pool("thread", 1), max_operations=64)
+
+    with pytest.raises(ZeroDivisionError, match="Cannot divide 3 by zero."):
+        asyncio.run(executor.evaluate(parser.parse("(1 + 2) / (2 - 2)"), 3, 5.0))
+    assert executor.stats()["errors"] == 1
+    assert executor.stats()["evaluations"] == 1
+
+
+def test_slow_evaluations_time_out(parser):
+    # Any Executor will do; this one holds its single thread until released
+    pool = ThreadPoolExecutor(1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    executor = LocalExecutor(pool, max_operations=64)
+
+    with pytest.raises(CeleryTimeoutError):
+        asyncio.run(executor.evaluate(parser.parse("1 + 2"), 1, 0.05))
+    release.set()
+    executor.close()
+    assert executor.accepts(64) and not executor.accepts(65)
+
+
+def test_unknown_pools_are_rejected():
+    with pytest.raises(ValueError, match="Unknown local pool 'fiber'"):
+        local_pool("fiber", 1)
@@ -0,0 +1,452 @@
+import asyncio
+import threading
+
+import pytest
+from celery.result import EagerResult
+
+from app.services.evaluator import evaluate
+from app.services.execution_backend import DagBackend, LocalBackend
+from app.services.expression_parser import CompactExpression
+from app.services.orchestrator import WorkflowOrchestrator
+from app.types.errors import PreparedExpressionNotFoundError, VariableBindingError
+
+
+@pytest.fixture
+def orchestrator():
+    return WorkflowOrchestrator()
+
+
+class TestWorkflowCache:
+    """Tests for the parsed expression / compiled workflow cache"""
+
+    def test_identical_expression_skips_parser(self, orchestrator, mocker):
+        parse = mocker.spy(orchestrator.parser, "parse_compact")
+        first = orchestrator.compile("1 + 2 * 3")
+        second = orchestrator.compile("1+2*3")
+
+        assert second is first
+        assert parse.call_count == 1
+
+    def test_reordered_commutative_operands_skip_builder(self, orchestrator, mocker):
+        compile_workflow = mocker.spy(orchestrator.builder, "compile")
+        first = orchestrator.compile("(1 + 2) * (3 + 4) * 5")
+        second = orchestrator.compile("5 * (4 + 3) * (2 + 1)")
+
+        assert second is first
+        assert compile_workflow.call_count == 1
+
+    def test_canonical_hits_build_no_tree(self, orchestrator, mocker):
+        to_tree = mocker.spy(CompactExpression, "to_tree")
+        first = orchestrator.compile("(1 + 2) * (3 + 4) * 5")
+        second = orchestrator.compile("5 * (4 + 3) * (2 + 1)")
+
+        assert second is first
+        assert to_tree.call_count == 1
+
+    def test_non_commutative_operands_are_not_reordered(self, orchestrator):
+        assert orchestrator.compile("6 - 2") is not orchestrator.compile("2 - 6")
+        assert orchestrator.compile("6 / 2") is not orchestrator.compile("2 / 6")
+
+    def test_cached_workflow_is_dispatched_repeatedly(self, orchestrator):
+        first = asyncio.run(orchestrator.calculate("(1 + 2) * (3 - 4)"))
+        second = asyncio.run(orchestrator.calculate("(2 + 1) * (3 - 4)"))
+
+        assert first.result == second.result == -3
+        stats = orchestrator.metrics()["workflow_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 3
+
+    def test_expressions_of_one_shape_reuse_a_template(self):
+        orchestrator = WorkflowOrchestrator(constant_folding=False)
+        first = asyncio.run(orchestrator.calculate("(1 + 2) * (3 - 4)"))
+        second = asyncio.run(orchestrator.calculate("(5 + 6) * (7 - 9)"))
+
+        assert first.result == -3
+        assert second.result == -22
+        stats = orchestrator.metrics()["workflow_templates"]
+        assert stats["hits"] == stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+
+class TestCompileThread:
+    """Tests for compiling large expressions off the event loop"""
+
+    def test_long_expressions_are_compiled_on_a_thread(self, orchestrator, mocker):
+        threads = []
+        compile = orchestrator.compile
+
+        def recording_compile(expression):
+            threads.append(threading.get_ident())
+            return compile(expression)
+
+        mocker.patch.object(orchestrator, "compile", side_effect=recording_compile)
+        long = " + ".join(["1"] * 5000)
+
+        asyncio.run(orchestrator.calculate("1 + 2"))
+        response = asyncio.run(orchestrator.calculate(long))
+
+        assert threads[0] == threading.get_ident()
+        assert threads[1] != threading.get_ident()
+        assert response.result == 5000
+
+
+class TestChainRewrite:
+    """Tests for regrouped SUB/DIV chains"""
+
+    @pytest.mark.parametrize("constant_folding", [True, False])
+    def test_underflowing_divisors_keep_the_stepwise_result(self, constant_folding):
+        orchestrator = WorkflowOrchestrator(
+            tree_rebalance=False, constant_folding=constant_folding
+        )
+        tiny = f"0.{'0' * 199}1"
+
+        response = asyncio.run(orchestrator.calculate(f"{tiny} / {tiny} / {tiny}"))
+        assert response.result == pytest.approx(1e200)
+
+    @pytest.mark.parametrize("constant_folding", [True, False])
+    def test_overflowing_terms_keep_the_stepwise_result(self, constant_folding):
+        orchestrator = WorkflowOrchestrator(
+            tree_rebalance=False, constant_folding=constant_folding
+        )
+        big = f"1{'0' * 308}.0"
+        expression = f"{big} - {big} + {big} - " + " - ".join(
+            str(i) for i in range(1, 21)
+        )
+
+        response = asyncio.run(orchestrator.calculate(expression))
+        assert response.result == 1e308
+
+
+class TestFusion:
+    """Tests for fused subtree evaluation"""
+
+    def test_fused_workflow_matches_local_evaluation(self):
+        expression = " + ".join(f"({i} * {i + 1} - {i} / 2)" for i in range(1, 40))
+        orchestrator = WorkflowOrchestrator(constant_folding=False, fusion=True)
+
+        response = asyncio.run(orchestrator.calculate(expression))
+        assert "evaluate_subtree_task" in response.workflow
+        assert response.result == pytest.approx(
+            evaluate(orchestrator.parser.parse(expression))
+        )
+        assert orchestrator.metrics()["fusion"]["worker_concurrency"] > 0
+
+
+class TestStreaming:
+    """Tests for streamed evaluation"""
+
+    def test_in_flight_workflows_are_bounded(self, orchestrator, mocker):
+        running = peak = 0
+
+        async def calculate(expression):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001 * (int(expression) % 3))
+            running -= 1
+            return int(expression)
+
+        mocker.patch.object(orchestrator, "calculate", side_effect=calculate)
+
+        async def expressions():
+            for i in range(50):
+                yield str(i)
+
+        async def collect():
+            return [
+                outcome
+                async for outcome in orchestrator.calculate_stream(
+                    expressions(), max_in_flight=4
+                )
+            ]
+
+        outcomes = asyncio.run(collect())
+        assert peak <= 4
+        assert sorted(index for index, _, _ in outcomes) == list(range(50))
+        assert all(result == int(expression) for _, expression, result in outcomes)
+
+
+class TestResultCache:
+    """Tests for the final result cache"""
+
+    def test_repeated_expression_is_served_from_cache(self):
+        orchestrator = WorkflowOrchestrator(constant_folding=False)
+        first = asyncio.run(orchestrator.calculate("(1 + 2) * (3 + 4) * (5 + 6)"))
+        second = asyncio.run(orchestrator.calculate("(6 + 5) * (4 + 3) * (2 + 1)"))
+
+        assert first.cached is False
+        assert second.cached is True
+        assert second.result == first.result == 231
+        stats = orchestrator.metrics()["result_cache"]
+        assert stats["l1"]["hits"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_result_cache_can_be_disabled(self):
+        orchestrator = WorkflowOrchestrator(
+            constant_folding=False, result_cache=False
+        )
+        asyncio.run(orchestrator.calculate("(1 + 2) * (3 + 4) * (5 + 6)"))
+        response = asyncio.run(orchestrator.calculate("(1 + 2) * (3 + 4) * (5 + 6)"))
+
+        assert response.cached is False
+        assert "result_cache" not in orchestrator.metrics()
+
+
+class TestSingleFlight:
+    """Tests for coalescing concurrent identical requests"""
+
+    def test_concurrent_duplicates_dispatch_one_workflow(self, mocker):
+        orchestrator = WorkflowOrchestrator(constant_folding=False, result_cache=False)
+        dispatch = mocker.spy(orchestrator.builder, "dispatch")
+
+        async def burst():
+            return await asyncio.gather(
+                *(orchestrator.calculate("(1 + 2) * (3 + 4)") for _ in range(20))
+            )
+
+        responses = asyncio.run(burst())
+        assert {response.result for response in responses} == {21}
+        assert dispatch.call_count == 1
+        assert orchestrator.metrics()["single_flight"]["coalesced"] == 19
+
+
+class TestSubtreeMemo:
+    """Tests for reusing subtree values across requests"""
+
+    def test_completed_subtrees_are_stored(self, mocker):
+        orchestrator = WorkflowOrchestrator(constant_folding=False)
+        orchestrator.subtree_memo.min_operations = 2
+        store = mocker.patch(
+            "app.workers.memo_service.store_subtree_result_task.run"
+        )
+
+        expression = "((1 + 2) * 3 - 5) / (6 - 7 * 8)"
+        response = asyncio.run(orchestrator.calculate(expression))
+
+        memo_subtrees = orchestrator.compile(expression).memo_subtrees
+        stored = {call.kwargs["key"]: call.args[0] for call in store.call_args_list}
+        assert response.result == pytest.approx(4 / -50)
+        assert set(stored) == set(memo_subtrees)
+        assert sorted(stored.values()) == [-50, 4, 9]
+
+    def test_recalled_subtrees_become_constants(self):
+        orchestrator = WorkflowOrchestrator(constant_folding=False)
+        orchestrator.subtree_memo.min_operations = 2
+        subtree = orchestrator.compile("3 * (2 + 1) - 5")
+        asyncio.run(orchestrator.result_cache.set(subtree.canonical_key, 4, 0.1))
+
+        response = asyncio.run(
+            orchestrator.calculate("((1 + 2) * 3 - 5) / (6 - 7 * 8)")
+        )
+
+        assert response.result == pytest.approx(4 / -50)
+        assert response.workflow == (
+            "recalled(((1 + 2) * 3) - 5 = 4) -> "
+            "multiply_task(7, 8) | subtract_task(y=6, is_left_fixed=True) | "
+            "divide_task(y=4, is_left_fixed=True)"
+        )
+        assert orchestrator.metrics()["subtree_memo"]["hits"] == 1
+
+
+class TestCommonSubtreeElimination:
+    """Tests for evaluating a repeated subexpression once per request"""
+
+    def test_repeated_subtree_is_dispatched_once(self, mocker):
+        orchestrator = WorkflowOrchestrator(result_cache=False)
+        run_group = mocker.spy(orchestrator, "_run_group")
+        total = "(" + " - ".join(str(i) for i in range(1, 21)) + ")"
+        expression = f"{total} * {total} - {total} / 3"
+
+        response = asyncio.run(orchestrator.calculate(expression))
+
+        expected = evaluate(orchestrator.parser.parse(expression))
+        assert response.result == pytest.approx(expected)
+        assert len(run_group.call_args.args[0]) == 1
+        assert response.workflow.startswith("cse(")
+        assert "-208 * -208" in response.workflow
+
+    def test_stage_two_is_built_once(self, mocker):
+        orchestrator = WorkflowOrchestrator(result_cache=False, constant_folding=False)
+        total = "(" + " - ".join(str(i) for i in range(1, 21)) + ")"
+        expression = f"{total} / 3 - {total} / 4"
+        first = asyncio.run(orchestrator.calculate(expression))
+        compile_workflow = mocker.spy(orchestrator.builder, "compile")
+        build = mocker.spy(orchestrator.builder, "_build_workflow")
+
+        second = asyncio.run(orchestrator.calculate(expression))
+
+        expected = evaluate(orchestrator.parser.parse(expression))
+        assert first.result == second.result == pytest.approx(expected)
+        assert second.workflow == first.workflow
+        assert second.workflow.startswith("cse(")
+        assert compile_workflow.call_count == build.call_count == 0
+
+    def test_stage_one_must_save_more_than_its_hops_cost(self):
+        orchestrator = WorkflowOrchestrator(constant_folding=False)
+        shared = "((1 + 2) * (3 - 4) - 5)"
+        deep = "(((((6 - 7) / 8 - 9) / 10 - 11) / 12 - 13) / 14 - 15)"
+
+        compiled = orchestrator.compile(f"{shared} * 2 + {shared} / 3 + {deep}")
+
+        # Off the critical path, the four saved tasks do not pay for the
+        # stage's three round trips
+        tree = compiled.expression_tree
+        assert len(orchestrator.batch_planner.shared_subtrees([tree])) == 1
+        assert compiled.shared_subtrees == []
+
+    def test_elimination_can_be_disabled(self):
+        orchestrator = WorkflowOrchestrator(common_subtree_elimination=False)
+        total = "(" + " - ".join(str(i) for i in range(1, 21)) + ")"
+
+        compiled = orchestrator.compile(f"{total} * {total}")
+
+        assert compiled.shared_subtrees == []
+
+
+class TestPreparedExpressions:
+    """Tests for expressions prepared once and executed with variable values"""
+
+    def test_executions_only_bind_values(self, orchestrator, mocker):
+        prepared = orchestrator.prepare("x * (y - 1) + x")
+        parse = mocker.spy(orchestrator.parser, "parse_prepared")
+        build = mocker.spy(orchestrator.builder, "_build_workflow")
+
+        first = asyncio.run(
+            orchestrator.execute(prepared.expression_id, {"x": 2, "y": 4})
+        )
+        second = asyncio.run(
+            orchestrator.execute(prepared.expression_id, {"x": 3, "y": 0.5})
+        )
+
+        assert prepared.variables == ["x", "y"]
+        assert first.result == 8
+        assert second.result == 1.5
+        assert parse.call_count == build.call_count == 0
+
+    def test_preparing_again_returns_the_same_handle(self, orchestrator):
+        first = orchestrator.prepare("a + b * 2")
+        second = orchestrator.prepare("a+b*2")
+
+        assert second is first
+        assert orchestrator.metrics()["prepared_expressions"]["hits"] == 1
+
+    def test_values_must_match_the_variables(self, orchestrator):
+        prepared = orchestrator.prepare("a / b")
+
+        with pytest.raises(VariableBindingError, match="Missing .*: b"):
+            asyncio.run(orchestrator.execute(prepared.expression_id, {"a": 1}))
+        with pytest.raises(VariableBindingError, match="Unknown variables: c"):
+            asyncio.run(
+                orchestrator.execute(prepared.expression_id, {"a": 1, "b": 2, "c": 3})
+            )
+        with pytest.raises(PreparedExpressionNotFoundError):
+            asyncio.run(orchestrator.execute("missing", {}))
+
+    def test_columns_are_evaluated_locally_or_in_chunks(self, orchestrator):
+        prepared = orchestrator.prepare("x / y + 1")
+        columns = {"x": [1, 2, 3, 4, 5], "y": [1, 0, 2, 4, 0]}
+
+        local = asyncio.run(
+            orchestrator.evaluate_columns(prepared.expression_id, columns)
+        )
+        chunked = asyncio.run(
+            orchestrator.evaluate_columns(
+                prepared.expression_id, columns, local_max_rows=2, chunk_rows=2
+            )
+        )
+
+        assert local.results == chunked.results == [2.0, None, 2.5, 2.0, None]
+        assert [(error.row, error.error) for error in chunked.errors] == [
+            (1, "Cannot divide 2.0 by zero."),
+            (4, "Cannot divide 5.0 by zero."),
+        ]
+        assert local.workflow == "vectorized(2 steps, 5 rows)"
+        assert chunked.workflow == "group(3 x vectorized(2 steps, 2 rows))"
+
+    def test_columns_must_have_one_length(self, orchestrator):
+        prepared = orchestrator.prepare("x + y")
+
+        with pytest.raises(VariableBindingError, match="differ in length"):
+            asyncio.run(
+                orchestrator.evaluate_columns(
+                    prepared.expression_id, {"x": [1, 2], "y": [1]}
+                )
+            )
+
+
+
+class TestDagExecutor:
+    """Tests for running expressions as a DAG instead of a Celery canvas"""
+
+    def test_remote_expressions_run_as_a_dag(self, mocker):
+        orchestrator = WorkflowOrchestrator(
+            result_cache=False, constant_folding=False, dag_executor=True
+        )
+        start = mocker.patch.object(
+            orchestrator.dag_executor,
+            "start",
+            return_value=EagerResult("run", -4.0, "SUCCESS"),
+        )
+        expression = "(1 + 2) * (1 + 2) - (3 - 4) / 2 - (1 + 2) * (1 + 2)"
+
+        compiled = orchestrator.compile(expression)
+        response = asyncio.run(orchestrator.calculate(expression))
+
+        # The repeated subtree is a node of the DAG rather than a stage
+        assert compiled.shared_subtrees == []
+        assert isinstance(compiled.backend, DagBackend)
+        assert [node.operands for node in compiled.backend.nodes][:2] == [
+            [1, 2],
+            ["%0", "%0"],
+        ]
+        assert compiled.workflow_string.endswith("dag(6 tasks, 4 levels)")
+        start.assert_awaited_once_with(compiled.backend.nodes)
+        assert response.result == -4.0
+        assert response.workflow == compiled.workflow_string
+
+    def test_constant_expressions_are_not_dispatched(self):
+        orchestrator = WorkflowOrchestrator(dag_executor=True)
+
+        compiled = orchestrator.compile("(1 + 2) * 3")
+
+        assert compiled.backend is orchestrator.celery_backend
+        assert compiled.workflow_string.endswith("constant(9)")
+
+
+class TestLocalExecution:
+    """Tests for evaluating small expressions in the API process"""
+
+    def test_expressions_are_routed_by_operation_count(self, mocker):
+        orchestrator = WorkflowOrchestrator(
+            result_cache=False, constant_folding=False, local_execution=True
+        )
+        orchestrator.local_executor.max_operations = 4
+        dispatch = mocker.spy(orchestrator.builder, "dispatch")
+        small = "(1 + 2) * (3 - 4) / 5"
+        large = "(1 + 2) * (3 + 4) * (5 + 6)"
+
+        compiled = orchestrator.compile(small)
+        response = asyncio.run(orchestrator.calculate(small))
+
+        assert isinstance(compiled.backend, LocalBackend)
+        assert compiled.backend.operations == 4
+        assert compiled.memo_subtrees == {} and compiled.shared_subtrees == []
+        assert response.workflow == "local(4 operations)"
+        assert response.result == -0.6
+        dispatch.assert_not_called()
+
+        response = asyncio.run(orchestrator.calculate(large))
+        assert orchestrator.compile(large).backend is orchestrator.celery_backend
+        assert response.result == 231
+        dispatch.assert_called_once()
+        assert orchestrator.metrics()["local_executor"]["operations"] == 4
+        asyncio.run(orchestrator.close())
+
+    def test_local_errors_surface_like_worker_errors(self):
+        orchestrator = WorkflowOrchestrator(
+            result_cache=False, constant_folding=False, local_execution=True
+        )
+
+        with pytest.raises(ZeroDivisionError, match="Cannot divide 3 by zero."):
+            asyncio.run(orchestrator.calculate("(1 + 2) / (2 - 2)"))
+        asyncio.run(orchestrator.close())
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.services.result_cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_l1_hit_records_saved_time(clock):
+    cache = ResultCache(l1_max_size=8, ttl_seconds=60, clock=clock)
+
+    async def scenario():
+        assert await cache.get("k") is None
+        await cache.set("k", 42, elapsed_seconds=0.5)
+        return await cache.get("k")
+
+    assert asyncio.run(scenario()) == (42, "l1")
+    stats = cache.stats()
+    assert stats["hit_ratio"] == 0.5
+    assert stats["mean_miss_seconds"] == 0.5
+    assert stats["saved_seconds"] == 0.5
+
+
+def test_l2_hit_populates_l1(clock, mocker):
+    cache = ResultCache(
+        l1_max_size=8, ttl_seconds=60, redis_url="redis://cache", clock=clock
+    )
+    client = mocker.AsyncMock()
+    client.get.return_value = b"2.5"
+    mocker.patch.object(cache, "_l2_client", return_value=client)
+
+    async def scenario():
+        return await cache.get("k"), await cache.get("k")
+
+    assert asyncio.run(scenario()) == ((2.5, "l2"), (2.5, "l1"))
+    client.get.assert_awaited_once_with("result-cache:k")
+    assert cache.stats()["l2_hits"] == 1
+
+
+def test_l2_failure_backs_off(clock, mocker):
+    cache = ResultCache(
+        l1_max_size=8,
+        ttl_seconds=60,
+        redis_url="redis://cache",
+        l2_retry_seconds=30,
+        clock=clock,
+    )
+    client = mocker.AsyncMock()
+    client.get.side_effect = ConnectionError("unreachable")
+    client.register_script = mocker.Mock()
+    mocker.patch(
+        "app.services.result_cache.aioredis.Redis.from_url", return_value=client
+    )
+
+    async def lookup():
+        return await cache.get("k")
+
+    assert asyncio.run(lookup()) is None
+    assert asyncio.run(lookup()) is None
+    assert client.get.await_count == 1
+
+    clock.now = 31
+    assert asyncio.run(lookup()) is None
+    assert client.get.await_count == 2
+    assert cache.stats()["l2_errors"] == 2
+
+
+def test_get_many_reads_l2_misses_in_one_round_trip(clock, mocker):
+    cache = ResultCache(
+        l1_max_size=8, ttl_seconds=60, redis_url="redis://cache", clock=clock
+    )
+    client = mocker.AsyncMock()
+    client.register_script = mocker.Mock()
+    client.mget.return_value = [b"3", None]
+    mocker.patch.object(cache, "_l2_client", return_value=client)
+
+    async def scenario():
+        await cache.set("a", 1, elapsed_seconds=0.1)
+        return await cache.get_many(["a", "b", "c"])
+
+    assert asyncio.run(scenario()) == {"a": 1, "b": 3}
+    client.mget.assert_awaited_once_with(["result-cache:b", "result-cache:c"])
+
+
+def test_get_many_stays_out_of_the_hit_ratio(clock, mocker):
+    cache = ResultCache(
+        l1_max_size=8, ttl_seconds=60, redis_url="redis://cache", clock=clock
+    )
+    client = mocker.AsyncMock()
+    client.register_script = mocker.Mock()
+    client.mget.return_value = [b"3"]
+    mocker.patch.object(cache, "_l2_client", return_value=client)
+
+    async def scenario():
+        await cache.set("a", 1, elapsed_seconds=0.1)
+        await cache.get_many(["a", "b"])
+        return await cache.get("a")
+
+    assert asyncio.run(scenario()) == (1, "l1")
+    stats = cache.stats()
+    assert stats["l1"]["hits"] == 1 and stats["l1"]["misses"] == 0
+    assert stats["l2_hits"] == stats["l2_misses"] == 0
+    assert stats["hit_ratio"] == 1.0
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from celery import states
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult
+
+from app.celery import app as celery_app
+from app.config import CELERY_RESULT_BACKEND_URL
+from app.services.result_waiter import ResultWaiter
+from app.workers.add_service import add_task
+
+
+def publish(queue: asyncio.Queue, task_id: str, status: str, result) -> None:
+    backend = celery_app.backend
+    payload = backend.encode(
+        {"task_id": task_id, "status": status, "result": result}
+    )
+    queue.put_nowait(
+        {
+            "type": "message",
+            "channel": backend.get_key_for_task(task_id),
+            "data": payload,
+        }
+    )
+
+
+async def wait_with_fake_redis(mocker, publish_messages, timeout=1.0):
+    waiter = ResultWaiter(celery_app, CELERY_RESULT_BACKEND_URL)
+    queue = asyncio.Queue()
+
+    async def get_message(timeout):
+        return await queue.get()
+
+    waiter._loop = asyncio.get_running_loop()
+    waiter._client = mocker.AsyncMock()
+    waiter._client.get.return_value = None
+    waiter._pubsub = mocker.AsyncMock()
+    waiter._pubsub.get_message.side_effect = get_message
+
+    publish_messages(queue)
+    try:
+        return await waiter.wait(AsyncResult("task-1", app=celery_app), timeout)
+    finally:
+        assert waiter.in_flight == 0
+        waiter._pubsub.unsubscribe.assert_awaited_once()
+        await waiter.close()
+
+
+def test_eager_result_is_returned_without_redis():
+    waiter = ResultWaiter(celery_app, CELERY_RESULT_BACKEND_URL)
+    assert asyncio.run(waiter.wait(add_task.apply((1, 2)), timeout=1.0)) == 3
+
+
+def test_waits_past_progress_updates(mocker):
+    def messages(queue):
+        publish(queue, "task-1", states.STARTED, None)
+        publish(queue, "task-1", states.SUCCESS, 42)
+
+    assert asyncio.run(wait_with_fake_redis(mocker, messages)) == 42
+
+
+def test_failure_is_raised_as_task_exception(mocker):
+    failure = celery_app.backend.prepare_exception(
+        ZeroDivisionError("Cannot divide 1 by zero.")
+    )
+
+    def messages(queue):
+        publish(queue, "task-1", states.FAILURE, failure)
+
+    with pytest.raises(ZeroDivisionError, match="Cannot divide 1 by zero."):
+        asyncio.run(wait_with_fake_redis(mocker, messages))
+
+
+def test_timeout_matches_async_result_get(mocker):
+    with pytest.raises(CeleryTimeoutError):
+        asyncio.run(wait_with_fake_redis(mocker, lambda queue: None, timeout=0.05))
+
+
+def test_failed_subscription_is_closed_before_reconnecting(mocker):
+    async def run():
+        waiter = ResultWaiter(celery_app, CELERY_RESULT_BACKEND_URL)
+        waiter._loop = asyncio.get_running_loop()
+        waiter._client = client = mocker.AsyncMock()
+        client.get.return_value = None
+        waiter._pubsub = pubsub = mocker.AsyncMock()
+        pubsub.get_message.side_effect = ConnectionError("Connection lost")
+
+        with pytest.raises(ConnectionError):
+            await waiter.wait(AsyncResult("task-1", app=celery_app), 1.0)
+        await asyncio.sleep(0)
+        return waiter, client, pubsub
+
+    waiter, client, pubsub = asyncio.run(run())
+    pubsub.aclose.assert_awaited_once()
+    client.aclose.assert_awaited_once()
+    # The next wait binds a new client and subscription
+    assert waiter._loop is None
@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+from kombu.serialization import dumps, loads, prepare_accept_content
+from kombu.utils import json
+
+from app.celery import app as celery_app
+from app.serializer import PACKED_SERIALIZER, PackedSerializer
+from app.workers import add_task, xsum_task
+
+
+@pytest.fixture
+def serializer():
+    return PackedSerializer(min_items=4, compress_min_bytes=1024)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        list(range(-3, 100)),
+        [2**40, -(2**40), 0, 1],
+        [0.1 * index for index in range(20)],
+        [1, 2.5, -3, float("inf"), 4.0],
+        [2**70, 1, 2, 3],
+        [2**60, 0.5, 1, 2],
+        [True, False, True, True],
+        [1, None, 2.5, 3],
+        [1, 2],
+    ],
+)
+def test_round_trips_like_json(serializer, values):
+    message = ((values,), {"values": tuple(values)}, {"callbacks": None})
+
+    result = serializer.loads(serializer.dumps(message))
+
+    assert repr(result) == repr(json.loads(json.dumps(message)))
+
+
+def test_numeric_lists_are_smaller_than_json(serializer):
+    values = [index / 7 for index in range(100)]
+
+    assert len(serializer.dumps([values])) < len(json.dumps([values])) / 2
+    assert len(serializer.dumps([list(range(100))])) < 200
+
+
+def test_large_bodies_are_compressed(serializer):
+    values = [1.5] * 10_000
+    body = serializer.dumps({"numbers": values, "when": datetime.date(2025, 1, 1)})
+
+    assert len(body) < 1024
+    assert serializer.loads(body) == {
+        "numbers": values,
+        "when": datetime.date(2025, 1, 1),
+    }
+
+
+def test_registered_for_the_celery_app():
+    signature = xsum_task.s(list(range(50))).set(link=add_task.s(1))
+    message = ((list(range(50)),), {}, {"callbacks": [signature]})
+
+    content_type, encoding, body = dumps(message, serializer=PACKED_SERIALIZER)
+    accept = prepare_accept_content(celery_app.conf.accept_content)
+    result = loads(body, content_type, encoding, accept=accept)
+
+    assert celery_app.conf.task_serializer == PACKED_SERIALIZER
+    assert result == json.loads(json.dumps(message))
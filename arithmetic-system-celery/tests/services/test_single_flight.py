@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 7
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", compute) for _ in range(20)))
+
+    assert asyncio.run(scenario()) == [7] * 20
+    assert calls == 1
+    assert flight.stats() == {
+        "executed": 1,
+        "coalesced": 19,
+        "replica_coalesced": 0,
+        "in_flight": 0,
+    }
+
+
+def test_failure_is_shared_and_not_remembered():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ZeroDivisionError("Cannot divide 1 by zero.")
+
+    async def scenario():
+        return await asyncio.gather(
+            flight.do("k", fail), flight.do("k", fail), return_exceptions=True
+        )
+
+    assert [type(outcome) for outcome in asyncio.run(scenario())] == [
+        ZeroDivisionError,
+        ZeroDivisionError,
+    ]
+    assert flight.stats()["in_flight"] == 0
+
+    async def succeed():
+        return 1
+
+    assert asyncio.run(flight.do("k", succeed)) == 1
+    assert flight.stats()["executed"] == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return 3
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("k", compute))
+        second = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_losing_replica_waits_for_the_shared_result(mocker):
+    flight = SingleFlight("redis://lock", poll_interval_seconds=0.001)
+    client = mocker.AsyncMock()
+    client.set.return_value = None
+    client.exists.return_value = 1
+    client.register_script = mocker.Mock()
+    mocker.patch(
+        "app.services.single_flight.aioredis.Redis.from_url", return_value=client
+    )
+    compute = mocker.AsyncMock(return_value=5)
+    peek = mocker.AsyncMock(side_effect=[None, None, 5])
+
+    assert asyncio.run(flight.do("k", compute, peek)) == 5
+    compute.assert_not_awaited()
+    assert flight.stats()["replica_coalesced"] == 1
+
+
+def test_lock_holder_executes_and_releases(mocker):
+    flight = SingleFlight("redis://lock")
+    client = mocker.AsyncMock()
+    client.set.return_value = True
+    release = mocker.AsyncMock()
+    client.register_script = mocker.Mock(return_value=release)
+    mocker.patch(
+        "app.services.single_flight.aioredis.Redis.from_url", return_value=client
+    )
+
+    assert asyncio.run(flight.do("k", mocker.AsyncMock(return_value=9))) == 9
+    assert asyncio.run(
+        flight.do("k", mocker.AsyncMock(return_value=9), mocker.AsyncMock())
+    ) == 9
+    release.assert_awaited_once()
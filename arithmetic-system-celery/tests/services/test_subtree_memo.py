@@ -0,0 +1,40 @@
+import asyncio
+
+from app.services.batch_planner import BatchPlanner
+from app.services.expression_parser import ExpressionParser
+from app.services.result_cache import ResultCache
+from app.services.subtree_memo import SubtreeMemo
+from app.services.workflow_builder import WorkflowBuilder
+
+
+def make_memo(min_operations=2, max_subtrees=8):
+    planner = BatchPlanner(WorkflowBuilder({}), min_operations)
+    cache = ResultCache(l1_max_size=8, ttl_seconds=60)
+    return SubtreeMemo(planner, cache, min_operations, max_subtrees)
+
+
+def test_select_keeps_the_largest_proper_subtrees():
+    memo = make_memo(max_subtrees=2)
+    tree = ExpressionParser().parse("((1 - 2) * (3 - 4) - 5) / (6 - 7 * 8)")
+
+    selected = memo.select(tree)
+
+    assert [node.to_infix() for node in selected.values()] == [
+        "((1 - 2) * (3 - 4)) - 5",
+        "(1 - 2) * (3 - 4)",
+    ]
+    assert memo.select(ExpressionParser().parse("1 - 2")) == {}
+
+
+def test_recall_counts_hits():
+    memo = make_memo()
+    tree = ExpressionParser().parse("((1 - 2) * (3 - 4) - 5) / (6 - 7 * 8)")
+    selected = memo.select(tree)
+    key = next(iter(selected))
+
+    async def scenario():
+        await memo.result_cache.set(key, -4, elapsed_seconds=0.1)
+        return await memo.recall(selected)
+
+    assert asyncio.run(scenario()) == {key: -4}
+    assert memo.stats() == {"lookups": 3, "hits": 1, "hit_ratio": 1 / 3}
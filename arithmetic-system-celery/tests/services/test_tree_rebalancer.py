@@ -0,0 +1,111 @@
+import pytest
+
+from app.services.evaluator import evaluate
+from app.services.expression_parser import ExpressionParser
+from app.services.tree_rebalancer import TreeRebalancer
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+def test_reports_depth_before_and_after(parser):
+    rebalancer = TreeRebalancer(hop_latency_seconds=0.005)
+    tree, report = rebalancer.rebalance(parser.parse("1 - (2 - (3 - (4 - 5)))"))
+
+    assert tree.to_infix() == "((1 + 3) + 5) - (2 + 4)"
+    assert (report.depth_before, report.depth_after) == (4, 2)
+    assert report.estimated_seconds_saved == pytest.approx(0.01)
+    assert str(report) == "rebalanced(depth 4 -> 2, ~10.0ms)"
+    assert rebalancer.stats() == {
+        "trees": 1,
+        "rebalanced": 1,
+        "depth_saved": 2,
+        "estimated_seconds_saved": pytest.approx(0.01),
+    }
+
+
+def test_deep_operands_join_last(parser):
+    rebalancer = TreeRebalancer(hop_latency_seconds=0.005)
+    tree, report = rebalancer.rebalance(
+        parser.parse("((2 * 3) - 1 - 2) * 4 - 5 - 6 + 7")
+    )
+
+    assert tree.to_infix() == "(((2 * 3) - (1 + 2)) * 4) + (7 - (5 + 6))"
+    assert (report.depth_before, report.depth_after) == (7, 4)
+
+
+def test_keeps_trees_that_are_already_shallow(parser):
+    rebalancer = TreeRebalancer(hop_latency_seconds=0.005)
+    tree = parser.parse("(1 - 2) * (3 + 4 + 5) / 6")
+
+    rebalanced, report = rebalancer.rebalance(tree)
+    assert rebalanced is tree
+    assert report.depth_before == report.depth_after
+    assert rebalancer.stats()["rebalanced"] == 0
+
+
+def test_divisors_of_divisors_stay_in_place(parser):
+    tree, _ = TreeRebalancer(0.005).rebalance(parser.parse("8 / 2 / 3 / 5 / (4 / 0)"))
+
+    assert tree.to_infix() == "(8 / ((2 * 3) * 5)) / (4 / 0)"
+    with pytest.raises(ZeroDivisionError):
+        evaluate(tree)
+
+
+def test_zero_divisors_still_raise(parser):
+    tree, _ = TreeRebalancer(0.005).rebalance(parser.parse("8 / 2 / 0 / 4 - 1"))
+    with pytest.raises(ZeroDivisionError):
+        evaluate(tree)
+
+
+def test_factors_whose_product_underflows_or_overflows_stay_in_place(parser):
+    # The parser has no exponent notation: 1e-200 and 1e200
+    tiny, huge = f"0.{'0' * 199}1", f"1{'0' * 200}.0"
+    rebalancer = TreeRebalancer(0.005)
+
+    # tiny * tiny is zero, so tiny / ((tiny * tiny) * 4) would raise
+    tree = parser.parse(f"{tiny} / {tiny} / {tiny} / 2 / 2")
+    rebalanced, _ = rebalancer.rebalance(tree)
+    assert rebalanced is tree
+    assert evaluate(rebalanced) == pytest.approx(2.5e199)
+
+    # huge * huge is inf, so huge / ((huge * huge) * 4) would be 0.0
+    tree = parser.parse(f"{huge} / 2 / {huge} / {huge} / 2")
+    rebalanced, _ = rebalancer.rebalance(tree)
+    assert evaluate(rebalanced) == pytest.approx(2.5e-201)
+    assert rebalancer.stats()["rebalanced"] == 0
+
+
+def test_terms_whose_sums_overflow_or_cancel_stay_in_place(parser):
+    big = f"1{'0' * 308}.0"
+    rebalancer = TreeRebalancer(0.005)
+
+    # (1e308 + 1e308) - ... is inf, stepwise the result is 1e308
+    tree = parser.parse(
+        f"{big} - {big} + {big} - " + " - ".join(str(i) for i in range(1, 21))
+    )
+    rebalanced, _ = rebalancer.rebalance(tree)
+    assert rebalanced is tree
+    assert evaluate(rebalanced) == 1e308
+
+    # (1e16 + 1 + 1) - (1e16 + 2 + 2) is -4.0, stepwise it is -2.0
+    tree = parser.parse("10000000000000000.0 - 10000000000000000.0 + 1 + 1 - 2 - 2")
+    rebalanced, _ = rebalancer.rebalance(tree)
+    assert evaluate(rebalanced) == -2.0
+    assert rebalancer.stats()["rebalanced"] == 0
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "100 - 1 + 2 - 3 - (4 - 5 - (6 + 7)) + 8",
+        "(7 - 1 - 2) * (8 / 2 / 2) - 3 - (4 - 1 - 1) * 5",
+        "96 / (2 * 3) * 5 / 4 / (1 + 1)",
+    ],
+)
+def test_rebalanced_trees_evaluate_to_the_same_value(parser, expression):
+    tree = parser.parse(expression)
+    rebalanced, _ = TreeRebalancer(0.005).rebalance(tree)
+    assert evaluate(rebalanced) == pytest.approx(evaluate(tree))
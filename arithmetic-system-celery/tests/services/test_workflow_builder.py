@@ -1,10 +1,27 @@
+import sys
+
 import pytest
 from unittest.mock import Mock
 from celery import Signature
 from celery.result import EagerResult
 
+from app.services.cache import LRUCache
+from app.services.chain_rewriter import ChainRewriter
+from app.services.constant_folder import ConstantFolder
+from app.services.fusion_planner import FusionPlanner
+from app.services.tree_rebalancer import TreeRebalancer
 from app.services.workflow_builder import WorkflowBuilder
-from app.services.expression_parser import ExpressionNode, OperationEnum
+from app.services.expression_parser import (
+    ExpressionNode,
+    ExpressionParser,
+    OperationEnum,
+)
+from app.workers import (
+    add_task,
+    multiply_task,
+    subtract_list_task,
+    subtract_task,
+)
 
 
 @pytest.fixture
@@ -262,6 +279,224 @@ class TestWorkflowBuilderIntegration:
         with pytest.raises(TypeError, match="Invalid node type"):
             workflow_builder.build("invalid")
 
-        # Invalid node type in recursive method
+        # Invalid node type inside the tree builder
         with pytest.raises(TypeError, match="Invalid node type"):
-            workflow_builder._build_recursive("not a node")
+            workflow_builder._build_workflow("not a node")
+
+    def test_constant_folding(self, task_map, task_chord_map):
+        """Test that cheap subtrees are folded and reported in the workflow string"""
+        builder = WorkflowBuilder(
+            task_map, task_chord_map, ConstantFolder(max_nodes=1, max_depth=1)
+        )
+        # ((1 + 2) * 4) - ((4 + 5) / 3)
+        left = ExpressionNode(
+            operation=OperationEnum.MUL,
+            left=ExpressionNode(operation=OperationEnum.ADD, left=1, right=2),
+            right=4,
+        )
+        right = ExpressionNode(
+            operation=OperationEnum.DIV,
+            left=ExpressionNode(operation=OperationEnum.ADD, left=4, right=5),
+            right=3,
+        )
+        node = ExpressionNode(operation=OperationEnum.SUB, left=left, right=right)
+
+        result, workflow_str = builder.build(node)
+        assert result is not None
+        assert workflow_str == (
+            "folded(1 + 2 = 3; 4 + 5 = 9) -> "
+            "chord([multiply_task(3, 4), divide_task(9, 3)], subtract_list_task)"
+        )
+
+        # Everything below the threshold never reaches a worker
+        result, workflow_str = builder.build(left.left)
+        assert result.result == 3
+        assert workflow_str == "folded(1 + 2 = 3) -> constant(3)"
+
+    def test_fused_subtrees(self, task_map, task_chord_map):
+        """Test that planned chunks become evaluate_subtree_task programs"""
+        planner = FusionPlanner(
+            hop_latency_seconds=2e-6, worker_concurrency=3, op_cost_seconds=1e-6
+        )
+        builder = WorkflowBuilder(task_map, task_chord_map, planner=planner)
+        # ((1 + 2) * (3 + 4)) - ((5 + 6) / (7 - 8))
+        left = ExpressionNode(
+            operation=OperationEnum.MUL,
+            left=ExpressionNode(operation=OperationEnum.ADD, left=1, right=2),
+            right=ExpressionNode(operation=OperationEnum.ADD, left=3, right=4),
+        )
+        right = ExpressionNode(
+            operation=OperationEnum.DIV,
+            left=ExpressionNode(operation=OperationEnum.ADD, left=5, right=6),
+            right=ExpressionNode(operation=OperationEnum.SUB, left=7, right=8),
+        )
+        node = ExpressionNode(operation=OperationEnum.SUB, left=left, right=right)
+
+        workflow, workflow_str = builder.compile(node)
+        assert workflow_str == (
+            "chord([evaluate_subtree_task([], program=(1 + 2) * (3 + 4)), "
+            "evaluate_subtree_task([], program=(5 + 6) / (7 - 8))], "
+            "evaluate_subtree_task(program=$0 - $1))"
+        )
+        assert builder.critical_path_hops(workflow) == 2
+
+    def test_wide_chains_reduce_through_a_balanced_tree(
+        self, task_map, task_chord_map
+    ):
+        """Test that no aggregator or chord exceeds the configured fan-in"""
+        builder = WorkflowBuilder(task_map, task_chord_map, max_fan_in=4)
+        node = 1
+        for term in range(2, 11):
+            node = ExpressionNode(operation=OperationEnum.ADD, left=node, right=term)
+
+        workflow, workflow_str = builder.compile(node)
+        assert workflow_str == (
+            "chord([xsum_task([1, 2, 3, 4]), xsum_task([5, 6, 7, 8]), "
+            "xsum_task([9, 10])], xsum_task)"
+        )
+
+        products = [
+            ExpressionNode(operation=OperationEnum.MUL, left=term, right=term)
+            for term in range(10)
+        ]
+        node = products[0]
+        for product in products[1:]:
+            node = ExpressionNode(operation=OperationEnum.ADD, left=node, right=product)
+        workflow, _ = builder.compile(node)
+        # 10 members -> 3 partial chords of at most 4 -> one final join
+        assert len(workflow.tasks) == 3
+        assert [len(partial.tasks) for partial in workflow.tasks] == [4, 4, 2]
+        assert builder.critical_path_hops(workflow) == 3
+
+    def test_subtraction_chains_are_regrouped(self, task_map, task_chord_map):
+        """Test that a - b - c - ... subtracts one aggregated sum"""
+        builder = WorkflowBuilder(task_map, task_chord_map, rewriter=ChainRewriter())
+        # (2 * 3) - 1 - 2 - ... - 8 is a chain of eight subtractions
+        node = ExpressionNode(operation=OperationEnum.MUL, left=2, right=3)
+        for term in range(1, 9):
+            node = ExpressionNode(operation=OperationEnum.SUB, left=node, right=term)
+
+        workflow, workflow_str = builder.compile(node)
+        assert workflow_str == (
+            "chord([multiply_task(2, 3), xsum_task([1, 2, 3, 4, 5, 6, 7, 8])], "
+            "subtract_list_task)"
+        )
+        assert builder.critical_path_hops(workflow) == 2
+
+    def test_rebalanced_trees_report_the_saving(self, task_map, task_chord_map):
+        """Test that the workflow string shows depth before and after"""
+        builder = WorkflowBuilder(
+            task_map, task_chord_map, rebalancer=TreeRebalancer(0.005)
+        )
+        # 1 - (2 - (3 - 4)) nests three subtractions
+        node = ExpressionNode(operation=OperationEnum.SUB, left=3, right=4)
+        node = ExpressionNode(operation=OperationEnum.SUB, left=2, right=node)
+        node = ExpressionNode(operation=OperationEnum.SUB, left=1, right=node)
+
+        workflow, workflow_str = builder.compile(node)
+        assert workflow_str == (
+            "rebalanced(depth 3 -> 2, ~5.0ms) -> "
+            "chord([add_task(1, 3), add_task(2, 4)], subtract_list_task)"
+        )
+        assert builder.critical_path_hops(workflow) == 2
+
+    def test_deep_trees_build_without_recursion(self):
+        """Test that nesting far past the recursion limit builds and renders"""
+        # Real signatures: mocks record every call and slow this down
+        builder = WorkflowBuilder(
+            {OperationEnum.SUB: subtract_task, OperationEnum.MUL: multiply_task},
+            {OperationEnum.SUB: subtract_list_task},
+            max_string_length=200,
+        )
+        depth = sys.getrecursionlimit() * 2
+        node = ExpressionNode(operation=OperationEnum.MUL, left=1, right=2)
+        for term in range(depth):
+            product = ExpressionNode(operation=OperationEnum.MUL, left=term, right=3)
+            node = ExpressionNode(operation=OperationEnum.SUB, left=node, right=product)
+
+        workflow = builder._build_workflow(node)
+        workflow_str = builder._signature_to_string(workflow)
+        assert builder.critical_path_hops(workflow) == depth + 1
+        assert len(workflow_str) == 203
+        assert workflow_str.startswith("chord([chord([chord([")
+        assert workflow_str.endswith("...")
+
+    def test_expressions_of_one_shape_share_a_template(self):
+        """Test that only the constants are substituted into a cached template"""
+        templates = LRUCache(8)
+        builder = WorkflowBuilder(
+            {OperationEnum.ADD: add_task, OperationEnum.SUB: subtract_task},
+            {OperationEnum.SUB: subtract_list_task},
+            templates=templates,
+        )
+        parser = ExpressionParser()
+
+        first, first_str = builder.compile(parser.parse("(1 + 2) - (3 + 4 + 5)"))
+        second, second_str = builder.compile(parser.parse("(6 + 7) - (8 + 9 + 10)"))
+        _, other_str = builder.compile(parser.parse("1 + 2"))
+
+        assert first_str == (
+            "chord([add_task(1, 2), xsum_task([3, 4, 5])], subtract_list_task)"
+        )
+        assert second_str == (
+            "chord([add_task(6, 7), xsum_task([8, 9, 10])], subtract_list_task)"
+        )
+        assert other_str == "add_task(1, 2)"
+        assert first_str == builder._signature_to_string(first)
+        assert templates.stats()["hits"] == 1
+        assert templates.stats()["size"] == 2
+        assert first.tasks[0] is not second.tasks[0]
+        assert first.body.task == second.body.task == subtract_list_task.name
+
+    def test_subtree_digests_match_canonical_keys(self, workflow_builder):
+        """Test that a subtree's digest is the key of the same expression"""
+        parser = ExpressionParser()
+        expression = "(2 * 3 - 1) / (4 + 5 + 6) - (6 + 5 + 4)"
+        tree = parser.parse(expression)
+        digests = workflow_builder.subtree_digests(tree)
+
+        assert digests[id(tree)] == workflow_builder.canonical_key(
+            parser.parse_compact(expression)
+        )
+        assert digests[id(tree.left.right)] == digests[id(tree.right)]
+        assert digests[id(tree.left.left)] == workflow_builder.canonical_key(
+            parser.parse_compact("2 * 3 - 1")
+        )
+        # Inside the run 4 + 5 + 6, 4 + 5 is no operand of its own
+        assert id(tree.right.left) not in digests
+        assert workflow_builder.canonical_key(parser.parse_compact("-2.5")) == "-2.5"
+
+
+    def test_intermediate_chain_links_skip_their_result(self):
+        """Test that only chord members and the last task store a result"""
+        builder = WorkflowBuilder(
+            {
+                OperationEnum.ADD: add_task,
+                OperationEnum.SUB: subtract_task,
+                OperationEnum.MUL: multiply_task,
+            },
+            {OperationEnum.SUB: subtract_list_task},
+            skip_intermediate_results=True,
+        )
+        parser = ExpressionParser()
+
+        chained, _ = builder.compile(parser.parse("(1 - 2) * 3 - 4"))
+        assert [task.options.get("ignore_result") for task in chained.tasks] == [
+            True,
+            True,
+            None,
+        ]
+
+        joined, joined_str = builder.compile(
+            parser.parse("((1 - 2) * 3) - (4 * 5 - 6)")
+        )
+        assert joined_str == (
+            "chord([subtract_task(1, 2) | multiply_task(y=3), "
+            "multiply_task(4, 5) | subtract_task(y=6)], subtract_list_task)"
+        )
+        for member in joined.tasks:
+            first, last = member.tasks
+            assert first.options["ignore_result"] is True
+            assert "ignore_result" not in last.options
+        assert "ignore_result" not in joined.body.options
+        assert joined.apply().get() == -17
@@ -1,13 +1,30 @@
-from fastapi import APIRouter, Query, HTTPException
+import codecs
+from collections.abc import AsyncIterator
+from typing import Literal
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
 import logging
 from ..services.orchestrator import WorkflowOrchestrator
-from ..models.models import CalculateExpressionResponse
+from ..models.models import (
+    BatchCalculateRequest,
+    BatchCalculateResponse,
+    BatchItemResponse,
+    CalculateExpressionResponse,
+    ExecuteExpressionRequest,
+    MetricsResponse,
+    PrepareExpressionRequest,
+    PreparedExpressionResponse,
+    StreamItemResponse,
+)
 from http import HTTPStatus
 from app.types.errors import (
     ExpressionSyntaxError,
+    PreparedExpressionNotFoundError,
     UnsupportedOperatorError,
     UnsupportedNodeError,
-    UnsupportedUnaryOperatorError
+    UnsupportedUnaryOperatorError,
+    VariableBindingError,
 )
 
 router = APIRouter()
@@ -48,3 +65,154 @@ async def evaluate(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred",
         )
+
+
+@router.post("/calculate/batch", response_model=BatchCalculateResponse)
+async def evaluate_batch(request: BatchCalculateRequest) -> BatchCalculateResponse:
+    logger.info(f"Received batch of {len(request.expressions)} expressions")
+    try:
+        outcomes, workflow = await orchestrator.calculate_batch(request.expressions)
+    except Exception as e:
+        logger.error(f"Unexpected error while evaluating batch: {str(e)}")
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred",
+        )
+
+    results = [
+        BatchItemResponse(expression=expression, **_item_fields(outcome))
+        for expression, outcome in zip(request.expressions, outcomes)
+    ]
+    return BatchCalculateResponse(results=results, workflow=workflow)
+
+
+@router.post("/expressions", response_model=PreparedExpressionResponse)
+async def prepare_expression(
+    request: PrepareExpressionRequest,
+) -> PreparedExpressionResponse:
+    # Parses and plans once; execute only binds values and dispatches
+    try:
+        prepared = orchestrator.prepare(request.expression)
+    except (
+        ExpressionSyntaxError,
+        UnsupportedOperatorError,
+        UnsupportedNodeError,
+        UnsupportedUnaryOperatorError,
+        ZeroDivisionError,
+    ) as e:
+        logger.error(f"Cannot prepare '{request.expression}': {str(e)}")
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=_error_detail(e))
+    except Exception as e:
+        logger.error(f"Unexpected error preparing '{request.expression}': {str(e)}")
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred",
+        )
+
+    return PreparedExpressionResponse(
+        id=prepared.expression_id,
+        expression=prepared.expression,
+        variables=prepared.variables,
+    )
+
+
+@router.post(
+    "/expressions/{expression_id}/execute",
+    response_model=CalculateExpressionResponse,
+)
+async def execute_expression(
+    expression_id: str, request: ExecuteExpressionRequest
+) -> CalculateExpressionResponse:
+    try:
+        return await orchestrator.execute(expression_id, request.values)
+    except PreparedExpressionNotFoundError as e:
+        # Prepared expressions live in one replica's memory; prepare again
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=str(e))
+    except (VariableBindingError, ZeroDivisionError) as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=_error_detail(e))
+    except Exception as e:
+        logger.error(f"Unexpected error while executing {expression_id}: {str(e)}")
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred",
+        )
+
+
+class _BodyStreamingResponse(StreamingResponse):
+    # The request body is still being read while the response streams, so
+    # the default disconnect listener must not compete with it for receive();
+    # a disconnect surfaces through the body stream instead
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/calculate/stream")
+async def evaluate_stream(
+    request: Request,
+    format: Literal["ndjson", "sse"] = Query(
+        "ndjson", description="NDJSON lines or Server-Sent Events"
+    ),
+) -> StreamingResponse:
+    # One expression per line of the request body; one record per expression
+    # as soon as its workflow completes, in completion order
+    logger.info(f"Streaming expressions as {format}")
+
+    async def records() -> AsyncIterator[str]:
+        outcomes = orchestrator.calculate_stream(_read_lines(request))
+        async for index, expression, outcome in outcomes:
+            record = StreamItemResponse(
+                index=index, expression=expression, **_item_fields(outcome)
+            ).model_dump_json()
+            yield f"data: {record}\n\n" if format == "sse" else f"{record}\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return _BodyStreamingResponse(records(), media_type=media_type)
+
+
+async def _read_lines(request: Request) -> AsyncIterator[str]:
+    # Chunks may split a multi-byte character, so decode incrementally
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _item_fields(outcome: CalculateExpressionResponse | Exception) -> dict:
+    if isinstance(outcome, Exception):
+        return {"error": _error_detail(outcome)}
+    return {"result": outcome.result, "workflow": outcome.workflow}
+
+
+def _error_detail(error: Exception) -> str:
+    # Same messages the single-expression endpoint returns, per batch item
+    if isinstance(
+        error,
+        (
+            ExpressionSyntaxError,
+            UnsupportedOperatorError,
+            UnsupportedNodeError,
+            UnsupportedUnaryOperatorError,
+            VariableBindingError,
+        ),
+    ):
+        return str(error)
+    if isinstance(error, ZeroDivisionError):
+        return "Cannot divide by zero"
+    logger.error(f"Unexpected error in batch item: {str(error)}")
+    return "An unexpected error occurred"
+
+
+@router.get("/metrics", response_model=MetricsResponse)
+async def metrics() -> MetricsResponse:
+    return MetricsResponse(**orchestrator.metrics())
@@ -12,6 +12,7 @@ from .constants import (
     SUB_TASKS_WRAPPER_TOPIC,
     MUL_TASKS_WRAPPER_TOPIC,
     DIV_TASKS_WRAPPER_TOPIC,
+    NOTIFY_TASKS_TOPIC,
 )
 
 __all__ = [
@@ -28,4 +29,5 @@ __all__ = [
     "SUB_TASKS_WRAPPER_TOPIC",
     "MUL_TASKS_WRAPPER_TOPIC",
     "DIV_TASKS_WRAPPER_TOPIC",
+    "NOTIFY_TASKS_TOPIC",
 ]
@@ -13,6 +13,8 @@ DIV_TASKS_WRAPPER_TOPIC = "div_tasks_wrapper"
 XSUM_TASKS_TOPIC = "xsum_tasks"
 XPROD_TASKS_TOPIC = "xprod_tasks"
 
+NOTIFY_TASKS_TOPIC = "notify_tasks"
+
 OPERATION_TOPIC_MAP = {
     OperationEnum.ADD: ADD_TASKS_TOPIC,
     OperationEnum.SUB: SUB_TASKS_TOPIC,
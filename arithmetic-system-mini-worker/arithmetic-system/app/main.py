@@ -1,5 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .api.calculate_expression import router as evaluate_router
+from .api.calculate_expression import orchestrator, router as evaluate_router
 import logging
 
 logging.basicConfig(
@@ -7,6 +8,13 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await orchestrator.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(evaluate_router, prefix="/api")
@@ -1,27 +1,129 @@
+import base64
+import sys
+from array import array
+from itertools import compress
+
+from pydantic import field_validator
+
 from mini.models import BaseModel
 
-class BinaryOperationInput(BaseModel):
+# Tags of a packed buffer: the narrowest array typecode holding all ints,
+# float64, or float64 followed by one byte per element flagging the ints
+PACKED_INTS = tuple(
+    (typecode, -(2 ** (bits - 1)), 2 ** (bits - 1) - 1)
+    for typecode, bits in (("b", 8), ("h", 16), ("i", 32), ("q", 64))
+)
+PACKED_FLOATS, PACKED_MIXED = "d", "m"
+# Largest integer a float64 holds exactly
+_FLOAT_INTS = 2**53
+
+
+def pack_numbers(values: list[int | float]) -> str | None:
+    # Tag and little-endian buffer, base64 encoded to travel inside JSON; None
+    # for values a buffer cannot hold exactly
+    kinds = set(map(type, values))
+    if not values or bool in kinds:
+        return None
+    if not all(issubclass(kind, (int, float)) for kind in kinds):
+        return None
+    if all(issubclass(kind, int) for kind in kinds):
+        low, high = min(values), max(values)
+        for typecode, smallest, largest in PACKED_INTS:
+            if smallest <= low and high <= largest:
+                return _encode(typecode, array(typecode, values), b"")
+        return None
+    flags = bytes(isinstance(value, int) for value in values)
+    if not any(flags):
+        return _encode(PACKED_FLOATS, array(PACKED_FLOATS, values), b"")
+    if any(abs(value) > _FLOAT_INTS for value in compress(values, flags)):
+        return None
+    return _encode(PACKED_MIXED, array(PACKED_FLOATS, values), flags)
+
+
+def unpack_numbers(packed: str) -> list[int | float]:
+    data = base64.b64decode(packed)
+    tag = data[:1].decode()
+    numbers = array(PACKED_FLOATS if tag == PACKED_MIXED else tag)
+    width = numbers.itemsize + (tag == PACKED_MIXED)
+    end = 1 + (len(data) - 1) // width * numbers.itemsize
+    numbers.frombytes(data[1:end])
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    values = numbers.tolist()
+    if tag == PACKED_MIXED:
+        for index in compress(range(len(values)), data[end:]):
+            values[index] = int(values[index])
+    return values
+
+
+def _encode(tag: str, numbers: array, flags: bytes) -> str:
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    return base64.b64encode(tag.encode() + numbers.tobytes() + flags).decode()
+
+
+class WorkflowInput(BaseModel):
+    # Result channel of the request, for a failing node to publish its error
+    channel: str | None = None
+
+
+# How every serialized input starts until the channel is filled in
+UNSET_CHANNEL = WorkflowInput().model_dump_json()[:-1]
+
+
+class BinaryOperationInput(WorkflowInput):
     x: int | float
     y: int | float
 
 class NumberOutput(BaseModel):
     result: int | float
 
-class AggregateInput(BaseModel):
+
+class FailureOutput(BaseModel):
+    error_type: str
+    error: str
+
+class AggregateInput(WorkflowInput):
     values: list[int | float] | None = None
-    children_result: list[NumberOutput] | None = None
+    # values as written by pack_numbers, for large aggregations
+    packed_values: str | None = None
+    # Only the results of the children's NumberOutputs are kept
+    children_result: list[int | float] | None = None
     input: str | None = None
 
+    @field_validator("children_result", mode="before")
+    @classmethod
+    def _child_results(cls, children: object) -> object:
+        # A chord join receives one output per child; reading the results
+        # straight out spares a model instance per child
+        if not isinstance(children, list):
+            return children
+        return [
+            child["result"] if isinstance(child, dict)
+            else child.result if isinstance(child, NumberOutput)
+            else child
+            for child in children
+        ]
+
     @property
     def numbers(self) -> list[int | float]:
         if self.values is not None:
             return self.values
+        if self.packed_values is not None:
+            return unpack_numbers(self.packed_values)
         if self.children_result is not None:
-            return [item.result for item in self.children_result]
-        raise ValueError("Either 'values' or 'children_result' must be provided")
+            return self.children_result
+        raise ValueError(
+            "Either 'values', 'packed_values' or 'children_result' must be provided"
+        )
+
+
+class NotifyInput(WorkflowInput):
+    channel: str
+    result: int | float | None = None
 
 
-class ChainLinkInput(BaseModel):
+class ChainLinkInput(WorkflowInput):
     is_left_fixed: bool = False
     result: int | float | None = None
     next_operand: int | float
@@ -0,0 +1,62 @@
+from .expression_parser import CompactExpression, ExpressionNode, OperationEnum
+
+
+def apply_operation(
+    operation: OperationEnum, left: int | float, right: int | float
+) -> int | float:
+    if operation == OperationEnum.ADD:
+        return left + right
+    if operation == OperationEnum.SUB:
+        return left - right
+    if operation == OperationEnum.MUL:
+        return left * right
+    if operation == OperationEnum.DIV:
+        if right == 0:
+            raise ZeroDivisionError(f"Cannot divide {left} by zero.")
+        return left / right
+    raise ValueError(f"Unsupported operation: {operation}")
+
+
+def evaluate(node: ExpressionNode | int | float) -> int | float:
+    # Same arithmetic as the worker tasks, evaluated in-process without
+    # recursion so that subtrees of any depth can be folded
+    if not isinstance(node, ExpressionNode):
+        return node
+
+    values: dict[int, int | float] = {}
+    stack: list[tuple[ExpressionNode, bool]] = [(node, False)]
+
+    while stack:
+        current, children_done = stack.pop()
+        if not children_done:
+            stack.append((current, True))
+            for child in (current.right, current.left):
+                if isinstance(child, ExpressionNode) and id(child) not in values:
+                    stack.append((child, False))
+            continue
+
+        left, right = (
+            values[id(child)] if isinstance(child, ExpressionNode) else child
+            for child in (current.left, current.right)
+        )
+        values[id(current)] = apply_operation(current.operation, left, right)
+
+    return values[id(node)]
+
+
+def evaluate_compact(expression: CompactExpression) -> int | float:
+    # Children precede their parent, so one pass over the slots suffices
+    values: list[int | float] = []
+    for index in range(len(expression)):
+        operation = expression.operation(index)
+        if operation is None:
+            values.append(expression.constant(index))
+        else:
+            values.append(
+                apply_operation(
+                    operation,
+                    values[expression.left[index]],
+                    values[expression.right[index]],
+                )
+            )
+    return values[expression.root]
@@ -1,25 +1,200 @@
+import asyncio
+import hashlib
+import json
 import logging
-from .expression_parser import ExpressionParser
+import time
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import dataclass
+from .batch_planner import BatchPlanner, SharedSubtree
+from .cache import LRUCache
+from .chain_rewriter import ChainRewriter
+from .constant_folder import ConstantFolder, FoldedSubtree
+from .expression_parser import (
+    REGEX_SPACES,
+    ExpressionNode,
+    ExpressionParser,
+    Variable,
+)
+from .result_cache import ResultCache
+from .result_waiter import PollingResultWaiter, PubSubResultWaiter
+from .single_flight import SingleFlight
+from .subtree_memo import SubtreeMemo
+from .tree_rebalancer import TreeRebalancer
 from .workflow_builder import WorkflowBuilder
+from .workflow_template import PreparedWorkflow
 from app.models.models import CalculateExpressionResponse
-from ..config import BROKER, RESULT_BACKEND
-from mini.worker.result_backends import NodeResult
-import asyncio
+from app.models.worker_models import UNSET_CHANNEL, NotifyInput
+from app.types.errors import PreparedExpressionNotFoundError, VariableBindingError
+from ..constants import NOTIFY_TASKS_TOPIC
+from ..config import (
+    AGGREGATE_PACKED_MIN_VALUES,
+    BATCH_RESULT_TIMEOUT_SECONDS,
+    BATCH_SHARED_SUBTREE_MIN_OPERATIONS,
+    BROKER,
+    CHAIN_REWRITE_ENABLED,
+    COMMON_SUBTREE_ELIMINATION_ENABLED,
+    COMMON_SUBTREE_TASK_COST_SECONDS,
+    CONSTANT_FOLDING_ENABLED,
+    CONSTANT_FOLDING_MAX_DEPTH,
+    CONSTANT_FOLDING_MAX_NODES,
+    FLAT_REDUCTION_MAX_FAN_IN,
+    PREPARED_EXPRESSIONS_MAX_SIZE,
+    REDIS_URI,
+    RESULT_BACKEND,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_KEY_PREFIX,
+    RESULT_CACHE_L1_MAX_SIZE,
+    RESULT_CACHE_L2_ENABLED,
+    RESULT_CACHE_L2_MAX_ENTRIES,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_CHANNEL_PREFIX,
+    RESULT_POLL_INTERVAL_SECONDS,
+    RESULT_PUSH_ENABLED,
+    RESULT_TIMEOUT_SECONDS,
+    SINGLE_FLIGHT_ENABLED,
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS,
+    SINGLE_FLIGHT_POLL_INTERVAL_SECONDS,
+    SINGLE_FLIGHT_REPLICA_LOCK_ENABLED,
+    STREAM_MAX_IN_FLIGHT,
+    SUBTREE_MEMO_ENABLED,
+    SUBTREE_MEMO_MAX_SUBTREES,
+    SUBTREE_MEMO_MIN_OPERATIONS,
+    TREE_REBALANCE_ENABLED,
+    TREE_REBALANCE_HOP_LATENCY_SECONDS,
+    WORKFLOW_CACHE_MAX_SIZE,
+    WORKFLOW_CACHE_TTL_SECONDS,
+    WORKFLOW_STRING_MAX_CHARS,
+    WORKFLOW_TEMPLATE_CACHE_ENABLED,
+    WORKFLOW_TEMPLATE_CACHE_MAX_SIZE,
+)
+from mini.worker.workers.canvas import Chain, Chord, Node
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class CompiledExpression:
+    expression_tree: ExpressionNode | float | int
+    workflow_string: str
+    canonical_key: str
+    memo_subtrees: dict[str, ExpressionNode]
+    # Subtrees occurring more than once, evaluated once before the rest
+    shared_subtrees: list[SharedSubtree]
+    shared_stage_one: list[PreparedWorkflow]
+    # The rest, built once with the subtrees' values as its variables; None
+    # when the folder evaluates it whole once the values are in
+    shared_stage_two: PreparedWorkflow | None
+
+
+@dataclass(frozen=True)
+class PreparedExpression:
+    expression_id: str
+    expression: str
+    # Names in the order execute binds them
+    variables: list[str]
+    workflow: PreparedWorkflow
+
+
 class WorkflowOrchestrator:
-    def __init__(self):
-        self.parser = ExpressionParser()
-        self.builder = WorkflowBuilder()
+    def __init__(
+        self,
+        cache_max_size: int = WORKFLOW_CACHE_MAX_SIZE,
+        cache_ttl_seconds: float | None = WORKFLOW_CACHE_TTL_SECONDS,
+        constant_folding: bool = CONSTANT_FOLDING_ENABLED,
+        result_push: bool = RESULT_PUSH_ENABLED,
+        result_cache: bool = RESULT_CACHE_ENABLED,
+        single_flight: bool = SINGLE_FLIGHT_ENABLED,
+        subtree_memo: bool = SUBTREE_MEMO_ENABLED,
+        common_subtree_elimination: bool = COMMON_SUBTREE_ELIMINATION_ENABLED,
+        chain_rewrite: bool = CHAIN_REWRITE_ENABLED,
+        tree_rebalance: bool = TREE_REBALANCE_ENABLED,
+        workflow_templates: bool = WORKFLOW_TEMPLATE_CACHE_ENABLED,
+    ):
+        folder = (
+            ConstantFolder(CONSTANT_FOLDING_MAX_NODES, CONSTANT_FOLDING_MAX_DEPTH)
+            if constant_folding
+            else None
+        )
 
-    async def calculate(self, expression: str) -> CalculateExpressionResponse:
-        parsed = self.parser.parse(expression)
+        self.rebalancer = (
+            TreeRebalancer(TREE_REBALANCE_HOP_LATENCY_SECONDS)
+            if tree_rebalance
+            else None
+        )
+        # The rebalancer already regroups SUB/DIV chains, and its shapes are
+        # not meant to be regrouped again
+        rewriter = (
+            ChainRewriter() if chain_rewrite and self.rebalancer is None else None
+        )
+
+        self.template_cache = (
+            LRUCache(WORKFLOW_TEMPLATE_CACHE_MAX_SIZE) if workflow_templates else None
+        )
 
-        logger.info("Parsed expression: %s", parsed)
+        self.parser = ExpressionParser()
+        self.builder = WorkflowBuilder(
+            folder,
+            FLAT_REDUCTION_MAX_FAN_IN,
+            rewriter,
+            self.rebalancer,
+            WORKFLOW_STRING_MAX_CHARS,
+            self.template_cache,
+            AGGREGATE_PACKED_MIN_VALUES,
+        )
+        self.batch_planner = BatchPlanner(
+            self.builder, BATCH_SHARED_SUBTREE_MIN_OPERATIONS
+        )
+        self.common_subtree_elimination = common_subtree_elimination
+        self.workflow_cache = LRUCache(cache_max_size, cache_ttl_seconds)
+        self.prepared_expressions = LRUCache(PREPARED_EXPRESSIONS_MAX_SIZE)
+        self.result_waiter = (
+            PubSubResultWaiter(REDIS_URI, RESULT_CHANNEL_PREFIX)
+            if result_push
+            else PollingResultWaiter(RESULT_BACKEND, RESULT_POLL_INTERVAL_SECONDS)
+        )
+        self.result_cache = (
+            ResultCache(
+                RESULT_CACHE_L1_MAX_SIZE,
+                RESULT_CACHE_TTL_SECONDS,
+                REDIS_URI if RESULT_CACHE_L2_ENABLED else None,
+                RESULT_CACHE_L2_MAX_ENTRIES,
+                RESULT_CACHE_KEY_PREFIX,
+            )
+            if result_cache
+            else None
+        )
+        # Whole results in the result cache double as subtree values: the
+        # canonical key of an expression is its digest inside larger ones
+        self.subtree_memo = (
+            SubtreeMemo(
+                self.batch_planner,
+                self.result_cache,
+                SUBTREE_MEMO_MIN_OPERATIONS,
+                SUBTREE_MEMO_MAX_SUBTREES,
+            )
+            if subtree_memo and self.result_cache is not None
+            else None
+        )
+        # Waiting on another replica needs its result to land in the shared L2
+        replica_lock = (
+            SINGLE_FLIGHT_REPLICA_LOCK_ENABLED
+            and result_cache
+            and RESULT_CACHE_L2_ENABLED
+        )
+        self.single_flight = (
+            SingleFlight(
+                REDIS_URI if replica_lock else None,
+                SINGLE_FLIGHT_LOCK_TTL_SECONDS,
+                SINGLE_FLIGHT_POLL_INTERVAL_SECONDS,
+            )
+            if single_flight
+            else None
+        )
 
-        workflow, workflow_str = self.builder.build(parsed)
+    async def calculate(self, expression: str) -> CalculateExpressionResponse:
+        compiled, workflow = self.compile(expression)
+        workflow_str = compiled.workflow_string
 
         logger.info("Workflow is: %s", workflow_str)
 
@@ -27,29 +202,513 @@ class WorkflowOrchestrator:
             logger.info(f"Expression is a constant: {workflow}")
             return CalculateExpressionResponse(result=workflow, workflow=workflow_str)
 
-        await workflow.create(RESULT_BACKEND)
-        await workflow.start(BROKER)
+        if self.result_cache is not None:
+            hit = await self.result_cache.get(compiled.canonical_key)
+            if hit is not None:
+                value, tier = hit
+                logger.info(f"Result cache {tier} hit: {value}")
+                return CalculateExpressionResponse(
+                    result=value, workflow=workflow_str, cached=True
+                )
+
+            compiled, workflow = await self._recall_subtrees(compiled, workflow)
+            workflow_str = compiled.workflow_string
+            if isinstance(workflow, (int, float)):
+                return CalculateExpressionResponse(
+                    result=workflow, workflow=workflow_str
+                )
 
-        final_result = await self._wait_for_result(workflow.id)
+        if self.single_flight is not None:
+            # Concurrent requests for the same expression share one workflow
+            final_result, workflow_str = await self.single_flight.do(
+                compiled.canonical_key,
+                lambda: self._execute(compiled, workflow),
+                lambda: self._peek_result(compiled),
+            )
+        else:
+            final_result, workflow_str = await self._execute(compiled, workflow)
         logging.info(f"Workflow String: {workflow_str}")
 
         return CalculateExpressionResponse(result=final_result, workflow=workflow_str)
 
-    async def _wait_for_result(self, workflow_id: str, timeout: int = 10) -> int | float:
-        logger.info(f"Waiting for result for workflow_id: {workflow_id}")
+    def prepare(self, expression: str) -> PreparedExpression:
+        # Parsed, optimized and built once; the id follows from the text, so
+        # preparing the same expression again is a lookup
+        expression_id = hashlib.blake2b(
+            REGEX_SPACES.sub("", expression).encode(), digest_size=16
+        ).hexdigest()
+        prepared = self.prepared_expressions.get(expression_id)
+        if prepared is None:
+            tree, variables = self.parser.parse_prepared(expression)
+            prepared = PreparedExpression(
+                expression_id, expression, variables, self.builder.prepare(tree)
+            )
+            self.prepared_expressions.set(expression_id, prepared)
+        return prepared
+
+    async def execute(
+        self, expression_id: str, values: dict[str, int | float]
+    ) -> CalculateExpressionResponse:
+        # Only binds the values into the prepared workflow and dispatches it
+        prepared = self.prepared_expressions.get(expression_id)
+        if prepared is None:
+            raise PreparedExpressionNotFoundError(expression_id)
+        missing = [name for name in prepared.variables if name not in values]
+        if missing:
+            raise VariableBindingError(missing, "Missing values for variables")
+        unknown = [name for name in values if name not in prepared.variables]
+        if unknown:
+            raise VariableBindingError(unknown, "Unknown variables")
+
+        workflow, workflow_str = self.builder.bind(
+            prepared.workflow, [values[name] for name in prepared.variables]
+        )
+        if isinstance(workflow, (int, float)):
+            return CalculateExpressionResponse(result=workflow, workflow=workflow_str)
+        final_result = await self._dispatch(workflow)
+        return CalculateExpressionResponse(result=final_result, workflow=workflow_str)
+
+    async def _recall_subtrees(
+        self, compiled: CompiledExpression, workflow: Chain | Chord
+    ) -> tuple[CompiledExpression, Chain | Chord | int | float]:
+        # Subtrees an earlier request already computed become constants, so
+        # the canvas shrinks as the memo warms
+        if self.subtree_memo is None:
+            return compiled, workflow
+        values = await self.subtree_memo.recall(compiled.memo_subtrees)
+        if not values:
+            return compiled, workflow
+
+        tree, used = self.batch_planner.substitute(compiled.expression_tree, values)
+        workflow, workflow_str = self.builder.build(tree)
+        recalled = "; ".join(
+            str(FoldedSubtree(compiled.memo_subtrees[key].to_infix(), values[key]))
+            for key in used
+        )
+        recalled_compiled = CompiledExpression(
+            tree,
+            f"recalled({recalled}) -> {workflow_str}",
+            compiled.canonical_key,
+            {},
+            *self._plan_common_subtrees(tree, workflow),
+        )
+        return recalled_compiled, workflow
+
+    def _plan_common_subtrees(
+        self,
+        tree: ExpressionNode | float | int,
+        workflow: Chain | Chord | int | float,
+    ) -> tuple[list[SharedSubtree], list[PreparedWorkflow], PreparedWorkflow | None]:
+        if not self.common_subtree_elimination:
+            return [], [], None
+        shared: list[SharedSubtree] = []
+        stage_one: list[PreparedWorkflow] = []
+        for subtree in self.batch_planner.shared_subtrees([tree]):
+            prepared = self.builder.prepare(subtree.node)
+            # A subtree the folder evaluates in-process is not worth a stage
+            if prepared.template is not None:
+                shared.append(subtree)
+                stage_one.append(prepared)
+        if not shared:
+            return [], [], None
+
+        # Stage two is prepared like an expression whose variables are the
+        # shared subtrees, so each request only binds their values. One the
+        # folder evaluates whole is built per request instead: folding beats
+        # a dispatch
+        variables = {
+            subtree.key: Variable(index, f"shared{index}")
+            for index, subtree in enumerate(shared)
+        }
+        stage_two_tree, _ = self.batch_planner.substitute(tree, variables)
+        folder = self.builder.folder
+        if folder is not None and folder.folds_whole(stage_two_tree):
+            stage_two = None
+        else:
+            stage_two = self.builder.prepare(stage_two_tree)
+
+        stage_workflows = [self.builder.bind(prepared, [])[0] for prepared in stage_one]
+        stage_two_workflow = (
+            self.builder.bind(stage_two, [1] * len(shared))[0]
+            if stage_two is not None
+            else 0
+        )
+        if not self._stage_one_pays_off(workflow, stage_workflows, stage_two_workflow):
+            return [], [], None
+        return shared, stage_one, stage_two
+
+    def _stage_one_pays_off(
+        self,
+        workflow: Chain | Chord | int | float,
+        stage_one: list[Chain | Chord | int | float],
+        stage_two: Chain | Chord | int | float,
+    ) -> bool:
+        # Stage one is a round trip through the API before stage two starts;
+        # it has to save the workers more than the hops it adds to the path
+        tasks_saved = (
+            self.builder.task_count(workflow)
+            - self.builder.task_count(stage_two)
+            - sum(self.builder.task_count(shared) for shared in stage_one)
+        )
+        hops_added = (
+            max(self.builder.critical_path_hops(shared) for shared in stage_one)
+            + self.builder.critical_path_hops(stage_two)
+            - self.builder.critical_path_hops(workflow)
+        )
+        return (
+            tasks_saved * COMMON_SUBTREE_TASK_COST_SECONDS
+            > hops_added * TREE_REBALANCE_HOP_LATENCY_SECONDS
+        )
+
+    async def _eliminate_common_subtrees(
+        self, compiled: CompiledExpression, workflow: Chain | Chord
+    ) -> tuple[Chain | Chord | int | float, str]:
+        # Stage one evaluates every repeated subtree once; stage two binds
+        # their values at each occurrence
+        stage_one = [
+            self.builder.bind(prepared, [])[0] for prepared in compiled.shared_stage_one
+        ]
+        tasks_before = self.builder.task_count(workflow)
+        tasks_after = sum(self.builder.task_count(shared) for shared in stage_one)
+
+        results = await self._run_chord(stage_one, RESULT_TIMEOUT_SECONDS)
+        if compiled.shared_stage_two is None:
+            values = {
+                subtree.key: result
+                for subtree, result in zip(compiled.shared_subtrees, results)
+            }
+            tree, _ = self.batch_planner.substitute(compiled.expression_tree, values)
+            workflow, workflow_str = self.builder.build(tree)
+        else:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            workflow, workflow_str = self.builder.bind(
+                compiled.shared_stage_two, results
+            )
+
+        tasks_after += self.builder.task_count(workflow)
+        shown = "; ".join(
+            str(FoldedSubtree(subtree.node.to_infix(), result))
+            for subtree, result in zip(compiled.shared_subtrees, results)
+        )
+        return workflow, (
+            f"cse({tasks_before} -> {tasks_after} tasks) -> "
+            f"shared({shown}) -> {workflow_str}"
+        )
+
+    async def _execute(
+        self, compiled: CompiledExpression, workflow: Chain | Chord
+    ) -> tuple[int | float, str]:
+        started = time.perf_counter()
+        workflow_str = compiled.workflow_string
+        if compiled.shared_subtrees:
+            workflow, workflow_str = await self._eliminate_common_subtrees(
+                compiled, workflow
+            )
+        if isinstance(workflow, (int, float)):
+            final_result = workflow
+        else:
+            final_result = await self._dispatch(workflow)
+
+        if self.result_cache is not None:
+            await self.result_cache.set(
+                compiled.canonical_key, final_result, time.perf_counter() - started
+            )
+        return final_result, workflow_str
+
+    async def _dispatch(self, workflow: Chain | Chord) -> int | float:
+        if isinstance(self.result_waiter, PubSubResultWaiter):
+            key = uuid.uuid4().hex
+            workflow = self._with_notification(workflow, key)
+        else:
+            key = workflow.id
+
+        await self.result_waiter.register(key)
+        try:
+            await workflow.create(RESULT_BACKEND)
+            await workflow.start(BROKER)
+        except BaseException:
+            await self.result_waiter.cancel(key)
+            raise
+
+        return await self.result_waiter.wait(key, RESULT_TIMEOUT_SECONDS)
+
+    async def _peek_result(
+        self, compiled: CompiledExpression
+    ) -> tuple[int | float, str] | None:
+        if self.result_cache is None:
+            return None
+        hit = await self.result_cache.get(compiled.canonical_key)
+        return (hit[0], compiled.workflow_string) if hit is not None else None
+
+    async def calculate_batch(
+        self, expressions: list[str]
+    ) -> tuple[list[CalculateExpressionResponse | Exception], str]:
+        # Identical expressions (after canonicalization) are evaluated once and
+        # every distinct workflow goes out in a single callback-less Chord
+        outcomes: dict[str, CalculateExpressionResponse | Exception] = {}
+        compiled_by_expression: dict[str, CompiledExpression] = {}
+        workflows_by_compiled: dict[int, Chain | Chord | int | float] = {}
+        for expression in dict.fromkeys(expressions):
+            try:
+                compiled, workflow = self.compile(expression)
+            except Exception as e:
+                outcomes[expression] = e
+                continue
+            compiled_by_expression[expression] = compiled
+            workflows_by_compiled.setdefault(id(compiled), workflow)
+
+        distinct = list(
+            {id(c): c for c in compiled_by_expression.values()}.values()
+        )
+        shared = self.batch_planner.shared_subtrees(
+            [compiled.expression_tree for compiled in distinct]
+        )
+
+        batch_string = f"chord({len(distinct)} workflows, body=None)"
+        shared_values: dict[str, int | float | Exception] = {}
+        shared_strings: dict[str, str] = {}
+        if shared:
+            # Stage one evaluates subtrees that appear in several expressions
+            stage_one = [
+                self.builder.build_workflow(subtree.node) for subtree in shared
+            ]
+            results = await self._run_chord(stage_one)
+            for subtree, result in zip(shared, results):
+                shared_values[subtree.key] = result
+                if not isinstance(result, Exception):
+                    shared_strings[subtree.key] = str(
+                        FoldedSubtree(subtree.node.to_infix(), result)
+                    )
+            batch_string = (
+                f"chord({len(shared)} shared subtrees, body=None) -> {batch_string}"
+            )
+
+        workflows: list[Chain | Chord | int | float] = []
+        workflow_strings: list[str] = []
+        responses: dict[int, CalculateExpressionResponse | Exception | None] = {}
+        for compiled in distinct:
+            try:
+                tree, used = self.batch_planner.substitute(
+                    compiled.expression_tree, shared_values
+                )
+            except Exception as e:
+                responses[id(compiled)] = e
+                continue
+
+            if used:
+                workflow, workflow_string = self.builder.build(tree)
+                shown = "; ".join(shared_strings[key] for key in used)
+                workflow_string = f"shared({shown}) -> {workflow_string}"
+            else:
+                workflow = workflows_by_compiled[id(compiled)]
+                workflow_string = compiled.workflow_string
+            workflows.append(workflow)
+            workflow_strings.append(workflow_string)
+            responses[id(compiled)] = None
+
+        pending = [key for key, value in responses.items() if value is None]
+        results = await self._run_chord(workflows)
+        for key, result, workflow_string in zip(pending, results, workflow_strings):
+            if isinstance(result, Exception):
+                responses[key] = result
+            else:
+                responses[key] = CalculateExpressionResponse(
+                    result=result, workflow=workflow_string
+                )
+
+        for expression, compiled in compiled_by_expression.items():
+            outcomes[expression] = responses[id(compiled)]
+
+        logger.info(
+            f"Batch of {len(expressions)} expressions evaluated as {batch_string}"
+        )
+        return [outcomes[expression] for expression in expressions], batch_string
+
+    async def calculate_stream(
+        self,
+        expressions: AsyncIterable[str],
+        max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+    ) -> AsyncIterator[tuple[int, str, CalculateExpressionResponse | Exception]]:
+        # Yields (index, expression, outcome) in completion order; the input is
+        # only read while fewer than max_in_flight workflows are outstanding
+        in_flight: set[asyncio.Task] = set()
+        try:
+            index = 0
+            async for expression in expressions:
+                if len(in_flight) >= max_in_flight:
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.add(
+                    asyncio.create_task(self._calculate_item(index, expression))
+                )
+                index += 1
+
+                for task in [task for task in in_flight if task.done()]:
+                    in_flight.discard(task)
+                    yield task.result()
+
+            while in_flight:
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            # The client went away or the input failed; stop outstanding work
+            for task in in_flight:
+                task.cancel()
+
+    async def _calculate_item(
+        self, index: int, expression: str
+    ) -> tuple[int, str, CalculateExpressionResponse | Exception]:
+        try:
+            return index, expression, await self.calculate(expression)
+        except Exception as e:
+            return index, expression, e
+
+    async def _run_chord(
+        self,
+        workflows: list[Chain | Chord | int | float],
+        timeout: float = BATCH_RESULT_TIMEOUT_SECONDS,
+    ) -> list[int | float | Exception]:
+        results: list[int | float | Exception] = list(workflows)
+        indexes = [
+            index
+            for index, workflow in enumerate(workflows)
+            if not isinstance(workflow, (int, float))
+        ]
+        if not indexes:
+            return results
+
+        push = isinstance(self.result_waiter, PubSubResultWaiter)
+        if push:
+            keys = [uuid.uuid4().hex for _ in indexes]
+        else:
+            keys = [workflows[index].id for index in indexes]
+        for key in keys:
+            await self.result_waiter.register(key)
+
+        try:
+            if push:
+                # Each member pushes its own result, so no callback is needed
+                members = [
+                    self._with_notification(workflows[index], key)
+                    for index, key in zip(indexes, keys)
+                ]
+                batch = Chord(nodes=members, callback=None)
+                await batch.create(RESULT_BACKEND)
+                await batch.start(BROKER)
+            else:
+                # Results are polled per workflow id, so members run on their own
+                for index in indexes:
+                    await workflows[index].create(RESULT_BACKEND)
+                    await workflows[index].start(BROKER)
+        except BaseException:
+            for key in keys:
+                await self.result_waiter.cancel(key)
+            raise
+
+        values = await asyncio.gather(
+            *(
+                self.result_waiter.wait(key, timeout)
+                for key in keys
+            ),
+            return_exceptions=True,
+        )
+        for index, value in zip(indexes, values):
+            results[index] = value
+        return results
+
+    def _with_notification(self, workflow: Chain | Chord, key: str) -> Chain:
+        # Every node carries the channel, so that whichever one fails can
+        # publish its error there instead of leaving the request to time out
+        channel = self.result_waiter.channel_for(key)
+        stamped = json.dumps({"channel": channel}, separators=(",", ":"))
+        stack: list[Node | Chain | Chord] = [workflow]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Node):
+                item.input = (
+                    stamped if item.input is None
+                    else item.input.replace(UNSET_CHANNEL, stamped[:-1], 1)
+                )
+                continue
+            stack.extend(item.nodes)
+            if isinstance(item, Chord) and item.callback is not None:
+                stack.append(item.callback)
+
+        notify_input = NotifyInput(channel=channel)
+        notify_node = Node(
+            topic=NOTIFY_TASKS_TOPIC,
+            input=notify_input.model_dump_json(),
+        )
+        return Chain(nodes=[workflow, notify_node])
 
-        for i in range(timeout * 2):
-            result_node: NodeResult | None = await RESULT_BACKEND.get_result(workflow_id)
+    async def close(self) -> None:
+        await self.result_waiter.close()
+        if self.result_cache is not None:
+            await self.result_cache.close()
+        if self.single_flight is not None:
+            await self.single_flight.close()
 
-            if result_node:
-                logger.info(f"Result found for {workflow_id}: {result_node.result}")
-                final_value = result_node.result_obj
-                if isinstance(final_value, dict) and 'result' in final_value:
-                    return float(final_value['result'])
+    def compile(
+        self, expression: str
+    ) -> tuple[CompiledExpression, Chain | Chord | int | float]:
+        # Mini canvas objects carry the id of a single run and cannot be shared
+        # between requests, so a cache hit skips parsing and canonicalization
+        # and only re-instantiates the Chain/Chord from the cached tree.
+        text_key = ("text", REGEX_SPACES.sub("", expression))
+        compiled = self.workflow_cache.get(text_key)
+        if compiled is not None:
+            return compiled, self.builder.build_workflow(compiled.expression_tree)
 
-                return final_value
+        # The array form is enough for the key; only a miss makes the tree the
+        # optimization passes and planners still walk
+        compact = self.parser.parse_compact(expression)
+        canonical = self.builder.canonical_key(compact)
+        compiled = self.workflow_cache.get(("canonical", canonical))
+        if compiled is not None:
+            workflow = self.builder.build_workflow(compiled.expression_tree)
+        else:
+            parsed = compact.to_tree()
+            logger.info("Parsed expression: %s", parsed)
+            workflow, workflow_str = self.builder.build(parsed)
+            memo_subtrees = (
+                self.subtree_memo.select(parsed)
+                if self.subtree_memo is not None
+                else {}
+            )
+            compiled = CompiledExpression(
+                parsed,
+                workflow_str,
+                canonical,
+                memo_subtrees,
+                *self._plan_common_subtrees(parsed, workflow),
+            )
+            self.workflow_cache.set(("canonical", canonical), compiled)
 
-            logger.debug(f"Result for {workflow_id} not ready yet. Attempt {i + 1}/{timeout * 2}")
-            await asyncio.sleep(0.1)
+        self.workflow_cache.set(text_key, compiled)
+        return compiled, workflow
 
-        raise TimeoutError(f"Workflow {workflow_id} timed out after {timeout} seconds.")
+    def metrics(self) -> dict[str, dict]:
+        metrics = {
+            "workflow_cache": self.workflow_cache.stats(),
+            "prepared_expressions": self.prepared_expressions.stats(),
+        }
+        if self.result_cache is not None:
+            metrics["result_cache"] = self.result_cache.stats()
+        if self.single_flight is not None:
+            metrics["single_flight"] = self.single_flight.stats()
+        if self.subtree_memo is not None:
+            metrics["subtree_memo"] = self.subtree_memo.stats()
+        if self.rebalancer is not None:
+            metrics["rebalancer"] = self.rebalancer.stats()
+        if self.template_cache is not None:
+            stats = self.template_cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            metrics["workflow_templates"] = {
+                **stats,
+                "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+            }
+        return metrics
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+
+from redis import asyncio as aioredis
+
+from mini.worker.result_backends import NodeResult
+from app.models.worker_models import FailureOutput, NumberOutput
+from app.types.errors import WorkflowFailedError
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubResultWaiter:
+    # The NotifyWorker at the end of every workflow publishes the final result
+    # on a per-request channel, and a failing node publishes its error there;
+    # one pattern subscription over all the channels resolves the futures
+    def __init__(self, redis_uri: str, channel_prefix: str):
+        self.redis_uri = redis_uri
+        self.channel_prefix = channel_prefix
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: aioredis.Redis | None = None
+        self._pubsub = None
+        self._subscribed = False
+        self._reader: asyncio.Task | None = None
+        self._waiters: dict[str, asyncio.Future] = {}
+
+    def channel_for(self, key: str) -> str:
+        return f"{self.channel_prefix}{key}"
+
+    async def register(self, key: str) -> None:
+        # Must complete before the workflow starts, so the result cannot be
+        # published ahead of the subscription
+        self._bind_to_running_loop()
+        self._waiters[self.channel_for(key)] = self._loop.create_future()
+        if not self._subscribed:
+            await self._pubsub.psubscribe(f"{self.channel_prefix}*")
+            self._subscribed = True
+        if self._reader is None or self._reader.done():
+            self._reader = self._loop.create_task(self._read_messages())
+
+    async def wait(self, key: str, timeout: float) -> float:
+        channel = self.channel_for(key)
+        try:
+            return await asyncio.wait_for(self._waiters[channel], timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Workflow {key} timed out after {timeout} seconds.")
+        finally:
+            await self.cancel(key)
+
+    async def cancel(self, key: str) -> None:
+        # The pattern subscription stays; messages for a cancelled key are
+        # dropped by the reader
+        future = self._waiters.pop(self.channel_for(key), None)
+        if future is not None:
+            future.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._waiters)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+        self._loop = self._client = self._pubsub = self._reader = None
+        self._subscribed = False
+
+    def _bind_to_running_loop(self) -> None:
+        # Redis connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._client = aioredis.Redis.from_url(self.redis_uri)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._subscribed = False
+        self._reader = None
+
+    async def _read_messages(self) -> None:
+        try:
+            while True:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "pmessage":
+                    self._resolve(message["channel"].decode(), message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Result subscription failed: {str(e)}")
+            # Reconnect on the next registration, after closing the failed
+            # connections
+            pubsub, client = self._pubsub, self._client
+            self._loop = None
+            for future in self._waiters.values():
+                if not future.done():
+                    future.set_exception(e)
+            await self._discard(pubsub, client)
+
+    async def _discard(self, pubsub, client: aioredis.Redis) -> None:
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close the result subscription: {str(e)}")
+
+    def _resolve(self, channel: str, payload: bytes) -> None:
+        future = self._waiters.get(channel)
+        if future is None or future.done():
+            return
+
+        message = json.loads(payload)
+        if "error" in message:
+            future.set_exception(self._failure(FailureOutput.model_validate(message)))
+            return
+        # Same type as the polled result
+        future.set_result(float(NumberOutput.model_validate(message).result))
+
+    @staticmethod
+    def _failure(failure: FailureOutput) -> Exception:
+        # Division by zero keeps its type, so the API answers 400 as it does
+        # for a constant division folded in-process
+        if failure.error_type == ZeroDivisionError.__name__:
+            return ZeroDivisionError(failure.error)
+        return WorkflowFailedError(failure.error_type, failure.error)
+
+
+class PollingResultWaiter:
+    # For result backends that cannot push: a single shared poller checks
+    # every pending workflow once per tick instead of one loop per request
+    def __init__(self, result_backend, interval_seconds: float):
+        self.result_backend = result_backend
+        self.interval_seconds = interval_seconds
+        self._poller: asyncio.Task | None = None
+        self._waiters: dict[str, asyncio.Future] = {}
+
+    async def register(self, key: str) -> None:
+        loop = asyncio.get_running_loop()
+        self._waiters[key] = loop.create_future()
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+
+    async def wait(self, key: str, timeout: float) -> int | float:
+        logger.info(f"Waiting for result for workflow_id: {key}")
+        try:
+            return await asyncio.wait_for(self._waiters[key], timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Workflow {key} timed out after {timeout} seconds.")
+        finally:
+            await self.cancel(key)
+
+    async def cancel(self, key: str) -> None:
+        future = self._waiters.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+        self._poller = None
+
+    async def _poll(self) -> None:
+        while self._waiters:
+            workflow_ids = list(self._waiters)
+            results = await asyncio.gather(
+                *(self.result_backend.get_result(key) for key in workflow_ids),
+                return_exceptions=True,
+            )
+
+            for workflow_id, result_node in zip(workflow_ids, results):
+                future = self._waiters.get(workflow_id)
+                if future is None or future.done() or result_node is None:
+                    continue
+                if isinstance(result_node, Exception):
+                    future.set_exception(result_node)
+                    continue
+                future.set_result(self._final_value(workflow_id, result_node))
+
+            await asyncio.sleep(self.interval_seconds)
+
+    def _final_value(self, workflow_id: str, result_node: NodeResult) -> int | float:
+        logger.info(f"Result found for {workflow_id}: {result_node.result}")
+        final_value = result_node.result_obj
+        if isinstance(final_value, dict) and 'result' in final_value:
+            return float(final_value['result'])
+        return final_value
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import threading
+import uuid
+from typing import Awaitable, Callable, TypeVar
+
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Delete the lock only if this replica still holds it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    # Concurrent calls for the same key share one execution. With a Redis URL,
+    # a short-lived lock extends this across API replicas: a replica that
+    # loses the race waits for the winner's result to show up via `peek`.
+    def __init__(
+        self,
+        redis_url: str | None = None,
+        lock_ttl_seconds: float = 5.0,
+        poll_interval_seconds: float = 0.02,
+        key_prefix: str = "single-flight:",
+    ):
+        self.redis_url = redis_url
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.key_prefix = key_prefix
+        self._calls: dict[str, asyncio.Task] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: aioredis.Redis | None = None
+        self._release_script = None
+
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.replica_coalesced = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        peek: Callable[[], Awaitable[T | None]] | None = None,
+    ) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            # A separate task, so a cancelled caller does not fail the others
+            task = asyncio.ensure_future(self._run(key, fn, peek))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._loop = self._client = self._release_script = None
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "replica_coalesced": self.replica_coalesced,
+                "in_flight": len(self._calls),
+            }
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def _run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        peek: Callable[[], Awaitable[T | None]] | None,
+    ) -> T:
+        client = self._redis()
+        if client is None or peek is None:
+            return await self._execute(fn)
+
+        lock_key = self.key_prefix + key
+        token = uuid.uuid4().hex
+        try:
+            acquired = await client.set(
+                lock_key, token, nx=True, px=int(self.lock_ttl_seconds * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+            return await self._execute(fn)
+
+        if not acquired:
+            result = await self._wait_for_replica(client, lock_key, peek)
+            if result is not None:
+                with self._lock:
+                    self.replica_coalesced += 1
+                return result
+            return await self._execute(fn)
+
+        try:
+            return await self._execute(fn)
+        finally:
+            try:
+                await self._release_script(keys=[lock_key], args=[token])
+            except Exception as e:
+                logger.warning(f"Failed to release {lock_key}: {str(e)}")
+
+    async def _execute(self, fn: Callable[[], Awaitable[T]]) -> T:
+        with self._lock:
+            self.executed += 1
+        return await fn()
+
+    async def _wait_for_replica(
+        self,
+        client: aioredis.Redis,
+        lock_key: str,
+        peek: Callable[[], Awaitable[T | None]],
+    ) -> T | None:
+        # Another replica holds the lock; its result lands in shared storage.
+        # Give up once the lock is gone (released or expired) without one.
+        deadline = asyncio.get_running_loop().time() + self.lock_ttl_seconds
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(self.poll_interval_seconds)
+            result = await peek()
+            if result is not None:
+                return result
+            try:
+                if not await client.exists(lock_key):
+                    return await peek()
+            except Exception as e:
+                logger.warning(f"Single-flight lock unavailable: {str(e)}")
+                return None
+        return None
+
+    def _redis(self) -> aioredis.Redis | None:
+        if self.redis_url is None:
+            return None
+
+        # Redis connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = aioredis.Redis.from_url(self.redis_url)
+            self._release_script = self._client.register_script(_RELEASE_SCRIPT)
+        return self._client
@@ -1,7 +1,25 @@
-from .expression_parser import ExpressionNode
+from .cache import LRUCache
+from .chain_rewriter import ChainRewriter
+from .constant_folder import ConstantFolder, FoldedSubtree
+from .expression_parser import CompactExpression, ExpressionNode
+from .tree_rebalancer import RebalanceReport, TreeRebalancer
+from .workflow_template import (
+    PreparedWorkflow,
+    bind_variables,
+    expression_shape,
+    parameterize,
+)
+import hashlib
 import logging
 from mini.worker.workers.canvas import Node, Chain, Chord
-from ..models.worker_models import BinaryOperationInput, AggregateInput, ChainLinkInput
+from ..models.worker_models import (
+    AggregateInput,
+    BinaryOperationInput,
+    ChainLinkInput,
+    WorkflowInput,
+    pack_numbers,
+    unpack_numbers,
+)
 from ..constants.constants import (
     OperationEnum,
     OPERATION_TOPIC_MAP,
@@ -11,60 +29,357 @@ from ..constants.constants import (
 
 logger = logging.getLogger(__name__)
 
+FOLDED_SUBTREES_SHOWN = 10
+# Model of each topic's input; templates rebuild the inputs through them
+INPUT_MODELS: dict[str, type[WorkflowInput]] = {
+    **{topic: BinaryOperationInput for topic in OPERATION_TOPIC_MAP.values()},
+    **{topic: ChainLinkInput for topic in OPERATION_WRAPPER_TOPIC_MAP.values()},
+    **{topic: AggregateInput for topic in AGGREGATOR_TOPIC_MAP.values()},
+}
+# Where a template parameter sits in an input: the field, the position in a
+# list field (None for a scalar), the parameter index, and whether it was
+# passed on as a float
+ParameterPosition = tuple[str, int | None, int, bool]
+
 
 class WorkflowBuilder:
+    def __init__(
+        self,
+        folder: ConstantFolder | None = None,
+        max_fan_in: int | None = None,
+        rewriter: ChainRewriter | None = None,
+        rebalancer: TreeRebalancer | None = None,
+        max_string_length: int | None = None,
+        templates: LRUCache | None = None,
+        packed_min_values: int | None = None,
+    ):
+        self.folder = folder
+        self.max_fan_in = max_fan_in
+        self.rewriter = rewriter
+        self.rebalancer = rebalancer
+        self.max_string_length = max_string_length
+        self.templates = templates
+        self.packed_min_values = packed_min_values
+
     def build(
         self,
         expression_tree:
         ExpressionNode | int | float,
     ) -> tuple[Chain | Chord | int | float, str]:
-        workflow_object = self._build_recursive(expression_tree)
+        expression_tree, folded, report = self._fold(expression_tree)
+        final_workflow_object = self._build_final(expression_tree)
+        workflow_str = self._workflow_to_string(final_workflow_object)
 
-        if isinstance(workflow_object, Node):
-            final_workflow_object = Chain(nodes=[workflow_object])
+        return final_workflow_object, f"{self._prefix(folded, report)}{workflow_str}"
+
+    def prepare(
+        self, expression_tree: ExpressionNode | int | float
+    ) -> PreparedWorkflow:
+        # Everything but binding the variables, done once per prepared
+        # expression; the folder leaves subtrees with variables alone
+        expression_tree, folded, report = self._fold(expression_tree)
+        prefix = self._prefix(folded, report)
+        if not isinstance(expression_tree, ExpressionNode):
+            return PreparedWorkflow(None, [expression_tree], prefix)
+        return PreparedWorkflow(*self._template(expression_tree), prefix)
+
+    def bind(
+        self, prepared: PreparedWorkflow, arguments: list[int | float]
+    ) -> tuple[Chain | Chord | int | float, str]:
+        values = bind_variables(prepared.values, arguments)
+        if prepared.template is None:
+            workflow = values[0]
         else:
-            final_workflow_object = workflow_object
+            workflow = self._instantiate(prepared.template, values)
+        return workflow, f"{prepared.prefix}{self._workflow_to_string(workflow)}"
 
-        workflow_str = self._workflow_to_string(final_workflow_object)
+    def build_workflow(
+        self,
+        expression_tree: ExpressionNode | int | float,
+    ) -> Chain | Chord | int | float:
+        expression_tree, _, _ = self._fold(expression_tree)
+        return self._build_final(expression_tree)
+
+    def _fold(
+        self, expression_tree: ExpressionNode | int | float
+    ) -> tuple[
+        ExpressionNode | int | float, list[FoldedSubtree], RebalanceReport | None
+    ]:
+        report = None
+        if self.rebalancer is not None:
+            expression_tree, report = self.rebalancer.rebalance(expression_tree)
+        if self.rewriter is not None:
+            expression_tree = self.rewriter.rewrite(expression_tree)
+        if self.folder is None:
+            return expression_tree, [], report
+        return *self.folder.fold(expression_tree), report
+
+    def _prefix(
+        self, folded: list[FoldedSubtree], report: RebalanceReport | None
+    ) -> str:
+        # What the tree went through, ahead of the workflow string
+        prefix = f"{self._folded_to_string(folded)} -> " if folded else ""
+        if report is not None and report.depth_after < report.depth_before:
+            prefix = f"{report} -> {prefix}"
+        return prefix
+
+    def _folded_to_string(self, folded: list[FoldedSubtree]) -> str:
+        shown = [str(subtree) for subtree in folded[:FOLDED_SUBTREES_SHOWN]]
+        if len(folded) > FOLDED_SUBTREES_SHOWN:
+            shown.append(f"... {len(folded) - FOLDED_SUBTREES_SHOWN} more")
+        return f"folded({'; '.join(shown)})"
+
+    def _build_final(
+        self,
+        expression_tree: ExpressionNode | int | float,
+    ) -> Chain | Chord | int | float:
+        if self.templates is not None and isinstance(expression_tree, ExpressionNode):
+            return self._instantiate(*self._template(expression_tree))
+        return self._build_workflow(expression_tree)
 
-        return final_workflow_object, workflow_str
+    def _build_workflow(
+        self,
+        expression_tree: ExpressionNode | int | float,
+    ) -> Chain | Chord | int | float:
+        if not isinstance(expression_tree, (ExpressionNode, int, float)):
+            raise TypeError(f"Invalid node type: {type(expression_tree)}")
+        # Built from the array form
+        workflow_object = self._build_tree(CompactExpression.from_tree(expression_tree))
 
-    def _build_recursive(
+        if isinstance(workflow_object, Node):
+            return Chain(nodes=[workflow_object])
+        return workflow_object
+
+    def _template(
+        self, node: ExpressionNode
+    ) -> tuple[list[tuple], list[int | float]]:
+        # Expressions that differ only in their constants share one template
+        shape, values = expression_shape(node)
+        steps = self.templates.get(shape) if self.templates is not None else None
+        if steps is None:
+            steps = self._template_steps(self._build_workflow(parameterize(node)))
+            if self.templates is not None:
+                self.templates.set(shape, steps)
+        return steps, values
+
+    def _template_steps(self, workflow: Chain | Chord) -> list[tuple]:
+        # Postfix steps that rebuild the workflow: each Node with its input
+        # template, each Chain and Chord over the items built before it
+        steps: list[tuple] = []
+        stack: list[tuple[Node | Chain | Chord, bool]] = [(workflow, False)]
+        while stack:
+            item, expanded = stack.pop()
+            if isinstance(item, Node):
+                steps.append(
+                    (Node, item.topic, self._input_template(item.topic, item.input))
+                )
+            elif not expanded:
+                children = list(item.nodes)
+                if isinstance(item, Chord) and item.callback:
+                    children.append(item.callback)
+                stack.append((item, True))
+                stack.extend((child, False) for child in reversed(children))
+            elif isinstance(item, Chain):
+                steps.append((Chain, len(item.nodes)))
+            else:
+                steps.append((Chord, len(item.nodes), bool(item.callback)))
+        return steps
+
+    @staticmethod
+    def _input_template(
+        topic: str, task_input: str | None
+    ) -> tuple[type[WorkflowInput], dict, list[ParameterPosition]] | None:
+        # The input's model, its fields and where each parameter sits. Every
+        # number in a template's input is a parameter; a packed buffer is
+        # kept as the list of its parameters, to be packed again once bound
+        if task_input is None:
+            return None
+        model = INPUT_MODELS[topic]
+        fields = model.model_validate_json(task_input).model_dump()
+        if fields.get("packed_values") is not None:
+            fields["packed_values"] = unpack_numbers(fields["packed_values"])
+
+        parameters: list[ParameterPosition] = []
+        for name, value in fields.items():
+            if isinstance(value, list):
+                parameters.extend(
+                    (name, position, int(number), isinstance(number, float))
+                    for position, number in enumerate(value)
+                )
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                parameters.append((name, None, int(value), isinstance(value, float)))
+        return model, fields, parameters
+
+    @staticmethod
+    def _instantiate(steps: list[tuple], values: list[int | float]) -> Chain | Chord:
+        # Copies each input's fields with the parameters replaced by their
+        # values and serializes them through the input's model
+        built: list[Node | Chain | Chord] = []
+        for kind, *step in steps:
+            if kind is Node:
+                topic, input_template = step
+                if input_template is None:
+                    built.append(Node(topic=topic))
+                    continue
+                model, template_fields, parameters = input_template
+                fields = {
+                    name: list(value) if isinstance(value, list) else value
+                    for name, value in template_fields.items()
+                }
+                for name, position, index, as_float in parameters:
+                    value = float(values[index]) if as_float else values[index]
+                    if position is None:
+                        fields[name] = value
+                    else:
+                        fields[name][position] = value
+                if fields.get("packed_values") is not None:
+                    # Constants a buffer cannot hold are written out instead
+                    numbers = fields["packed_values"]
+                    fields["packed_values"] = pack_numbers(numbers)
+                    if fields["packed_values"] is None:
+                        fields["values"] = numbers
+                task_input = model.model_construct(**fields).model_dump_json()
+                built.append(Node(topic=topic, input=task_input))
+            elif kind is Chain:
+                nodes = built[len(built) - step[0]:]
+                del built[len(built) - step[0]:]
+                built.append(Chain(nodes=nodes))
+            else:
+                count, has_callback = step
+                callback = built.pop() if has_callback else None
+                nodes = built[len(built) - count:]
+                del built[len(built) - count:]
+                built.append(Chord(nodes=nodes, callback=callback))
+        return built[0]
+
+    def _aggregate_input(self, values: list[int | float]) -> AggregateInput:
+        # Long constant lists travel as one packed buffer
+        if self.packed_min_values is not None and len(values) >= self.packed_min_values:
+            packed_values = pack_numbers(values)
+            if packed_values is not None:
+                return AggregateInput(packed_values=packed_values)
+        return AggregateInput(values=values)
+
+    def canonical_key(self, expression: CompactExpression) -> str:
+        if expression.operation(expression.root) is None:
+            return repr(expression.constant(expression.root))
+        return self.canonical_digests(expression)[expression.root]
+
+    def canonical_digests(self, expression: CompactExpression) -> list[str | None]:
+        # Digest of every distinct subtree, by slot; constants and slots only
+        # inside a flattened run of the same commutative operation get none
+        digests: list[str | None] = [None] * len(expression)
+        stack: list[tuple[int, list[int] | None]] = [(expression.root, None)]
+
+        while stack:
+            index, operands = stack.pop()
+            if operands is None:
+                operation = expression.operation(index)
+                if operation is None or digests[index] is not None:
+                    continue
+                if operation.is_commutative:
+                    operands = expression.flatten_commutative(index)
+                else:
+                    operands = [expression.left[index], expression.right[index]]
+                stack.append((index, operands))
+                stack.extend(
+                    (operand, None) for operand in operands if digests[operand] is None
+                )
+                continue
+
+            operation = expression.operation(index)
+            parts = [
+                repr(expression.constant(operand))
+                if digests[operand] is None
+                else digests[operand]
+                for operand in operands
+            ]
+            if operation.is_commutative:
+                parts.sort()
+            canonical = f"{operation.name}({','.join(parts)})"
+            digests[index] = hashlib.blake2b(
+                canonical.encode(), digest_size=16
+            ).hexdigest()
+
+        return digests
+
+    def subtree_digests(self, node: ExpressionNode) -> dict[int, str]:
+        # canonical_digests by node id, for the planners that walk trees
+        slots: dict[int, int] = {}
+        digests = self.canonical_digests(CompactExpression.from_tree(node, slots))
+        return {
+            key: digests[index]
+            for key, index in slots.items()
+            if digests[index] is not None
+        }
+
+    def _build_tree(
             self,
-            node: ExpressionNode | int | float,
+            expression: CompactExpression,
     ) -> Node | Chain | Chord | int | float:
-        if isinstance(node, (int, float)):
-            return float(node)
-
-        if not isinstance(node, ExpressionNode):
-            raise TypeError(f"Invalid node type: {type(node)}")
-
-        is_left_constant = isinstance(node.left, (int, float))
-        is_right_constant = isinstance(node.right, (int, float))
+        # Post-order over an explicit stack of slots, so that depth is not
+        # bounded by the recursion limit: a slot is expanded into its
+        # operands, and combined once their workflows are on top of `built`
+        built: list[Node | Chain | Chord | int | float] = []
+        stack: list[tuple[int, list[int] | None]] = [(expression.root, None)]
+
+        while stack:
+            index, operands = stack.pop()
+            if operands is None:
+                if expression.operation(index) is None:
+                    built.append(float(expression.constant(index)))
+                    continue
+                operands = self._operands(expression, index)
+                stack.append((index, operands))
+                stack.extend((operand, None) for operand in reversed(operands))
+                continue
+
+            workflows = built[len(built) - len(operands):]
+            del built[len(built) - len(operands):]
+            built.append(self._combine(expression, index, workflows))
+
+        return built[0]
+
+    @staticmethod
+    def _operands(expression: CompactExpression, index: int) -> list[int]:
+        # A run of one commutative operation is built as a single flat workflow
+        if expression.operation(index).is_commutative:
+            return expression.flatten_commutative(index)
+        return [expression.left[index], expression.right[index]]
+
+    def _combine(
+            self,
+            expression: CompactExpression,
+            index: int,
+            workflows: list[Node | Chain | Chord | int | float],
+    ) -> Node | Chain | Chord | int | float:
+        operation = expression.operation(index)
+        left, right = expression.left[index], expression.right[index]
+        is_left_constant = expression.operation(left) is None
+        is_right_constant = expression.operation(right) is None
 
         # Both are constants
         if is_left_constant and is_right_constant:
-            task_input = BinaryOperationInput(x=node.left, y=node.right)
+            task_input = BinaryOperationInput(
+                x=expression.constant(left), y=expression.constant(right)
+            )
             op_node = Node(
-                topic=OPERATION_TOPIC_MAP[node.operation],
+                topic=OPERATION_TOPIC_MAP[operation],
                 input=task_input.model_dump_json()
             )
             return Chain(nodes=[op_node])
 
         # Both are same operation and commutative
-        if node.operation.is_commutative and (
-            not is_left_constant or not is_right_constant
-        ):
-            return self._build_flat_workflow(node)
+        if operation.is_commutative:
+            return self._build_flat_workflow(operation, workflows)
 
-        left_workflow = self._build_recursive(node.left)
-        right_workflow = self._build_recursive(node.right)
+        left_workflow, right_workflow = workflows
 
         # Left is OperationNode, Right is constant
         if not is_left_constant and is_right_constant:
             op_input = ChainLinkInput(next_operand=right_workflow, is_left_fixed=False)
             op_node = Node(
-                topic=OPERATION_WRAPPER_TOPIC_MAP[node.operation],
+                topic=OPERATION_WRAPPER_TOPIC_MAP[operation],
                 input=op_input.model_dump_json()
             )
             return Chain(nodes=[left_workflow, op_node])
@@ -73,56 +388,43 @@ class WorkflowBuilder:
         if is_left_constant and not is_right_constant:
             op_input = ChainLinkInput(next_operand=left_workflow, is_left_fixed=True)
             op_node = Node(
-                topic=OPERATION_WRAPPER_TOPIC_MAP[node.operation],
+                topic=OPERATION_WRAPPER_TOPIC_MAP[operation],
                 input=op_input.model_dump_json()
             )
             return Chain(nodes=[right_workflow, op_node])
 
         # Both are OperationNodes
-        callback_node = Node(topic=OPERATION_TOPIC_MAP[node.operation])
+        callback_node = Node(topic=OPERATION_TOPIC_MAP[operation])
         return Chord(
             nodes=[left_workflow, right_workflow],
             callback=callback_node
         )
 
-    def _flatten_commutative_operands(
-            self, node, operation: OperationEnum
-    ) -> list[ExpressionNode | float | int]:
-        sub_commutative_expression: list[ExpressionNode | float | int] = []
-
-        if node is None:
-            return sub_commutative_expression
-
-        if not isinstance(node, ExpressionNode) or node.operation != operation:
-            sub_commutative_expression.append(node)
-            return sub_commutative_expression
-
-        sub_commutative_expression.extend(
-            self._flatten_commutative_operands(node.left, operation)
-        )
-        sub_commutative_expression.extend(
-            self._flatten_commutative_operands(node.right, operation)
-        )
-
-        return sub_commutative_expression
-
-    def _build_flat_workflow(self, node: ExpressionNode) -> Node | Chain | Chord | int | float:
-        flatten_commutative_nodes = self._flatten_commutative_operands(
-            node, node.operation
-        )
-        logger.info(f"Flattened nodes: {flatten_commutative_nodes}")
-        child_workflows = [
-            self._build_recursive(sub_node) for sub_node in flatten_commutative_nodes
-        ]
-
+    def _build_flat_workflow(
+            self,
+            operation: OperationEnum,
+            child_workflows: list[Node | Chain | Chord | int | float],
+    ) -> Node | Chain | Chord | int | float:
+        # child_workflows are the built operands of the flattened run
+        logger.debug(f"Flattened {len(child_workflows)} operands of {operation}")
         tasks, constants = self._split_tasks_and_constants(child_workflows)
-        identity = 0.0 if node.operation == OperationEnum.ADD else 1.0
+        if self.max_fan_in is not None and len(constants) > self.max_fan_in:
+            # Too many constants for one message: aggregate them in parallel
+            for chunk in self._balanced_chunks(constants, self.max_fan_in):
+                aggregate_input = self._aggregate_input(chunk)
+                aggregate_task = Node(
+                    topic=AGGREGATOR_TOPIC_MAP[operation],
+                    input=aggregate_input.model_dump_json(),
+                )
+                tasks.append(Chain(nodes=[aggregate_task]))
+            constants = []
+        identity = 0.0 if operation == OperationEnum.ADD else 1.0
 
         if not tasks:
-            return self._handle_no_tasks(node, constants, identity)
+            return self._handle_no_tasks(operation, constants, identity)
         if len(tasks) == 1:
-            return self._handle_single_task(node, tasks, constants)
-        return self._handle_multiple_tasks(node, tasks, constants)
+            return self._handle_single_task(operation, tasks, constants)
+        return self._handle_multiple_tasks(operation, tasks, constants)
 
     def _split_tasks_and_constants(
         self,
@@ -134,7 +436,7 @@ class WorkflowBuilder:
 
     def _handle_no_tasks(
         self,
-        node: ExpressionNode, constants, identity
+        operation: OperationEnum, constants, identity
     ) -> Chain | float:
         logger.info(f"Handling No Tasks: Constants: {constants}")
 
@@ -146,14 +448,14 @@ class WorkflowBuilder:
         if num_constants == 2:
             task_input = BinaryOperationInput(x=constants[0], y=constants[1])
             node = Node(
-                topic=OPERATION_TOPIC_MAP[node.operation],
+                topic=OPERATION_TOPIC_MAP[operation],
                 input=task_input.model_dump_json(),
             )
             return Chain(nodes=[node])
 
-        aggregate_input = AggregateInput(values=constants)
+        aggregate_input = self._aggregate_input(constants)
         node = Node(
-            topic=AGGREGATOR_TOPIC_MAP[node.operation],
+            topic=AGGREGATOR_TOPIC_MAP[operation],
             input=aggregate_input.model_dump_json(),
         )
 
@@ -161,7 +463,7 @@ class WorkflowBuilder:
 
     def _handle_single_task(
         self,
-        node: ExpressionNode,
+        operation: OperationEnum,
         tasks: list[Node],
         constants: list[int | float]
     ) -> Node | Chain | Chord | float:
@@ -176,25 +478,25 @@ class WorkflowBuilder:
         if num_constants == 1:
             task_input = ChainLinkInput(next_operand=constants[0], is_left_fixed=False)
             op_task = Node(
-                topic=OPERATION_WRAPPER_TOPIC_MAP[node.operation],
+                topic=OPERATION_WRAPPER_TOPIC_MAP[operation],
                 input=task_input.model_dump_json(),
             )
             return Chain(nodes=[task, op_task])
 
-        aggregate_input = AggregateInput(values=constants)
+        aggregate_input = self._aggregate_input(constants)
         aggregate_task = Node(
-            topic=AGGREGATOR_TOPIC_MAP[node.operation],
+            topic=AGGREGATOR_TOPIC_MAP[operation],
             input=aggregate_input.model_dump_json(),
         )
         call_back_aggregate_task = Node(
-            topic=AGGREGATOR_TOPIC_MAP[node.operation],
+            topic=AGGREGATOR_TOPIC_MAP[operation],
         )
         tasks.append(aggregate_task)
         return Chord(nodes=tasks, callback=call_back_aggregate_task)
 
     def _handle_multiple_tasks(
         self,
-        node: ExpressionNode,
+        operation: OperationEnum,
         tasks: list[Node | Chain | Chord],
         constants: list[int | float]
     ) -> Chord:
@@ -205,49 +507,140 @@ class WorkflowBuilder:
             const = constants[0]
             task_input = ChainLinkInput(next_operand=const, is_left_fixed=False)
             op_task = Node(
-                topic=OPERATION_WRAPPER_TOPIC_MAP[node.operation],
+                topic=OPERATION_WRAPPER_TOPIC_MAP[operation],
                 input=task_input.model_dump_json(),
             )
 
             aggregate_task = Node(
-                topic=AGGREGATOR_TOPIC_MAP[node.operation],
+                topic=AGGREGATOR_TOPIC_MAP[operation],
             )
             chain = Chain(nodes=[aggregate_task, op_task])
-            return Chord(nodes=tasks, callback=chain)
+            members = self._reduce_to_fan_in(tasks, operation)
+            return Chord(nodes=members, callback=chain)
 
         if num_constants > 1:
-            aggregate_input = AggregateInput(values=constants)
+            aggregate_input = self._aggregate_input(constants)
             aggregate_task = Node(
-                topic=AGGREGATOR_TOPIC_MAP[node.operation],
+                topic=AGGREGATOR_TOPIC_MAP[operation],
                 input=aggregate_input.model_dump_json(),
             )
             tasks.append(aggregate_task)
 
         aggregate_task = Node(
-            topic=AGGREGATOR_TOPIC_MAP[node.operation],
+            topic=AGGREGATOR_TOPIC_MAP[operation],
         )
-        return Chord(nodes=tasks, callback=aggregate_task)
+        members = self._reduce_to_fan_in(tasks, operation)
+        return Chord(nodes=members, callback=aggregate_task)
 
-    def _workflow_to_string(self, workflow: Node | Chain | Chord | int | float) -> str:
+    def _reduce_to_fan_in(
+        self,
+        tasks: list[Node | Chain | Chord],
+        operation: OperationEnum,
+    ) -> list[Node | Chain | Chord]:
+        # Balanced k-ary tree of partial aggregations: no chord joins more
+        # than max_fan_in members, and each level runs in parallel
+        if self.max_fan_in is None:
+            return tasks
+        while len(tasks) > self.max_fan_in:
+            tasks = [
+                Chord(
+                    nodes=chunk,
+                    callback=Node(topic=AGGREGATOR_TOPIC_MAP[operation]),
+                )
+                if len(chunk) > 1
+                else chunk[0]
+                for chunk in self._balanced_chunks(tasks, self.max_fan_in)
+            ]
+        return tasks
+
+    @staticmethod
+    def _balanced_chunks(items: list, max_size: int) -> list[list]:
+        # As few chunks as max_size allows, of near-equal size
+        count = -(-len(items) // max_size)
+        size = -(-len(items) // count)
+        return [items[index : index + size] for index in range(0, len(items), size)]
+
+    def task_count(self, workflow: Node | Chain | Chord | int | float) -> int:
+        # Number of task messages the workflow sends
+        tasks = 0
+        stack = [] if isinstance(workflow, (int, float)) else [workflow]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Node):
+                tasks += 1
+            elif isinstance(item, Chain):
+                stack.extend(item.nodes)
+            elif isinstance(item, Chord):
+                stack.extend(item.nodes)
+                if item.callback:
+                    stack.append(item.callback)
+        return tasks
+
+    def critical_path_hops(self, workflow: Node | Chain | Chord | int | float) -> int:
+        # Number of sequential task round trips before the result is ready
         if isinstance(workflow, (int, float)):
-            return f"constant({workflow})"
-
-        if isinstance(workflow, Node):
-            return f"Task({workflow.topic})"
-
-        if isinstance(workflow, Chain):
-            task_strings = [self._workflow_to_string(node) for node in workflow.nodes]
-            return " | ".join(task_strings)
-
-        if isinstance(workflow, Chord):
-            header_tasks = [self._workflow_to_string(node) for node in workflow.nodes]
-            header_str = f"group({', '.join(header_tasks)})"
-
-            if workflow.callback:
-                callback_str = self._workflow_to_string(workflow.callback)
+            return 0
+        hops: dict[int, int] = {}
+        stack: list[tuple[Node | Chain | Chord, bool]] = [(workflow, False)]
+        while stack:
+            item, children_done = stack.pop()
+            if isinstance(item, Node):
+                hops[id(item)] = 1
+                continue
+            children = list(item.nodes)
+            if isinstance(item, Chord) and item.callback:
+                children.append(item.callback)
+            if not children_done:
+                stack.append((item, True))
+                stack.extend((child, False) for child in children)
+                continue
+            if isinstance(item, Chain):
+                hops[id(item)] = sum(hops[id(child)] for child in item.nodes)
             else:
-                callback_str = "None"
-
-            return f"chord({header_str}, body={callback_str})"
+                header = max((hops[id(child)] for child in item.nodes), default=0)
+                callback = hops[id(item.callback)] if item.callback else 0
+                hops[id(item)] = header + callback
+        return hops[id(workflow)]
 
-        return "Unknown Workflow Object"
\ No newline at end of file
+    def _workflow_to_string(self, workflow: Node | Chain | Chord | int | float) -> str:
+        # Explicit stack of workflows still to render and literal pieces,
+        # joined once; nobody reads megabytes of workflow, so rendering stops
+        # after max_string_length characters
+        pieces: list[str] = []
+        length = 0
+        stack: list[Node | Chain | Chord | int | float | str] = [workflow]
+
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+                length += len(item)
+                if self.max_string_length is not None and (
+                    length > self.max_string_length
+                ):
+                    return "".join(pieces)[:self.max_string_length] + "..."
+                continue
+
+            if isinstance(item, (int, float)):
+                parts = [f"constant({item})"]
+            elif isinstance(item, Node):
+                parts = [f"Task({item.topic})"]
+            elif isinstance(item, Chain):
+                parts = self._separated(item.nodes, " | ")
+            elif isinstance(item, Chord):
+                parts = ["chord(group(", *self._separated(item.nodes, ", "), "), body="]
+                parts.extend((item.callback if item.callback else "None", ")"))
+            else:
+                parts = ["Unknown Workflow Object"]
+            stack.extend(reversed(parts))
+
+        return "".join(pieces)
+
+    @staticmethod
+    def _separated(items: list, separator: str) -> list:
+        separated = []
+        for item in items:
+            if separated:
+                separated.append(separator)
+            separated.append(item)
+        return separated
\ No newline at end of file
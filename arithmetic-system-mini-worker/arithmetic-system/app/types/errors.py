@@ -27,3 +27,23 @@ class UnsupportedOperatorError(ExpressionError):
         self.operator = operator
         self.message = message
         super().__init__(f"{message}: '{operator}'")
+
+
+class PreparedExpressionNotFoundError(ExpressionError):
+    def __init__(self, expression_id: str):
+        self.expression_id = expression_id
+        super().__init__(f"Unknown prepared expression: '{expression_id}'")
+
+
+class VariableBindingError(ExpressionError):
+    def __init__(self, variables: list[str], message: str):
+        self.variables = variables
+        self.message = message
+        super().__init__(f"{message}: {', '.join(variables)}")
+
+
+class WorkflowFailedError(Exception):
+    def __init__(self, error_type: str, message: str):
+        self.error_type = error_type
+        self.message = message
+        super().__init__(f"{error_type}: {message}")
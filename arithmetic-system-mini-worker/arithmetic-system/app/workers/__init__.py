@@ -9,6 +9,7 @@ from .add_wrapper_worker import AddWrapperWorker
 from .sub_wrapper_worker import SubWrapperWorker
 from .div_wrapper_worker import DivWrapperWorker
 from .mul_wrapper_worker import MulWrapperWorker
+from .notify_worker import NotifyWorker
 
 __all__ = [
     "AddWorker",
@@ -21,4 +22,5 @@ __all__ = [
     "SubWrapperWorker",
     "DivWrapperWorker",
     "MulWrapperWorker",
+    "NotifyWorker",
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 from ..models.worker_models import BinaryOperationInput, NumberOutput
+from .failure_notifier import notify_failure
 import logging
 from mini.worker.workers import Worker
 from ..config import BROKER, RESULT_BACKEND
@@ -19,6 +20,7 @@ class AddWorker(Worker[BinaryOperationInput, NumberOutput]):
 
     async def on_failure(self, input_obj: BinaryOperationInput, exc: Exception) -> None:
         logger.error(f"Task failed: {input_obj} with exception {exc}", exc_info=True)
+        await notify_failure(input_obj, exc)
 
     async def process(self, input_obj: BinaryOperationInput) -> NumberOutput:
         logger.info(f"Task started: {input_obj}")
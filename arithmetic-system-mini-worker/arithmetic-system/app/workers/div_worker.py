@@ -1,5 +1,6 @@
 from mini.worker.workers import Worker
 from ..models.worker_models import BinaryOperationInput, NumberOutput
+from .failure_notifier import notify_failure
 from ..config import BROKER, RESULT_BACKEND
 import asyncio
 from ..constants import DIV_TASKS_TOPIC
@@ -15,11 +16,11 @@ class DivWorker(Worker[BinaryOperationInput, NumberOutput]):
         pass
 
     async def on_failure(self, input_obj: BinaryOperationInput, exc: Exception) -> None:
-        pass
+        await notify_failure(input_obj, exc)
 
     async def process(self, input_obj: BinaryOperationInput) -> NumberOutput:
         if input_obj.y == 0:
-            raise ValueError("Division by zero")
+            raise ZeroDivisionError("Division by zero")
         result = input_obj.x / input_obj.y
         return NumberOutput(result=result)
 
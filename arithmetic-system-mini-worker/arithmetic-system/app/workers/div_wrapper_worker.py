@@ -1,5 +1,6 @@
 from mini.worker.workers import Worker
 from ..models.worker_models import ChainLinkInput, NumberOutput
+from .failure_notifier import notify_failure
 from ..config import BROKER, RESULT_BACKEND
 import asyncio
 from ..constants import DIV_TASKS_WRAPPER_TOPIC
@@ -20,7 +21,7 @@ class DivWrapperWorker(Worker[ChainLinkInput, NumberOutput]):
             divisor = input_obj.next_operand
 
         if divisor == 0:
-            raise ValueError("Division by zero")
+            raise ZeroDivisionError("Division by zero")
 
         result = dividend / divisor
 
@@ -34,6 +35,7 @@ class DivWrapperWorker(Worker[ChainLinkInput, NumberOutput]):
 
     async def on_failure(self, input_obj: ChainLinkInput, exc: Exception) -> None:
         logger.info(f"[DIV_WRAPPER] Failed: {exc}")
+        await notify_failure(input_obj, exc)
 
 if __name__ == "__main__":
     worker = DivWrapperWorker(
@@ -0,0 +1,32 @@
+import logging
+
+from redis import asyncio as aioredis
+
+from ..config import REDIS_URI
+from ..models.worker_models import FailureOutput
+
+logger = logging.getLogger(__name__)
+
+
+class FailureNotifier:
+    # Called from the workers' on_failure hooks: publishes the error on the
+    # request's result channel, so the orchestrator fails the request at once
+    # instead of waiting out its timeout
+    def __init__(self, redis_uri: str = REDIS_URI):
+        self.redis_uri = redis_uri
+        self._redis: aioredis.Redis | None = None
+
+    async def __call__(self, input_obj: object, exc: Exception) -> None:
+        channel = getattr(input_obj, "channel", None)
+        if channel is None:
+            return
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(self.redis_uri)
+        failure = FailureOutput(error_type=type(exc).__name__, error=str(exc))
+        try:
+            await self._redis.publish(channel, failure.model_dump_json())
+        except Exception as e:
+            logger.warning(f"Failed to publish the failure to {channel}: {str(e)}")
+
+
+notify_failure = FailureNotifier()
@@ -1,5 +1,6 @@
 from mini.worker.workers import Worker
 from ..models.worker_models import BinaryOperationInput, NumberOutput
+from .failure_notifier import notify_failure
 from ..config import BROKER, RESULT_BACKEND
 import asyncio
 from ..constants import MUL_TASKS_TOPIC
@@ -15,7 +16,7 @@ class MulWorker(Worker[BinaryOperationInput, NumberOutput]):
         pass
 
     async def on_failure(self, input_obj: BinaryOperationInput, exc: Exception) -> None:
-        pass
+        await notify_failure(input_obj, exc)
 
     async def process(self, input_obj: BinaryOperationInput) -> NumberOutput:
         result = input_obj.x * input_obj.y
@@ -0,0 +1,43 @@
+from mini.worker.workers import Worker
+from redis import asyncio as aioredis
+from ..models.worker_models import NotifyInput, NumberOutput
+from .failure_notifier import notify_failure
+from ..config import BROKER, RESULT_BACKEND, REDIS_URI
+import asyncio
+from ..constants import NOTIFY_TASKS_TOPIC
+import logging
+
+logger = logging.getLogger(__name__)
+
+class NotifyWorker(Worker[NotifyInput, NumberOutput]):
+    Input = NotifyInput
+    Output = NumberOutput
+
+    def __init__(self, *args, redis_uri: str = REDIS_URI, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.redis = aioredis.Redis.from_url(redis_uri)
+
+    async def process(self, input_obj: NotifyInput) -> NumberOutput:
+        # Terminal node of every workflow: pushes the final result to the
+        # orchestrator waiting on the channel and passes it through unchanged
+        output = NumberOutput(result=input_obj.result)
+        await self.redis.publish(input_obj.channel, output.model_dump_json())
+        return output
+
+    async def before_start(self, input_obj: NotifyInput) -> None:
+        logger.info(f"[NOTIFY] Starting: {input_obj}")
+
+    async def on_success(self, input_obj: NotifyInput, result: NumberOutput) -> None:
+        logger.info(f"[NOTIFY] Published {result.result} to {input_obj.channel}")
+
+    async def on_failure(self, input_obj: NotifyInput, exc: Exception) -> None:
+        logger.error(f"[NOTIFY] Failed: {exc}", exc_info=True)
+        await notify_failure(input_obj, exc)
+
+if __name__ == "__main__":
+    worker = NotifyWorker(
+        broker=BROKER,
+        topic=NOTIFY_TASKS_TOPIC,
+        result_backend=RESULT_BACKEND,
+    )
+    asyncio.run(worker.arun())
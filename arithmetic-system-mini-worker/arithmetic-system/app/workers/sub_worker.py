@@ -1,4 +1,5 @@
 from ..models.worker_models import BinaryOperationInput, NumberOutput
+from .failure_notifier import notify_failure
 from mini.worker.workers import Worker
 from ..config import BROKER, RESULT_BACKEND
 import asyncio
@@ -15,7 +16,7 @@ class SubWorker(Worker[BinaryOperationInput, NumberOutput]):
         pass
 
     async def on_failure(self, input_obj: BinaryOperationInput, exc: Exception) -> None:
-        pass
+        await notify_failure(input_obj, exc)
 
     async def process(self, input_obj: BinaryOperationInput) -> NumberOutput:
         result = input_obj.x - input_obj.y
@@ -1,5 +1,6 @@
 from mini.worker.workers import Worker
 from ..models.worker_models import ChainLinkInput, NumberOutput
+from .failure_notifier import notify_failure
 from ..config import BROKER, RESULT_BACKEND
 import asyncio
 from ..constants import SUB_TASKS_WRAPPER_TOPIC
@@ -26,6 +27,7 @@ class SubWrapperWorker(Worker[ChainLinkInput, NumberOutput]):
 
     async def on_failure(self, input_obj: ChainLinkInput, exc: Exception) -> None:
         logger.info(f"[SUB_WRAPPER] Failed: {exc}")
+        await notify_failure(input_obj, exc)
 
 if __name__ == "__main__":
     worker = SubWrapperWorker(
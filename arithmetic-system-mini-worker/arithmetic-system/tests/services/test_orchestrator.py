@@ -0,0 +1,270 @@
+import asyncio
+import json
+
+import pytest
+from mini.worker.workers.canvas import Chain, Chord, Node
+
+from app.services.orchestrator import WorkflowOrchestrator
+from app.types.errors import (
+    ExpressionSyntaxError,
+    PreparedExpressionNotFoundError,
+    VariableBindingError,
+)
+
+# Seven terms: the rebalancer turns the chain into an aggregate and a
+# subtraction, so repeating it is worth a stage of its own
+SHARED = "(1 - 2 - 3 - 4 - 5 - 6 - 7)"
+SHARED_VALUE = "shared((((((1 - 2) - 3) - 4) - 5) - 6) - 7 = -26)"
+
+
+def task_inputs(workflow: Chain | Chord) -> list[dict]:
+    # Set fields of every task; the channel is attached at dispatch
+    inputs = []
+    stack = [workflow]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Node):
+            if item.input is not None:
+                fields = json.loads(item.input)
+                inputs.append({k: v for k, v in fields.items() if v is not None})
+            continue
+        stack.extend(item.nodes)
+        if isinstance(item, Chord) and item.callback is not None:
+            stack.append(item.callback)
+    return inputs
+
+
+def make_orchestrator(mocker, result: int | float = 1.0, **options):
+    # The canvas never reaches a broker: dispatching a workflow answers with
+    # the given result, so these tests cover what the orchestrator sends
+    options = {
+        "result_push": False,
+        "result_cache": False,
+        "constant_folding": False,
+        **options,
+    }
+    orchestrator = WorkflowOrchestrator(**options)
+    mocker.patch.object(
+        orchestrator, "_dispatch", mocker.AsyncMock(return_value=result)
+    )
+    if orchestrator.result_cache is not None:
+        mocker.patch.object(orchestrator.result_cache, "_l2_client", return_value=None)
+    return orchestrator
+
+
+def test_identical_expressions_skip_the_parser(mocker):
+    orchestrator = make_orchestrator(mocker)
+    parse = mocker.spy(orchestrator.parser, "parse_compact")
+    first, first_workflow = orchestrator.compile("(1 + 2) * (3 - 4)")
+    second, second_workflow = orchestrator.compile("(1+2)*(3-4)")
+
+    assert second is first
+    assert parse.call_count == 1
+    # Mini canvases carry the id of one run, so every hit gets a fresh one
+    assert second_workflow is not first_workflow
+    assert task_inputs(second_workflow) == task_inputs(first_workflow)
+
+
+def test_reordered_operands_skip_the_builder(mocker):
+    orchestrator = make_orchestrator(mocker)
+    build = mocker.spy(orchestrator.builder, "build")
+    first, _ = orchestrator.compile("(1 + 2) * (3 - 4) * 5")
+    second, _ = orchestrator.compile("5 * (3 - 4) * (2 + 1)")
+
+    assert second is first
+    assert build.call_count == 1
+    assert orchestrator.metrics()["workflow_cache"]["hits"] == 1
+
+
+def test_folded_expressions_are_not_dispatched(mocker):
+    orchestrator = make_orchestrator(mocker, constant_folding=True)
+    response = asyncio.run(orchestrator.calculate("(1 + 2) * (3 - 4)"))
+
+    assert response.result == -3
+    assert response.workflow == "folded((1 + 2) * (3 - 4) = -3) -> constant(-3.0)"
+    orchestrator._dispatch.assert_not_called()
+
+
+def test_expressions_of_one_shape_reuse_a_template(mocker):
+    orchestrator = make_orchestrator(mocker)
+    asyncio.run(orchestrator.calculate("(1 + 2) * (3 - 4)"))
+    asyncio.run(orchestrator.calculate("(5 + 6) * (7 - 8)"))
+
+    first, second = (call.args[0] for call in orchestrator._dispatch.await_args_list)
+    assert task_inputs(first) == [{"x": 3, "y": 4}, {"x": 1, "y": 2}]
+    assert task_inputs(second) == [{"x": 7, "y": 8}, {"x": 5, "y": 6}]
+    templates = orchestrator.metrics()["workflow_templates"]
+    assert (templates["hits"], templates["misses"]) == (1, 1)
+    assert templates["hit_ratio"] == 0.5
+
+
+def test_repeated_expression_is_served_from_the_result_cache(mocker):
+    orchestrator = make_orchestrator(mocker, result=-33, result_cache=True)
+    first = asyncio.run(orchestrator.calculate("(1 + 2) * (3 - 4) * 11"))
+    second = asyncio.run(orchestrator.calculate("11 * (3 - 4) * (2 + 1)"))
+
+    assert first.cached is False
+    assert second.cached is True
+    assert second.result == first.result == -33
+    orchestrator._dispatch.assert_awaited_once()
+    stats = orchestrator.metrics()["result_cache"]
+    assert stats["l1"]["hits"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_batch_dispatches_each_distinct_workflow_once(mocker):
+    orchestrator = make_orchestrator(mocker)
+    run_chord = mocker.patch.object(
+        orchestrator,
+        "_run_chord",
+        side_effect=lambda workflows, *args: [
+            float(index) for index in range(len(workflows))
+        ],
+    )
+    outcomes, batch_string = asyncio.run(
+        orchestrator.calculate_batch(
+            ["(1 + 2) * (3 - 4)", "(4 - 3) * 7", "(3 - 4) * (2 + 1)", "1 +"]
+        )
+    )
+
+    run_chord.assert_called_once()
+    assert len(run_chord.call_args.args[0]) == 2
+    assert batch_string == "chord(2 workflows, body=None)"
+    assert [outcome.result for outcome in outcomes[:3]] == [0.0, 1.0, 0.0]
+    assert isinstance(outcomes[3], ExpressionSyntaxError)
+    orchestrator._dispatch.assert_not_called()
+
+
+def test_batch_evaluates_subtrees_shared_across_expressions_first(mocker):
+    orchestrator = make_orchestrator(mocker)
+    stages = []
+
+    async def run_chord(workflows, *args):
+        stages.append(workflows)
+        return [-26] if len(stages) == 1 else [1.0, 2.0]
+
+    mocker.patch.object(orchestrator, "_run_chord", side_effect=run_chord)
+    outcomes, batch_string = asyncio.run(
+        orchestrator.calculate_batch([f"{SHARED} * 2", f"{SHARED} / 3"])
+    )
+
+    assert len(stages) == 2
+    assert batch_string.startswith("chord(1 shared subtrees, body=None) -> ")
+    for workflow in stages[1]:
+        assert any(-26 in fields.values() for fields in task_inputs(workflow))
+    assert outcomes[0].workflow == f"{SHARED_VALUE} -> Task(mul_tasks)"
+    assert [outcome.result for outcome in outcomes] == [1.0, 2.0]
+
+
+def test_stream_bounds_the_workflows_in_flight(mocker):
+    orchestrator = make_orchestrator(mocker)
+    running = peak = 0
+
+    async def dispatch(workflow):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (task_inputs(workflow)[0]["x"] % 3))
+        running -= 1
+        return 1.0
+
+    orchestrator._dispatch.side_effect = dispatch
+
+    async def expressions():
+        for i in range(30):
+            yield f"({i} - 1) * (2 - {i})" if i != 7 else "(1 +"
+
+    async def collect():
+        return [
+            outcome
+            async for outcome in orchestrator.calculate_stream(
+                expressions(), max_in_flight=4
+            )
+        ]
+
+    outcomes = asyncio.run(collect())
+    assert peak <= 4
+    assert sorted(index for index, _, _ in outcomes) == list(range(30))
+    failed = [index for index, _, outcome in outcomes if isinstance(outcome, Exception)]
+    assert failed == [7]
+
+
+def test_repeated_subtrees_are_evaluated_once_before_the_rest(mocker):
+    orchestrator = make_orchestrator(mocker)
+    run_chord = mocker.patch.object(orchestrator, "_run_chord", return_value=[-26])
+    expression = f"{SHARED} / 3 - {SHARED} / 4"
+
+    compiled, _ = orchestrator.compile(expression)
+    assert len(compiled.shared_subtrees) == 1
+    assert compiled.shared_stage_two is not None
+
+    build = mocker.spy(orchestrator.builder, "build")
+    prepare = mocker.spy(orchestrator.builder, "prepare")
+    responses = [asyncio.run(orchestrator.calculate(expression)) for _ in range(2)]
+
+    # Stage two was prepared with the compiled expression; requests only bind
+    build.assert_not_called()
+    prepare.assert_not_called()
+    assert run_chord.call_count == 2
+    assert task_inputs(run_chord.call_args.args[0][0]) != []
+    assert responses[0].workflow.startswith(f"cse(7 -> 5 tasks) -> {SHARED_VALUE} -> ")
+    stage_two = orchestrator._dispatch.await_args.args[0]
+    assert sum(
+        -26 in fields.values() for fields in task_inputs(stage_two)
+    ) == 2
+
+
+def test_failed_stage_one_fails_the_request(mocker):
+    orchestrator = make_orchestrator(mocker)
+    mocker.patch.object(
+        orchestrator, "_run_chord", return_value=[ZeroDivisionError("Division by zero")]
+    )
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(orchestrator.calculate(f"{SHARED} / 3 - {SHARED} / 4"))
+    orchestrator._dispatch.assert_not_called()
+
+
+def test_stage_one_must_save_more_than_its_hops_cost(mocker):
+    orchestrator = make_orchestrator(mocker)
+    run_chord = mocker.patch.object(orchestrator, "_run_chord")
+    compiled, _ = orchestrator.compile("(1 - 2 - 3) / 3 - (1 - 2 - 3) / 4")
+
+    assert compiled.shared_subtrees == []
+    asyncio.run(orchestrator.calculate("(1 - 2 - 3) / 3 - (1 - 2 - 3) / 4"))
+    run_chord.assert_not_called()
+    orchestrator._dispatch.assert_awaited_once()
+
+
+def test_prepared_expressions_only_bind_values(mocker):
+    orchestrator = make_orchestrator(mocker)
+    parse = mocker.spy(orchestrator.parser, "parse_prepared")
+    prepared = orchestrator.prepare("x * (y - 1) + x")
+    assert orchestrator.prepare("x*(y-1)+x") is prepared
+
+    build = mocker.spy(orchestrator.builder, "_build_workflow")
+    for x, y in ((2, 5), (3, 7)):
+        asyncio.run(orchestrator.execute(prepared.expression_id, {"x": x, "y": y}))
+
+    parse.assert_called_once()
+    build.assert_not_called()
+    first, second = (call.args[0] for call in orchestrator._dispatch.await_args_list)
+    assert {"x": 5, "y": 1} in task_inputs(first)
+    assert {"x": 7, "y": 1} in task_inputs(second)
+
+
+def test_execute_rejects_unknown_expressions_and_bad_values(mocker):
+    orchestrator = make_orchestrator(mocker)
+    prepared = orchestrator.prepare("x * (y - 1)")
+
+    with pytest.raises(PreparedExpressionNotFoundError):
+        asyncio.run(orchestrator.execute("missing", {"x": 1, "y": 2}))
+    with pytest.raises(VariableBindingError) as missing:
+        asyncio.run(orchestrator.execute(prepared.expression_id, {"x": 1}))
+    with pytest.raises(VariableBindingError) as unknown:
+        asyncio.run(
+            orchestrator.execute(prepared.expression_id, {"x": 1, "y": 2, "z": 3})
+        )
+
+    assert missing.value.variables == ["y"]
+    assert unknown.value.variables == ["z"]
+    orchestrator._dispatch.assert_not_called()
@@ -0,0 +1,197 @@
+import asyncio
+import json
+
+import pytest
+from mini.worker.workers.canvas import Chain, Chord, Node
+
+from app.models.worker_models import BinaryOperationInput, FailureOutput, NumberOutput
+from app.services.orchestrator import WorkflowOrchestrator
+from app.services.result_waiter import PollingResultWaiter, PubSubResultWaiter
+from app.types.errors import WorkflowFailedError
+from app.workers.failure_notifier import FailureNotifier
+
+PREFIX = "workflow-result:"
+
+
+def publish(queue: asyncio.Queue, key: str, payload: str) -> None:
+    queue.put_nowait(
+        {
+            "type": "pmessage",
+            "pattern": f"{PREFIX}*".encode(),
+            "channel": f"{PREFIX}{key}".encode(),
+            "data": payload.encode(),
+        }
+    )
+
+
+def fake_pubsub_waiter(mocker) -> tuple[PubSubResultWaiter, asyncio.Queue]:
+    waiter = PubSubResultWaiter("redis://localhost:6379/0", PREFIX)
+    queue = asyncio.Queue()
+
+    async def get_message(timeout):
+        return await queue.get()
+
+    waiter._loop = asyncio.get_running_loop()
+    waiter._client = mocker.AsyncMock()
+    waiter._pubsub = mocker.AsyncMock()
+    waiter._pubsub.get_message.side_effect = get_message
+    return waiter, queue
+
+
+def test_results_are_pushed_as_floats_over_one_pattern_subscription(mocker):
+    async def run():
+        waiter, queue = fake_pubsub_waiter(mocker)
+        await waiter.register("a")
+        await waiter.register("b")
+        publish(queue, "b", NumberOutput(result=4).model_dump_json())
+        publish(queue, "a", NumberOutput(result=3).model_dump_json())
+        results = [await waiter.wait("a", 1.0), await waiter.wait("b", 1.0)]
+
+        waiter._pubsub.psubscribe.assert_awaited_once_with(f"{PREFIX}*")
+        waiter._pubsub.subscribe.assert_not_called()
+        waiter._pubsub.unsubscribe.assert_not_called()
+        assert waiter.in_flight == 0
+        await waiter.close()
+        return results
+
+    results = asyncio.run(run())
+    assert results == [3.0, 4.0]
+    assert all(type(result) is float for result in results)
+
+
+def test_published_failures_fail_the_request(mocker):
+    async def run():
+        waiter, queue = fake_pubsub_waiter(mocker)
+        await waiter.register("div")
+        await waiter.register("other")
+        publish(queue, "div", FailureOutput(
+            error_type="ZeroDivisionError", error="Division by zero"
+        ).model_dump_json())
+        publish(queue, "other", FailureOutput(
+            error_type="ValidationError", error="bad input"
+        ).model_dump_json())
+        outcomes = []
+        for key in ("div", "other"):
+            try:
+                await waiter.wait(key, 1.0)
+            except Exception as e:
+                outcomes.append(e)
+        await waiter.close()
+        return outcomes
+
+    division, other = asyncio.run(run())
+    assert isinstance(division, ZeroDivisionError)
+    assert str(division) == "Division by zero"
+    assert isinstance(other, WorkflowFailedError)
+    assert other.error_type == "ValidationError"
+
+
+def test_messages_for_unknown_channels_are_dropped(mocker):
+    async def run():
+        waiter, queue = fake_pubsub_waiter(mocker)
+        await waiter.register("a")
+        await waiter.cancel("a")
+        publish(queue, "a", NumberOutput(result=1).model_dump_json())
+        await waiter.register("b")
+        with pytest.raises(TimeoutError, match="Workflow b timed out"):
+            await waiter.wait("b", 0.05)
+        assert waiter.in_flight == 0
+        await waiter.close()
+
+    asyncio.run(run())
+
+
+def test_failed_subscription_fails_waiters_and_closes_the_connection(mocker):
+    async def run():
+        waiter, _ = fake_pubsub_waiter(mocker)
+        pubsub, client = waiter._pubsub, waiter._client
+        pubsub.get_message.side_effect = ConnectionError("connection lost")
+        await waiter.register("a")
+        with pytest.raises(ConnectionError):
+            await waiter.wait("a", 1.0)
+        pubsub.aclose.assert_awaited_once()
+        client.aclose.assert_awaited_once()
+        assert waiter._loop is None
+
+    asyncio.run(run())
+
+
+class FakeResultNode:
+    def __init__(self, result_obj):
+        self.result_obj = result_obj
+        self.result = json.dumps(result_obj)
+
+
+def test_polling_waiter_resolves_every_pending_workflow(mocker):
+    backend = mocker.AsyncMock()
+    stored = {"a": None, "b": FakeResultNode({"result": 7})}
+
+    async def get_result(key):
+        if key == "broken":
+            raise ConnectionError("backend down")
+        return stored[key]
+
+    backend.get_result.side_effect = get_result
+
+    async def run():
+        waiter = PollingResultWaiter(backend, interval_seconds=0.01)
+        for key in ("a", "b", "broken"):
+            await waiter.register(key)
+        b = await waiter.wait("b", 1.0)
+        with pytest.raises(ConnectionError):
+            await waiter.wait("broken", 1.0)
+        stored["a"] = FakeResultNode(2.5)
+        a = await waiter.wait("a", 1.0)
+        await waiter.close()
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert (a, b) == (2.5, 7.0)
+    assert type(b) is float
+
+
+def test_polling_waiter_times_out():
+    class EmptyBackend:
+        async def get_result(self, key):
+            return None
+
+    async def run():
+        waiter = PollingResultWaiter(EmptyBackend(), interval_seconds=0.01)
+        await waiter.register("slow")
+        with pytest.raises(TimeoutError, match="Workflow slow timed out"):
+            await waiter.wait("slow", 0.05)
+        await waiter.close()
+
+    asyncio.run(run())
+
+
+def test_every_node_carries_the_result_channel():
+    orchestrator = WorkflowOrchestrator()
+    leaf = Node(
+        topic="add_tasks", input=BinaryOperationInput(x=1, y=2).model_dump_json()
+    )
+    callback = Node(topic="mul_tasks")
+    workflow = Chain(nodes=[Chord(nodes=[leaf], callback=callback)])
+
+    notified = orchestrator._with_notification(workflow, "key")
+
+    channel = orchestrator.result_waiter.channel_for("key")
+    assert json.loads(leaf.input) == {"channel": channel, "x": 1, "y": 2}
+    assert json.loads(callback.input) == {"channel": channel}
+    assert json.loads(notified.nodes[-1].input)["channel"] == channel
+
+
+def test_failure_notifier_publishes_on_the_input_channel(mocker):
+    notifier = FailureNotifier()
+    notifier._redis = mocker.AsyncMock()
+
+    async def run():
+        error = ZeroDivisionError("Division by zero")
+        await notifier(BinaryOperationInput(x=1, y=0, channel="c"), error)
+        await notifier(BinaryOperationInput(x=1, y=0), error)
+
+    asyncio.run(run())
+    notifier._redis.publish.assert_awaited_once()
+    channel, payload = notifier._redis.publish.await_args.args
+    assert channel == "c"
+    assert FailureOutput.model_validate_json(payload).error_type == "ZeroDivisionError"
@@ -0,0 +1,132 @@
+import base64
+import json
+
+import pytest
+from mini.worker.workers.canvas import Chain, Chord, Node
+
+from app.models.worker_models import (
+    AggregateInput,
+    BinaryOperationInput,
+    NumberOutput,
+    pack_numbers,
+    unpack_numbers,
+)
+from app.services.cache import LRUCache
+from app.services.expression_parser import ExpressionParser
+from app.services.workflow_builder import WorkflowBuilder
+
+
+@pytest.mark.parametrize(
+    "values, tag",
+    [
+        ([1, -128, 127], "b"),
+        ([1, -129, 32767], "h"),
+        ([1, 2**31 - 1, -(2**31)], "i"),
+        ([1, 2**63 - 1, -(2**63)], "q"),
+        ([0.5, -1.25, 1e300, float("inf")], "d"),
+        ([1, 0.5, -3, 2**53], "m"),
+    ],
+)
+def test_packed_numbers_round_trip(values, tag):
+    packed = pack_numbers(values)
+    unpacked = unpack_numbers(packed)
+
+    assert base64.b64decode(packed)[:1].decode() == tag
+    assert unpacked == values
+    assert [type(value) for value in unpacked] == [type(value) for value in values]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [],
+        [True, 1, 2],
+        [1, 2**63],
+        [0.5, 2**53 + 1],
+        [1, "2"],
+    ],
+)
+def test_values_a_buffer_cannot_hold_are_not_packed(values):
+    assert pack_numbers(values) is None
+
+
+def test_numbers_prefers_values_then_packed_then_children():
+    packed = pack_numbers([4, 5])
+    assert AggregateInput(values=[1], packed_values=packed).numbers == [1]
+    assert AggregateInput(
+        packed_values=packed, children_result=[{"result": 6}]
+    ).numbers == [4, 5]
+    assert AggregateInput(
+        children_result=[{"result": 6}, NumberOutput(result=7), 8]
+    ).numbers == [6, 7, 8]
+    with pytest.raises(ValueError, match="must be provided"):
+        AggregateInput().numbers
+
+
+def node_inputs(workflow: Chain | Chord) -> list[str | None]:
+    inputs = []
+    stack = [workflow]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Node):
+            inputs.append(item.input)
+            continue
+        stack.extend(item.nodes)
+        if isinstance(item, Chord) and item.callback is not None:
+            stack.append(item.callback)
+    return inputs
+
+
+def test_templated_builds_repack_the_bound_constants():
+    parser = ExpressionParser()
+    templated = WorkflowBuilder(
+        max_fan_in=1024, templates=LRUCache(16), packed_min_values=4
+    )
+    plain = WorkflowBuilder(max_fan_in=1024, packed_min_values=4)
+    expressions = [
+        "(1 - 2) + 3 + 4 + 5 + 6",
+        "(7 - 8) + 0.5 + 10 + 11 + 12",
+        f"(7 - 8) + {2**64} + 10 + 11 + 12",
+    ]
+
+    packed = []
+    for expression in expressions:
+        tree = parser.parse(expression)
+        inputs = node_inputs(templated.build_workflow(tree))
+        assert inputs == node_inputs(plain.build_workflow(tree))
+        packed.extend(
+            json.loads(task_input)["packed_values"]
+            for task_input in inputs
+            if task_input is not None and "packed_values" in task_input
+        )
+
+    assert templated.templates.stats()["hits"] == 2
+    # The builder passes constants on as floats
+    assert [unpack_numbers(values) for values in packed] == [
+        [3.0, 4.0, 5.0, 6.0],
+        [0.5, 10.0, 11.0, 12.0],
+        [float(2**64), 10.0, 11.0, 12.0],
+    ]
+
+
+def test_template_parameters_are_recorded_by_field_and_position():
+    binary = BinaryOperationInput(x=0, y=1.0).model_dump_json()
+    model, _, parameters = WorkflowBuilder._input_template("sub_tasks", binary)
+    assert model is BinaryOperationInput
+    assert parameters == [("x", None, 0, False), ("y", None, 1, True)]
+
+    aggregate = AggregateInput(packed_values=pack_numbers([2.0, 3.0, 4.0]))
+    _, fields, parameters = WorkflowBuilder._input_template(
+        "xsum_tasks", aggregate.model_dump_json()
+    )
+    assert fields["packed_values"] == [2.0, 3.0, 4.0]
+    assert parameters == [
+        ("packed_values", 0, 2, True),
+        ("packed_values", 1, 3, True),
+        ("packed_values", 2, 4, True),
+    ]
+
+    steps = [(Node, "xsum_tasks", (AggregateInput, fields, parameters))]
+    node = WorkflowBuilder._instantiate(steps, [0, 0, 1, 2**64, 3])
+    packed = json.loads(node.input)["packed_values"]
+    assert unpack_numbers(packed) == [1.0, float(2**64), 3.0]
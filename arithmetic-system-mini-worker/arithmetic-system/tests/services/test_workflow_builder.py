@@ -0,0 +1,148 @@
+import json
+
+import pytest
+from mini.worker.workers.canvas import Chain, Chord, Node
+
+from app.services.cache import LRUCache
+from app.services.constant_folder import ConstantFolder
+from app.services.expression_parser import ExpressionParser
+from app.services.workflow_builder import WorkflowBuilder
+
+parser = ExpressionParser()
+
+
+def nodes(workflow: Chain | Chord) -> list[Node]:
+    found = []
+    stack = [workflow]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Node):
+            found.append(item)
+            continue
+        stack.extend(reversed(item.nodes))
+        if isinstance(item, Chord) and item.callback is not None:
+            stack.append(item.callback)
+    return found
+
+
+def task_inputs(workflow: Chain | Chord) -> list[dict]:
+    # Set fields only; the channel is attached at dispatch
+    return [
+        {
+            key: value
+            for key, value in json.loads(node.input).items()
+            if value is not None
+        }
+        for node in nodes(workflow)
+        if node.input is not None
+    ]
+
+
+def widest_chord(workflow: Node | Chain | Chord) -> int:
+    if isinstance(workflow, Node):
+        return 0
+    widest = max(widest_chord(item) for item in workflow.nodes)
+    if isinstance(workflow, Chord):
+        widest = max(widest, len(workflow.nodes))
+        if workflow.callback is not None:
+            widest = max(widest, widest_chord(workflow.callback))
+    return widest
+
+
+@pytest.mark.parametrize(
+    "expression, workflow_str, tasks, hops",
+    [
+        ("1", "constant(1.0)", 0, 0),
+        ("1 + 2", "Task(add_tasks)", 1, 1),
+        ("(1 + 2) * 3", "Task(add_tasks) | Task(mul_tasks_wrapper)", 2, 2),
+        (
+            "(1 + 2) * (3 - 4)",
+            "chord(group(Task(add_tasks), Task(sub_tasks)), body=Task(xprod_tasks))",
+            3,
+            2,
+        ),
+        ("1 + 2 + 3 + 4", "Task(xsum_tasks)", 1, 1),
+        ("10 / (2 - 3)", "Task(sub_tasks) | Task(div_tasks_wrapper)", 2, 2),
+    ],
+)
+def test_workflow_shapes(expression, workflow_str, tasks, hops):
+    builder = WorkflowBuilder(max_fan_in=1024)
+    workflow, built_str = builder.build(parser.parse(expression))
+    assert built_str == workflow_str
+    assert builder.task_count(workflow) == tasks
+    assert builder.critical_path_hops(workflow) == hops
+
+
+def test_chain_links_carry_the_fixed_operand():
+    builder = WorkflowBuilder(max_fan_in=1024)
+    workflow, _ = builder.build(parser.parse("10 / (2 - 3)"))
+    assert task_inputs(workflow) == [
+        {"x": 2, "y": 3},
+        {"is_left_fixed": True, "next_operand": 10.0},
+    ]
+
+
+def test_wide_runs_are_split_to_the_fan_in():
+    terms = " + ".join(f"({i} - 1)" for i in range(2, 12))
+    builder = WorkflowBuilder(max_fan_in=2)
+    workflow, _ = builder.build(parser.parse(terms))
+    assert widest_chord(workflow) <= 2
+    assert builder.task_count(workflow) > 10
+
+
+def test_cheap_subtrees_are_folded():
+    builder = WorkflowBuilder(ConstantFolder(16, 4), max_fan_in=1024)
+    assert builder.build(parser.parse("(1 + 2) * (3 - 4)")) == (
+        -3.0,
+        "folded((1 + 2) * (3 - 4) = -3) -> constant(-3.0)",
+    )
+
+
+def test_prepared_workflows_bind_values_without_a_rebuild(mocker):
+    builder = WorkflowBuilder(max_fan_in=1024)
+    tree, variables = parser.parse_prepared("x * (y - 1) + x")
+    prepared = builder.prepare(tree)
+    build = mocker.spy(builder, "_build_workflow")
+
+    inputs = []
+    for x, y in ((2, 5), (3, 7)):
+        workflow, workflow_str = builder.bind(prepared, [x, y])
+        assert builder._workflow_to_string(workflow) in workflow_str
+        inputs.append(task_inputs(workflow))
+
+    assert variables == ["x", "y"]
+    build.assert_not_called()
+    assert inputs == [
+        [
+            {"x": 5, "y": 1},
+            {"is_left_fixed": False, "next_operand": 2.0},
+            {"is_left_fixed": False, "next_operand": 2.0},
+        ],
+        [
+            {"x": 7, "y": 1},
+            {"is_left_fixed": False, "next_operand": 3.0},
+            {"is_left_fixed": False, "next_operand": 3.0},
+        ],
+    ]
+
+
+def test_reordered_operands_share_a_canonical_key():
+    builder = WorkflowBuilder(max_fan_in=1024)
+    first = builder.canonical_key(parser.parse_compact("(1 + 2) * (3 - 4)"))
+    second = builder.canonical_key(parser.parse_compact("(3 - 4) * (2 + 1)"))
+    third = builder.canonical_key(parser.parse_compact("(4 - 3) * (2 + 1)"))
+    assert first == second
+    assert first != third
+
+
+def test_templates_are_shared_by_expressions_of_one_shape():
+    builder = WorkflowBuilder(max_fan_in=1024, templates=LRUCache(16))
+    first, _ = builder.build(parser.parse("(1 + 2) * (3 - 4)"))
+    second, second_str = builder.build(parser.parse("(5 + 6) * (7 - 8)"))
+
+    assert builder.templates.stats()["hits"] == 1
+    assert second_str == (
+        "chord(group(Task(add_tasks), Task(sub_tasks)), body=Task(xprod_tasks))"
+    )
+    assert task_inputs(first) == [{"x": 1, "y": 2}, {"x": 3, "y": 4}]
+    assert task_inputs(second) == [{"x": 5, "y": 6}, {"x": 7, "y": 8}]